@@ -36,19 +36,31 @@ rtsp_servers: Dict[str, Any] = {}
 # Store RTSP server processes
 rtsp_servers = {}
 
-# Cleanup function to stop all RTSP servers on exit
+# Last-resort cleanup of RTSP servers and live channels at exit (a drain normally stops them first)
 def cleanup():
     from services.video_converter import rtsp_servers as rtsp_servers_dict
-    for stream_id, process in list(rtsp_servers_dict.items()):
+    from services.live_store import live_channels
+    processes = [(f"RTSP server {stream_id}", process) for stream_id, process in list(rtsp_servers_dict.items())]
+    processes += [(f"live channel {channel_id}", channel.process) for channel_id, channel in list(live_channels.items())]
+    procs = []
+    for name, process in processes:
         try:
             if process and process.returncode is None:
                 parent = psutil.Process(process.pid)
-                for child in parent.children(recursive=True):
-                    child.terminate()
-                parent.terminate()
-                process.wait()
+                for proc in parent.children(recursive=True) + [parent]:
+                    proc.terminate()
+                    procs.append(proc)
+        except psutil.NoSuchProcess:
+            pass
         except Exception as e:
-            print(f"Error stopping RTSP server {stream_id}: {e}")
+            print(f"Error stopping {name}: {e}")
+    # The event loop is gone by now, so wait through psutil rather than the asyncio process objects
+    _, alive = psutil.wait_procs(procs, timeout=5)
+    for proc in alive:
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            pass
 
 # Register cleanup function
 atexit.register(cleanup)
@@ -62,9 +74,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Edge cache mode: proxy segments and manifests from an origin instance
+from services.edge_cache import EDGE_ORIGIN_URL, install_edge_cache
+if EDGE_ORIGIN_URL:
+    install_edge_cache(app, EDGE_ORIGIN_URL)
+
+# Stamp upload requests on arrival for the per-task stage timeline
+from services.tracing import RequestTimingMiddleware
+app.add_middleware(RequestTimingMiddleware)
+
+# Rate limiting and fair-share pacing for segment delivery and uploads (outermost; opt-in)
+from services.rate_limit import RATE_LIMIT_ENABLED, RateLimitMiddleware, _client_id
+from services.segment_prefetch import is_segment, resolve_under, segment_prefetcher
+from services.storage import serve_from_storage, storage
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 # Serve static files with proper MIME types
 class CustomStaticFiles(StaticFiles):
     async def get_response(self, path: str, scope):
+        # Anything resolving outside the static directory is left to StaticFiles, which rejects it
+        file_path = resolve_under(self.directory, path)
+        if file_path is None:
+            return await super().get_response(path, scope)
+        # Output published to object storage is redirected to or read from the bucket
+        if path.startswith('output/'):
+            remote = await serve_from_storage(file_path)
+            if remote is not None:
+                return remote
+        # Segments are served from the read-ahead cache when a prefetch got there first
+        if segment_prefetcher.enabled and is_segment(path) and scope['method'] == 'GET' \
+                and not any(name == b'range' for name, _ in scope.get('headers', [])):
+            segment_prefetcher.on_segment_request(_client_id(scope), file_path)
+            data = await segment_prefetcher.lookup(file_path)
+            if data is not None:
+                media_type = 'video/MP2T' if path.endswith('.ts') else 'video/iso.segment'
+                return Response(content=data, media_type=media_type, headers={'Access-Control-Allow-Origin': '*'})
         response = await super().get_response(path, scope)
         if path.endswith('.m3u8'):
             response.headers['Content-Type'] = 'application/vnd.apple.mpegurl'
@@ -78,11 +123,14 @@ class CustomStaticFiles(StaticFiles):
 app.mount("/static", CustomStaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-# Store chunk information for each task
-chunk_storage = {}
+# Segment counts per task, for the most recently streamed tasks
+from services.task_store import BoundedDict, TaskStore
+CHUNK_STORAGE_LIMIT = int(os.environ.get("CHUNK_STORAGE_LIMIT", "1000"))
+chunk_storage = BoundedDict(CHUNK_STORAGE_LIMIT)
 
-# Store conversion tasks
-conversion_tasks = {}
+# Store conversion tasks (dict-like, with status / creation-time indexes; finished tasks spill to disk)
+conversion_tasks = TaskStore()
+bulk_importer = None
 
 # Ensure upload directory exists
 UPLOAD_DIR = "uploads"
@@ -93,17 +141,96 @@ Path(OUTPUT_DIR).mkdir(exist_ok=True, parents=True)
 # Add health check endpoint
 @app.get("/health", status_code=200)
 async def health_check():
+    from services.drain import drain_controller
+    # Fail readiness while draining so load balancers stop sending new jobs here
+    if drain_controller.draining:
+        return JSONResponse(status_code=503, content={"status": drain_controller.state})
     return {"status": "healthy"}
 
+# Start the event-loop lag monitor with the server
+@app.on_event("startup")
+async def start_loop_monitor():
+    from services.loop_monitor import loop_monitor
+    loop_monitor.start()
+
+# Move finished tasks past the hot limit to the spill file in the background
+@app.on_event("startup")
+async def start_task_spilling():
+    conversion_tasks.start_spilling()
+
+# Keep the API on its reserved cores, away from ffmpeg jobs
+@app.on_event("startup")
+async def pin_api_cores():
+    from services.cpu_allocator import cpu_allocator
+    cpu_allocator.pin_api_process()
+
+# Pick up conversions interrupted by a crash or restart
+@app.on_event("startup")
+async def resume_interrupted_conversions():
+    from services.video_converter import resume_interrupted_tasks
+    resume_interrupted_tasks(conversion_tasks, OUTPUT_DIR, RTSP_PORT)
+
+# Register files converted by the bulk ingest CLI (journal in the output directory) as tasks
+@app.on_event("startup")
+async def import_bulk_results():
+    from services.bulk_ingest import JOURNAL_NAME, BulkResultImporter
+    global bulk_importer
+    bulk_importer = BulkResultImporter(os.environ.get("BULK_JOURNAL") or os.path.join(OUTPUT_DIR, JOURNAL_NAME))
+    await bulk_importer.import_once(conversion_tasks)
+    bulk_importer.start(conversion_tasks)
+
+# Drain on SIGUSR2 (e.g. a pre-stop hook) without exiting; a new process starts serving
+@app.on_event("startup")
+async def install_drain_signal():
+    from services.drain import drain_controller
+    drain_controller.reset()
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR2, lambda: drain_controller.start(conversion_tasks, 'signal'))
+    except (NotImplementedError, AttributeError, RuntimeError, ValueError):
+        # No signal support on this platform / loop
+        pass
+
+# On SIGTERM/SIGINT the server stops accepting connections, then drains before exiting
+@app.on_event("shutdown")
+async def drain_jobs():
+    from services.drain import drain_controller
+    await drain_controller.start(conversion_tasks, 'shutdown')
+
+@app.on_event("shutdown")
+async def stop_bulk_import():
+    if bulk_importer is not None:
+        await bulk_importer.stop()
+
+@app.on_event("shutdown")
+async def stop_task_spilling():
+    await conversion_tasks.stop_spilling()
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    from services.loop_monitor import loop_monitor
+    from services import blocking_io
+    await loop_monitor.stop()
+    blocking_io.shutdown()
+    storage.close()
+
 # Import all route handlers
 from routes.upload import router as upload_router
 from routes.tasks import router as tasks_router
 from routes.streaming import router as streaming_router
+from routes.monitoring import router as monitoring_router
+from routes.live import router as live_router
+from routes.clips import router as clips_router
+from routes.admin import router as admin_router
 
 # Include all routers with their prefixes
 app.include_router(upload_router, prefix="/api/v1", tags=["upload"])
 app.include_router(tasks_router, prefix="/api/v1", tags=["tasks"])
 app.include_router(streaming_router, prefix="/api/v1", tags=["streaming"])
+app.include_router(monitoring_router, prefix="/api/v1", tags=["monitoring"])
+app.include_router(live_router, prefix="/api/v1", tags=["live"])
+app.include_router(clips_router, prefix="/api/v1", tags=["clips"])
+app.include_router(admin_router, prefix="/api/v1", tags=["admin"])
 
 # Add root endpoint
 @app.get("/", response_class=HTMLResponse)
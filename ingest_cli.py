@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Bulk ingest CLI.
+
+Converts video files that are already on this host without uploading or
+copying them, on a pool of worker processes, with the same converter settings
+as the upload API. Progress is journaled, so a stopped migration picks up
+where it left off when the same command is run again.
+
+Example:
+    python ingest_cli.py run /mnt/archive --workers 4
+    python ingest_cli.py watch /mnt/dropbox --protocol dash --interval 10
+    python ingest_cli.py status
+"""
+import sys
+import signal
+import argparse
+import threading
+
+from services.bulk_ingest import BulkIngest, IngestJournal, JOURNAL_NAME
+from services.encoding_profiles import ENCODING_PROFILES
+from services.job_control import PRIORITIES
+
+# Same output root as the API, so converted files are served from /static/output
+OUTPUT_DIR = "static/output"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert local video files in place on a process pool")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="Root directory for converted output")
+    parser.add_argument("--journal", help=f"Progress journal (default: <output-dir>/{JOURNAL_NAME})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Convert every video under the given files/directories")
+    run.add_argument("paths", nargs="+")
+    watch = commands.add_parser("watch", help="Convert files as they appear in a folder")
+    watch.add_argument("folder")
+    watch.add_argument("--interval", type=float, default=5.0, help="Seconds between folder scans")
+    for command in (run, watch):
+        command.add_argument("--workers", type=int, help="Conversion processes (default: half the CPU cores)")
+        command.add_argument("--media-format", default="hls", choices=("hls", "ts", "cmaf", "dash"))
+        command.add_argument("--protocol", default="hls", choices=("hls", "dash"))
+        command.add_argument("--segment-duration", type=int, default=6)
+        command.add_argument("--crf", type=int, default=20)
+        command.add_argument("--resolution", default="source", choices=("source", "360p", "720p", "1080p"))
+        command.add_argument("--profile", choices=sorted(ENCODING_PROFILES), help="Chosen per file when omitted")
+        command.add_argument("--deadline", type=int, help="Seconds allowed per file when choosing a profile")
+        command.add_argument("--priority", default="low", choices=PRIORITIES)
+        command.add_argument("--retry-failed", action="store_true", help="Convert files that failed before again")
+
+    commands.add_parser("status", help="Summarize the progress journal")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    journal_path = args.journal or f"{args.output_dir}/{JOURNAL_NAME}"
+    if args.command == "status":
+        journal = IngestJournal(journal_path)
+        for state, count in sorted(journal.counts().items()):
+            print(f"{state:>10}: {count}")
+        journal.close()
+        return 0
+
+    settings = {
+        'media_format': args.media_format,
+        'streaming_protocol': args.protocol,
+        'segment_duration': args.segment_duration,
+        'crf': args.crf,
+        'resolution': args.resolution,
+        'profile': args.profile,
+        'deadline': args.deadline,
+        'priority': args.priority,
+    }
+    ingest = BulkIngest(args.output_dir, settings, journal_path, args.workers, args.retry_failed)
+    try:
+        if args.command == "run":
+            results = ingest.run(args.paths)
+        else:
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            print(f"Watching {args.folder} (Ctrl-C to stop)")
+            results = ingest.watch(args.folder, args.interval, stop)
+    except KeyboardInterrupt:
+        print("Stopped; run the same command again to resume")
+        return 130
+    finally:
+        ingest.close()
+    print(", ".join(f"{state}: {count}" for state, count in results.items()))
+    return 1 if results['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
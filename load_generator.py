@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Real-time player load generator.
+
+Simulates N HLS/DASH players against a running server: each player loads the
+manifest, then downloads segments at playback pace with a buffer model,
+throughput-based ABR switching and random seeks. Reports aggregate throughput,
+segment latency percentiles, and per-player startup time and rebuffering.
+
+Example:
+    python load_generator.py --task-id 1 --players 50 --duration 120
+    python load_generator.py --url /static/output/example_1234/playlist.m3u8 --players 10
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# ---------------------------------------------------------------------------
+# Manifest parsing
+# ---------------------------------------------------------------------------
+
+def parse_hls_master(text: str, base_url: str) -> List[Dict[str, Any]]:
+    """Variants of a master playlist as [{'bandwidth', 'url'}], lowest bandwidth first"""
+    variants = []
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    for i, line in enumerate(lines):
+        if line.startswith('#EXT-X-STREAM-INF') and i + 1 < len(lines):
+            match = re.search(r'BANDWIDTH=(\d+)', line)
+            variants.append({
+                'bandwidth': int(match.group(1)) if match else 0,
+                'url': urljoin(base_url, lines[i + 1]),
+            })
+    return sorted(variants, key=lambda v: v['bandwidth'])
+
+
+def parse_hls_media(text: str, base_url: str) -> List[Dict[str, Any]]:
+    """Segments of a media playlist as [{'duration', 'url'}]"""
+    segments = []
+    duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXTINF:'):
+            duration = float(line[len('#EXTINF:'):].split(',')[0])
+        elif line and not line.startswith('#') and duration is not None:
+            segments.append({'duration': duration, 'url': urljoin(base_url, line)})
+            duration = None
+    return segments
+
+
+def _strip_ns(root: ET.Element) -> None:
+    for element in root.iter():
+        if '}' in element.tag:
+            element.tag = element.tag.split('}', 1)[1]
+
+
+def _expand_template(template: str, representation_id: str, number: int, bandwidth: int, t: int) -> str:
+    def replace(match):
+        name, fmt = match.group(1), match.group(2)
+        value = {'RepresentationID': representation_id, 'Number': number,
+                 'Bandwidth': bandwidth, 'Time': t}[name]
+        return (fmt % value) if fmt else str(value)
+    return re.sub(r'\$(RepresentationID|Number|Bandwidth|Time)(%0\d+d)?\$', replace, template)
+
+
+def parse_dash_mpd(text: str, base_url: str) -> List[Dict[str, Any]]:
+    """
+    Video representations of an MPD using SegmentTemplate (as written by
+    ffmpeg's dash muxer) as [{'bandwidth', 'init_url', 'segments'}].
+    """
+    root = ET.fromstring(text)
+    _strip_ns(root)
+    renditions = []
+    for adaptation in root.iter('AdaptationSet'):
+        content = adaptation.get('contentType') or adaptation.get('mimeType', '')
+        if 'audio' in content:
+            continue
+        set_template = adaptation.find('SegmentTemplate')
+        for representation in adaptation.findall('Representation'):
+            template = representation.find('SegmentTemplate')
+            if template is None:
+                template = set_template
+            if template is None:
+                continue
+            rep_id = representation.get('id', '0')
+            bandwidth = int(representation.get('bandwidth', '0'))
+            timescale = int(template.get('timescale', '1'))
+            number = int(template.get('startNumber', '1'))
+            segments = []
+            timeline = template.find('SegmentTimeline')
+            if timeline is not None:
+                t = 0
+                for s in timeline.findall('S'):
+                    t = int(s.get('t', t))
+                    d = int(s.get('d'))
+                    for _ in range(int(s.get('r', '0')) + 1):
+                        media = _expand_template(template.get('media'), rep_id, number, bandwidth, t)
+                        segments.append({'duration': d / timescale, 'url': urljoin(base_url, media)})
+                        number += 1
+                        t += d
+            init = template.get('initialization')
+            renditions.append({
+                'bandwidth': bandwidth,
+                'init_url': urljoin(base_url, _expand_template(init, rep_id, 0, bandwidth, 0)) if init else None,
+                'segments': segments,
+            })
+    return sorted(renditions, key=lambda r: r['bandwidth'])
+
+
+async def load_renditions(client: httpx.AsyncClient, manifest_url: str) -> List[Dict[str, Any]]:
+    """Fetch a manifest and return its renditions, lowest bandwidth first"""
+    response = await client.get(manifest_url)
+    response.raise_for_status()
+    if manifest_url.endswith('.mpd'):
+        return parse_dash_mpd(response.text, manifest_url)
+    variants = parse_hls_master(response.text, manifest_url)
+    if not variants:
+        return [{'bandwidth': 0, 'init_url': None, 'segments': parse_hls_media(response.text, manifest_url)}]
+    renditions = []
+    for variant in variants:
+        media = await client.get(variant['url'])
+        media.raise_for_status()
+        renditions.append({
+            'bandwidth': variant['bandwidth'],
+            'init_url': None,
+            'segments': parse_hls_media(media.text, variant['url']),
+        })
+    return renditions
+
+
+# ---------------------------------------------------------------------------
+# Player simulation
+# ---------------------------------------------------------------------------
+
+class Metrics:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ttfb: List[float] = []
+        self.bytes = 0
+        self.requests = 0
+        self.errors = 0
+
+    async def fetch(self, client: httpx.AsyncClient, url: str) -> Optional[int]:
+        """Download a segment, recording time to first byte and total time; returns its size"""
+        self.requests += 1
+        started = time.monotonic()
+        size = 0
+        first_byte = None
+        try:
+            async with client.stream('GET', url) as response:
+                if response.status_code != 200:
+                    self.errors += 1
+                    return None
+                async for chunk in response.aiter_bytes():
+                    if first_byte is None:
+                        first_byte = time.monotonic() - started
+                    size += len(chunk)
+        except httpx.HTTPError:
+            self.errors += 1
+            return None
+        self.latencies.append(time.monotonic() - started)
+        self.ttfb.append(first_byte if first_byte is not None else time.monotonic() - started)
+        self.bytes += size
+        return size
+
+
+class Player:
+    """
+    One simulated viewer. Playback drains the buffer in real time; segments are
+    fetched while the buffer is below `max_buffer`. An empty buffer during
+    playback counts as a rebuffer event until `resume_buffer` seconds are loaded.
+    """
+
+    def __init__(self, player_id: int, renditions: List[Dict[str, Any]], metrics: Metrics, args):
+        self.player_id = player_id
+        self.renditions = renditions
+        self.metrics = metrics
+        self.max_buffer = args.max_buffer
+        self.resume_buffer = args.resume_buffer
+        self.seek_probability = args.seek_probability
+        self.duration = args.duration
+        self.level = 0
+        self.throughput_bps: Optional[float] = None
+        self.buffered = 0.0
+        self.playing = False
+        self.startup_time: Optional[float] = None
+        self.rebuffer_events = 0
+        self.rebuffer_seconds = 0.0
+        self.switches = 0
+        self.seeks = 0
+        self.segments = 0
+        self._stall_started: Optional[float] = None
+        self._last_tick = 0.0
+
+    def _tick(self, now: float) -> None:
+        """Advance playback to `now`, draining the buffer"""
+        elapsed = now - self._last_tick
+        self._last_tick = now
+        if not self.playing:
+            return
+        self.buffered -= elapsed
+        if self.buffered <= 0:
+            self.buffered = 0.0
+            self.playing = False
+            self.rebuffer_events += 1
+            self._stall_started = now
+
+    def _start_playback(self, now: float, started: float) -> None:
+        self.playing = True
+        if self.startup_time is None:
+            self.startup_time = now - started
+        elif self._stall_started is not None:
+            self.rebuffer_seconds += now - self._stall_started
+        self._stall_started = None
+
+    def _choose_level(self) -> None:
+        if self.throughput_bps is None or len(self.renditions) < 2:
+            return
+        budget = self.throughput_bps * 0.8
+        level = 0
+        for index, rendition in enumerate(self.renditions):
+            if rendition['bandwidth'] <= budget:
+                level = index
+        if level != self.level:
+            self.level = level
+            self.switches += 1
+
+    async def run(self, client: httpx.AsyncClient) -> Dict[str, Any]:
+        started = time.monotonic()
+        self._last_tick = started
+        deadline = started + self.duration
+        index = 0
+        init_loaded = set()
+
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            self._tick(now)
+
+            # Real-time pacing: wait while the buffer is full
+            if self.buffered >= self.max_buffer:
+                await asyncio.sleep(min(self.buffered - self.max_buffer + 0.1, deadline - now))
+                continue
+
+            if self.playing and random.random() < self.seek_probability:
+                segments = self.renditions[self.level]['segments']
+                index = random.randrange(len(segments))
+                self.buffered = 0.0
+                self.playing = False
+                self.seeks += 1
+                self._stall_started = None
+
+            self._choose_level()
+            rendition = self.renditions[self.level]
+            if rendition['init_url'] and self.level not in init_loaded:
+                await self.metrics.fetch(client, rendition['init_url'])
+                init_loaded.add(self.level)
+
+            segment = rendition['segments'][index % len(rendition['segments'])]
+            fetch_started = time.monotonic()
+            size = await self.metrics.fetch(client, segment['url'])
+            fetch_time = time.monotonic() - fetch_started
+            index += 1
+            self._tick(time.monotonic())
+            if size is None:
+                await asyncio.sleep(0.5)
+                continue
+
+            self.segments += 1
+            bps = size * 8 / max(fetch_time, 1e-6)
+            self.throughput_bps = bps if self.throughput_bps is None else 0.7 * self.throughput_bps + 0.3 * bps
+            self.buffered += segment['duration']
+            if not self.playing and self.buffered >= min(self.resume_buffer, segment['duration']):
+                self._start_playback(time.monotonic(), started)
+
+        if self._stall_started is not None:
+            self.rebuffer_seconds += time.monotonic() - self._stall_started
+        return {
+            "player": self.player_id,
+            "startup_time": round(self.startup_time, 3) if self.startup_time is not None else None,
+            "rebuffer_events": self.rebuffer_events,
+            "rebuffer_seconds": round(self.rebuffer_seconds, 3),
+            "switches": self.switches,
+            "seeks": self.seeks,
+            "segments": self.segments,
+        }
+
+
+async def resolve_manifest(client: httpx.AsyncClient, args) -> str:
+    if args.url:
+        return urljoin(args.base_url, args.url)
+    response = await client.get(f"/api/v1/stream/{args.task_id}")
+    response.raise_for_status()
+    info = response.json()
+    path = info.get('hls_url') or info.get('dash_url')
+    if not path:
+        raise SystemExit(f"Task {args.task_id} has no HLS/DASH stream: {info}")
+    return urljoin(args.base_url, path)
+
+
+async def run_load_test(args) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.players * 2, max_keepalive_connections=args.players * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=httpx.Timeout(30.0)) as client:
+        manifest_url = await resolve_manifest(client, args)
+        renditions = await load_renditions(client, manifest_url)
+        if not any(r['segments'] for r in renditions):
+            raise SystemExit(f"No segments found in {manifest_url}")
+        renditions = [r for r in renditions if r['segments']]
+
+        metrics = Metrics()
+        players = [Player(i, renditions, metrics, args) for i in range(args.players)]
+        started = time.monotonic()
+
+        async def start(player: Player):
+            # Spread player arrivals over the ramp-up period
+            await asyncio.sleep(random.uniform(0, args.ramp_up))
+            return await player.run(client)
+
+        results = await asyncio.gather(*[start(player) for player in players])
+        elapsed = time.monotonic() - started
+
+    startup_times = [r['startup_time'] for r in results if r['startup_time'] is not None]
+    return {
+        "manifest": manifest_url,
+        "renditions": len(renditions),
+        "players": args.players,
+        "elapsed_seconds": round(elapsed, 2),
+        "requests": metrics.requests,
+        "errors": metrics.errors,
+        "bytes": metrics.bytes,
+        "throughput_mbps": round(metrics.bytes * 8 / elapsed / 1e6, 2),
+        "segment_latency_ms": {
+            "p50": round(percentile(metrics.latencies, 50) * 1000, 1),
+            "p95": round(percentile(metrics.latencies, 95) * 1000, 1),
+            "p99": round(percentile(metrics.latencies, 99) * 1000, 1),
+            "max": round(max(metrics.latencies, default=0) * 1000, 1),
+        },
+        "ttfb_ms_p95": round(percentile(metrics.ttfb, 95) * 1000, 1),
+        "startup_time_p95": round(percentile(startup_times, 95), 3),
+        "players_never_started": len(results) - len(startup_times),
+        "rebuffer_events": sum(r['rebuffer_events'] for r in results),
+        "players_with_rebuffer": sum(1 for r in results if r['rebuffer_events']),
+        "per_player": results,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report['segment_latency_ms']
+    print(f"Manifest:        {report['manifest']} ({report['renditions']} rendition(s))")
+    print(f"Players:         {report['players']} over {report['elapsed_seconds']}s")
+    print(f"Requests:        {report['requests']} ({report['errors']} errors)")
+    print(f"Throughput:      {report['throughput_mbps']} Mbit/s ({report['bytes']} bytes)")
+    print(f"Segment latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+          f"p99 {latency['p99']} ms, max {latency['max']} ms (TTFB p95 {report['ttfb_ms_p95']} ms)")
+    print(f"Startup time:    p95 {report['startup_time_p95']}s, never started: {report['players_never_started']}")
+    print(f"Rebuffering:     {report['rebuffer_events']} events, "
+          f"{report['players_with_rebuffer']}/{report['players']} players affected")
+    print()
+    print(f"{'player':>6} {'startup':>8} {'rebuf':>6} {'stall_s':>8} {'switch':>7} {'seeks':>6} {'segs':>6}")
+    for r in report['per_player']:
+        startup = f"{r['startup_time']:.2f}" if r['startup_time'] is not None else '-'
+        print(f"{r['player']:>6} {startup:>8} {r['rebuffer_events']:>6} {r['rebuffer_seconds']:>8.2f} "
+              f"{r['switches']:>7} {r['seeks']:>6} {r['segments']:>6}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent HLS/DASH players against the server")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--task-id", type=int, help="Task whose stream to play (resolved via /api/v1/stream)")
+    target.add_argument("--url", help="Manifest URL or path (.m3u8 or .mpd)")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60, help="Seconds each player watches")
+    parser.add_argument("--ramp-up", type=float, default=5, help="Seconds over which players join")
+    parser.add_argument("--max-buffer", type=float, default=30, help="Seconds of media a player buffers ahead")
+    parser.add_argument("--resume-buffer", type=float, default=4, help="Seconds needed to start/resume playback")
+    parser.add_argument("--seek-probability", type=float, default=0.02, help="Chance of a seek per segment")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    result = asyncio.run(run_load_test(arguments))
+    if arguments.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
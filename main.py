@@ -13,6 +13,7 @@ import uvicorn
 from fastapi import HTTPException, Query
 from fastapi.responses import FileResponse
 from app import app, conversion_tasks, chunk_storage, OUTPUT_DIR, RTSP_PORT, rtsp_servers
+from services.encoding_profiles import audio_args, video_args
 
 async def start_rtsp_stream(input_path: str, stream_id: str):
     """Start an RTSP server for the given input file"""
@@ -26,9 +27,7 @@ async def start_rtsp_stream(input_path: str, stream_id: str):
         '-re',  # Read input at native frame rate
         '-stream_loop', '-1',  # Loop the input
         '-i', input_path,
-        '-c:v', 'libx264',
-        '-preset', 'veryfast',
-        '-tune', 'zerolatency',
+        *video_args('live'),
         '-f', 'rtsp',
         f'rtsp://0.0.0.0:{RTSP_PORT}/{stream_id}'
     ]
@@ -81,23 +80,13 @@ async def convert_video(task_id: int):
                 'ffmpeg',
                 '-i', task['input'],
                 
-                # Video codec configuration
+                # Video codec configuration (ladder rung from the profile registry)
                 '-map', '0:v:0',
-                '-c:v:0', 'libx264',
-                '-b:v:0', '2000k',
-                '-maxrate:v:0', '2200k',
-                '-bufsize:v:0', '4000k',
-                '-profile:v:0', 'high',
-                '-level', '4.0',
-                '-x264opts', 'keyint=60:min-keyint=60:no-scenecut',
-                '-g', '60',
-                '-sc_threshold', '0',
+                *video_args('ladder_2000k', stream_index=0),
                 
                 # Audio configuration
                 '-map', '0:a:0',
-                '-c:a:0', 'aac',
-                '-b:a:0', '128k',
-                '-ac', '2',
+                *audio_args('ladder_2000k', stream_index=0),
                 
                 # HLS settings
                 '-f', 'hls',
@@ -122,23 +111,13 @@ async def convert_video(task_id: int):
                 'ffmpeg',
                 '-i', task['input'],
                 
-                # Video representations
+                # Video representations (ladder rung from the profile registry)
                 '-map', '0:v:0',
-                '-c:v:0', 'libx264',
-                '-b:v:0', '2000k',
-                '-maxrate:v:0', '2200k',
-                '-bufsize:v:0', '4000k',
-                '-profile:v:0', 'high',
-                '-level:v:0', '4.0',
-                '-x264opts', 'keyint=60:min-keyint=60:no-scenecut',
-                '-g', '60',
-                '-sc_threshold', '0',
+                *video_args('ladder_2000k', stream_index=0),
                 
                 # Audio representation
                 '-map', '0:a:0',
-                '-c:a:0', 'aac',
-                '-b:a:0', '128k',
-                '-ac', '2',
+                *audio_args('ladder_2000k', stream_index=0),
                 
                 # DASH settings
                 '-f', 'dash',
@@ -0,0 +1,106 @@
+import os
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Form, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+from app import app, conversion_tasks
+from services.drain import drain_controller
+from services.profiler import PROFILE_INTERVAL, profiler
+
+router = APIRouter(tags=["admin"])
+
+# Admin endpoints need this token in X-Admin-Token. They are disabled without one:
+# behind a same-host proxy every request would pass a peer-address check
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.post("/admin/drain")
+async def start_drain(request: Request, grace: Optional[float] = Form(None)):
+    """Stop accepting jobs, let running encodes finish within `grace` seconds, then checkpoint the rest"""
+    _require_admin(request)
+    drain_controller.start(conversion_tasks, 'admin', grace)
+    return JSONResponse(status_code=202, content=drain_controller.snapshot())
+
+
+@router.get("/admin/drain")
+async def get_drain_status(request: Request):
+    _require_admin(request)
+    return drain_controller.snapshot()
+
+
+def _resolve_targets(value: Optional[str]):
+    """Route paths (/api/v1/stream/{task_id}) or function names (convert_video) -> function names"""
+    targets = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if item.startswith('/'):
+            endpoints = [route.endpoint.__name__ for route in app.routes
+                         if isinstance(route, APIRoute) and route.path == item]
+            if not endpoints:
+                raise HTTPException(status_code=400, detail=f"Unknown route: {item}")
+            targets.extend(endpoints)
+        else:
+            targets.append(item)
+    return targets
+
+
+@router.post("/admin/profile")
+async def capture_profile(
+    request: Request,
+    mode: str = Form("sample"),
+    seconds: float = Form(10.0),
+    interval_ms: float = Form(PROFILE_INTERVAL * 1000),
+    targets: Optional[str] = Form(None, description="Route paths or function names, e.g. /api/v1/stream/{task_id},convert_video"),
+    memory: bool = Form(False),
+    all_threads: bool = Form(False)
+):
+    """
+    Profile the running process for `seconds` (the request returns when the
+    capture is done). Sample mode can be limited to routes or coroutines;
+    `memory` adds a tracemalloc snapshot and the allocation growth.
+    """
+    _require_admin(request)
+    try:
+        capture = await profiler.capture(mode, seconds, interval_ms / 1000, _resolve_targets(targets), memory, all_threads)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    info = capture.info()
+    info["downloads"] = {name: f"/api/v1/admin/profile/{capture.id}?format={name}" for name in capture.artifacts}
+    return info
+
+
+@router.get("/admin/profile")
+async def list_profiles(request: Request):
+    _require_admin(request)
+    return {
+        "running": profiler.running.info() if profiler.running else None,
+        "captures": [capture.info() for capture in profiler.captures.values()],
+    }
+
+
+@router.get("/admin/profile/{capture_id}")
+async def download_profile(request: Request, capture_id: str, format: Optional[str] = Query(None)):
+    """Download a capture: collapsed (flame graphs), pstats (cProfile) or tracemalloc (Snapshot.load)"""
+    _require_admin(request)
+    capture = profiler.captures.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    if format is None:
+        return capture.info()
+    if format not in capture.artifacts:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(capture.artifacts)}")
+    data, media_type, extension = capture.artifacts[format]
+    return Response(content=data, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="profile_{capture.id}.{extension}"'})
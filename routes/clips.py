@@ -0,0 +1,84 @@
+from fastapi import APIRouter, Form, HTTPException
+import os
+import uuid
+import asyncio
+from app import conversion_tasks, OUTPUT_DIR
+from services.clips import build_clip, parse_ranges
+from services.drain import reject_new_jobs
+from services.task_store import utc_now_iso
+from services.video_converter import resolve_output_path
+
+router = APIRouter(tags=["clips"])
+
+
+def _create_clip(ranges):
+    """Validate the source ranges, register the clip task and start building it"""
+    reject_new_jobs()
+    sources = []
+    for source_id, start, end in ranges:
+        source = conversion_tasks.get(source_id)
+        if not source:
+            raise HTTPException(status_code=404, detail=f"Task {source_id} not found")
+        if source.get('status') != 'completed' or source.get('streaming_protocol') not in ('hls', 'dash'):
+            raise HTTPException(status_code=400, detail=f"Task {source_id} is not a completed HLS/DASH conversion")
+        sources.append((source, start, end))
+
+    protocols = {source['streaming_protocol'] for source, _, _ in sources}
+    if len(protocols) > 1:
+        raise HTTPException(status_code=400, detail="All ranges must come from tasks with the same protocol")
+    protocol = protocols.pop()
+
+    clip_name = f"clip_{str(uuid.uuid4())[:8]}"
+    clip_dir = os.path.join(OUTPUT_DIR, clip_name)
+    media_format, output_path = resolve_output_path(clip_dir, protocol, protocol)
+    first = sources[0][0]
+
+    task_id = conversion_tasks.next_id()
+    conversion_tasks[task_id] = {
+        'input': clip_dir,
+        'filename': clip_name,
+        'output': output_path,
+        'media_format': media_format,
+        'streaming_protocol': protocol,
+        'segment_duration': first.get('segment_duration', 6),
+        'crf': first.get('crf', 20),
+        'resolution': first.get('resolution', 'source'),
+        'profile': first.get('profile'),
+        'priority': 'high',
+        'kind': 'clip',
+        'sources': [{'task_id': source_id, 'start': start, 'end': end} for source_id, start, end in ranges],
+        'status': 'pending',
+        'progress': 0,
+        'error': None,
+        'created_at': utc_now_iso()
+    }
+    asyncio.create_task(build_clip(task_id, conversion_tasks, sources))
+    print(f"Created clip task {task_id} from {len(ranges)} range(s)")
+
+    return {
+        "task_id": task_id,
+        "status": "processing",
+        "output_path": output_path,
+        "stream_url": f"/api/v1/stream/{task_id}",
+        "status_url": f"/api/v1/tasks/{task_id}"
+    }
+
+
+@router.post("/tasks/{task_id}/clip")
+async def clip_task(task_id: int, start: float = Form(...), end: float = Form(...)):
+    """Cut [start, end) seconds out of a converted task, reusing its segments"""
+    try:
+        ranges = parse_ranges(f"{task_id}:{start}-{end}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _create_clip(ranges)
+
+
+@router.post("/clips/")
+async def create_compilation(ranges: str = Form(..., description="task_id:start-end pairs, e.g. 1:10-25,3:0-12.5")):
+    """Stitch ranges of one or more converted tasks into a new playlist, in order"""
+    try:
+        parsed = parse_ranges(ranges)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _create_clip(parsed)
@@ -0,0 +1,95 @@
+import hmac
+from fastapi import APIRouter, HTTPException, Request, Form
+from fastapi.responses import Response
+from services.drain import reject_new_jobs
+from services.live_store import live_channels, start_channel, stop_channel, content_type_for
+
+router = APIRouter(tags=["live"])
+
+# ffmpeg publishes from the same host; nobody else may write into a channel. Each
+# channel's publish URL also carries its own token, since behind a same-host
+# reverse proxy every request arrives from localhost
+LOCAL_CLIENTS = ("127.0.0.1", "::1", "localhost")
+
+
+def _get_channel(channel_id: str):
+    channel = live_channels.get(channel_id)
+    if channel is None:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    return channel
+
+
+def _ingest_channel(channel_id: str, token: str, request: Request):
+    """The channel a publish request writes to, if it comes from localhost with the channel's token"""
+    if request.client and request.client.host not in LOCAL_CLIENTS:
+        raise HTTPException(status_code=403, detail="Live ingest is only accepted from localhost")
+    channel = _get_channel(channel_id)
+    if not hmac.compare_digest(token, channel.ingest_token):
+        raise HTTPException(status_code=403, detail="Invalid ingest token")
+    return channel
+
+
+def _check_name(name: str):
+    if '..' in name or '/' in name or '\\' in name:
+        raise HTTPException(status_code=400, detail="Invalid segment name")
+
+
+@router.post("/live/channels")
+async def create_live_channel(
+    request: Request,
+    protocol: str = Form("hls"),
+    ingest: str = Form("rtmp"),
+    port: int = Form(None),
+    segment_duration: int = Form(2),
+    window: int = Form(6),
+    crf: int = Form(23)
+):
+    """Start a live channel listening for a local push feed (RTMP, SRT or MPEG-TS over TCP)"""
+    reject_new_jobs()
+    try:
+        channel = await start_channel(protocol, ingest, port, segment_duration, window, crf,
+                                      request.scope.get("server"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return channel.info()
+
+
+@router.get("/live/channels")
+async def list_live_channels():
+    return [channel.info() for channel in live_channels.values()]
+
+
+@router.delete("/live/channels/{channel_id}")
+async def delete_live_channel(channel_id: str):
+    _get_channel(channel_id)
+    await stop_channel(channel_id)
+    return {"channel_id": channel_id, "status": "stopped"}
+
+
+@router.put("/live/{channel_id}/ingest/{token}/{name}")
+async def put_live_object(channel_id: str, token: str, name: str, request: Request):
+    """Receive a segment or manifest published by the channel's ffmpeg"""
+    _check_name(name)
+    channel = _ingest_channel(channel_id, token, request)
+    channel.put(name, await request.body())
+    return Response(status_code=204)
+
+
+@router.delete("/live/{channel_id}/ingest/{token}/{name}")
+async def delete_live_object(channel_id: str, token: str, name: str, request: Request):
+    _check_name(name)
+    _ingest_channel(channel_id, token, request).delete(name)
+    return Response(status_code=204)
+
+
+@router.get("/live/{channel_id}/{name}")
+async def get_live_object(channel_id: str, name: str):
+    """Serve a live manifest or segment straight from memory"""
+    _check_name(name)
+    data = _get_channel(channel_id).get(name)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    headers = {"Access-Control-Allow-Origin": "*"}
+    if name.endswith(('.m3u8', '.mpd')):
+        headers["Cache-Control"] = "no-cache"
+    return Response(content=data, media_type=content_type_for(name), headers=headers)
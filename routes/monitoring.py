@@ -0,0 +1,64 @@
+from fastapi import APIRouter
+from services.loop_monitor import loop_monitor
+from services import edge_cache
+from services.rate_limit import rate_limiter
+from services.tracing import stage_stats
+from services.cpu_allocator import cpu_allocator
+from services.segment_prefetch import segment_prefetcher
+from services.storage import storage
+from app import conversion_tasks
+from services.encoding_profiles import DEFAULT_DEADLINE_SECONDS, ENCODING_PROFILES, PROFILE_TIERS, encode_stats
+
+router = APIRouter(tags=["monitoring"])
+
+@router.get("/monitoring/loop")
+async def get_loop_lag():
+    """Event-loop lag statistics (max / p99 stall and the last offending call site)"""
+    return loop_monitor.stats()
+
+@router.get("/monitoring/encoding")
+async def get_encoding_stats():
+    """Encoding profile registry, policy tiers and measured encode speeds on this host"""
+    return {
+        "profiles": ENCODING_PROFILES,
+        "tiers": PROFILE_TIERS,
+        "default_deadline_seconds": DEFAULT_DEADLINE_SECONDS,
+        **encode_stats.snapshot(),
+    }
+
+@router.get("/monitoring/edge")
+async def get_edge_cache_stats():
+    """Edge cache hit/miss counters (only when running with EDGE_ORIGIN_URL)"""
+    if edge_cache.edge_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **edge_cache.edge_cache.snapshot()}
+
+@router.get("/monitoring/rate-limits")
+async def get_rate_limit_stats():
+    """Throttled / rejected request and byte counters for segment delivery and uploads"""
+    return rate_limiter.snapshot()
+
+@router.get("/monitoring/stages")
+async def get_stage_latencies():
+    """p50/p95 duration of each job stage over recent tasks"""
+    return stage_stats.summary()
+
+@router.get("/monitoring/cpu")
+async def get_cpu_allocation():
+    """Cores reserved for the API, encode cores, and each running job's thread budget and affinity"""
+    return cpu_allocator.snapshot()
+
+@router.get("/monitoring/prefetch")
+async def get_prefetch_stats():
+    """Segment read-ahead cache: hits, prefetched vs. wasted segments and tracked playback sessions"""
+    return segment_prefetcher.snapshot()
+
+@router.get("/monitoring/storage")
+async def get_storage_stats():
+    """Configured output storage backend and its upload counters"""
+    return storage.snapshot()
+
+@router.get("/monitoring/tasks")
+async def get_task_registry_stats():
+    """Task registry size: in-memory vs. spilled tasks and estimated bytes per task"""
+    return conversion_tasks.memory_stats()
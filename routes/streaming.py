@@ -1,8 +1,12 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 import os
 from app import app, conversion_tasks, chunk_storage, OUTPUT_DIR, rtsp_servers
 from pathlib import Path
+from services import blocking_io
+from services.rate_limit import _client_id
+from services.segment_prefetch import is_segment, resolve_under, segment_prefetcher
+from services.storage import content_type, serve_from_storage, task_output_dir
 
 router = APIRouter(tags=["streaming"])
 
@@ -12,48 +16,51 @@ async def get_stream(task_id: int):
         raise HTTPException(status_code=404, detail="Task not found")
     
     task = conversion_tasks[task_id]
-    if task["status"] != "completed":
+    phases = task.get('phases') or {}
+    # A two-phase task can be played from its preview while the full encode runs
+    preview_only = task["status"] != "completed"
+    if preview_only and phases.get('preview', {}).get('status') != 'completed':
         raise HTTPException(status_code=400, detail="Conversion not complete")
+    if preview_only and (task["status"] in ('failed', 'cancelled')
+                         or phases.get('full', {}).get('status') in ('failed', 'cancelled')):
+        # The full encode will not replace the preview, so it is no longer offered as the stream
+        return {
+            "hls_url": None,
+            "dash_url": None,
+            "rtsp_url": None,
+            "chunks_available": False,
+            "phase": "full",
+            "phases": phases,
+            "streaming_protocol": task.get('streaming_protocol'),
+            "status": task.get('status', 'unknown'),
+            "error": task.get('error') or phases.get('full', {}).get('error'),
+        }
     
     try:
-        # Initialize chunk storage for this task if it doesn't exist
-        if task_id not in chunk_storage:
-            chunk_storage[task_id] = {
-                'hls_chunks': [],
-                'dash_chunks': []
-            }
-            
+        # Count the task's chunks once (once the final output is in place); only counts are kept
+        if task_id not in chunk_storage and not preview_only:
             # Get the base output directory
-            file_base = os.path.splitext(os.path.basename(task['input']))[0]
-            output_dir = os.path.join("static", "output", file_base)
-            
-            # Scan for HLS chunks
-            hls_dir = output_dir
-            if os.path.exists(hls_dir):
-                chunk_storage[task_id]['hls_chunks'] = [
-                    str(f) for f in os.listdir(hls_dir) 
-                    if f.endswith(('.ts', '.m3u8'))
-                ]
+            output_dir = task_output_dir(task)
             
-            # Scan for DASH chunks
-            dash_dir = os.path.join(output_dir, "dash")
-            if os.path.exists(dash_dir):
-                chunk_storage[task_id]['dash_chunks'] = [
-                    str(f) for f in os.listdir(dash_dir) 
-                    if f.endswith(('.m4s', '.mpd', '.init.mp4'))
-                ]
+            # Scan for HLS and DASH chunks (directory listings run on the fs thread pool)
+            hls_files = await blocking_io.listdir(output_dir)
+            dash_files = await blocking_io.listdir(os.path.join(output_dir, "dash"))
+            chunk_storage[task_id] = {
+                'hls_chunks': sum(1 for f in hls_files if f.endswith(('.ts', '.m3u8'))),
+                'dash_chunks': sum(1 for f in dash_files if f.endswith(('.m4s', '.mpd', '.init.mp4')))
+            }
         
-        # Get the base URL path - extract from the actual input file path
-        input_filename = os.path.basename(task['input'])
-        file_base = os.path.splitext(input_filename)[0]
-        base_url = f"/static/output/{file_base}"
+        # Get the base URL path from the task's output directory
+        base_url = "/static/" + os.path.relpath(task_output_dir(task), "static").replace(os.sep, '/')
         
         # Create response with stream information
         response = {
             "hls_url": f"{base_url}/playlist.m3u8" if task.get('streaming_protocol') == 'hls' else None,
             "dash_url": f"{base_url}/dash/playlist.mpd" if task.get('streaming_protocol') == 'dash' else None,
             "rtsp_url": f"rtsp://localhost:8554/{task.get('stream_id', '')}" if task.get('streaming_protocol') == 'rtsp' else None,
-            "chunks_available": bool(chunk_storage.get(task_id, {}).get('hls_chunks') or chunk_storage.get(task_id, {}).get('dash_chunks')),
+            "chunks_available": preview_only or bool(task.get('storage')) or bool(chunk_storage.get(task_id, {}).get('hls_chunks') or chunk_storage.get(task_id, {}).get('dash_chunks')),
+            "phase": "preview" if preview_only else "full",
+            "phases": phases or None,
             "streaming_protocol": task.get('streaming_protocol'),
             "status": task.get('status', 'unknown')
         }
@@ -71,7 +78,8 @@ async def get_stream(task_id: int):
 async def get_chunk_content(
     task_id: int,
     chunk_name: str,
-    chunk_type: str
+    chunk_type: str,
+    request: Request
 ):
     """
     Retrieve a specific chunk file (TS, M4S, M3U8, or MPD) for a given task.
@@ -88,31 +96,38 @@ async def get_chunk_content(
         if chunk_type not in ['hls', 'dash']:
             raise HTTPException(status_code=400, detail="Invalid chunk type")
         
-        # Build the file path based on chunk type
-        file_base = os.path.splitext(os.path.basename(conversion_tasks[task_id]['input']))[0]
-        if chunk_type == 'hls':
-            file_path = os.path.join("static", "output", file_base, chunk_name)
-        else:  # dash
-            file_path = os.path.join("static", "output", file_base, "dash", chunk_name)
+        # Build the file path based on chunk type, refusing anything outside the task's output
+        output_dir = task_output_dir(conversion_tasks[task_id])
+        if chunk_type == 'dash':
+            output_dir = os.path.join(output_dir, "dash")
+        file_path = resolve_under(output_dir, chunk_name)
+        if file_path is None:
+            raise HTTPException(status_code=400, detail="Invalid chunk name")
+        
+        # Output published to object storage is redirected to or read from the bucket
+        remote = await serve_from_storage(file_path)
+        if remote is not None:
+            return remote
+        
+        # Read ahead of the player, and serve this segment from memory if a prefetch already has it
+        cached = None
+        if segment_prefetcher.enabled and is_segment(chunk_name) and 'range' not in request.headers:
+            segment_prefetcher.on_segment_request(_client_id(request.scope), file_path)
+            cached = await segment_prefetcher.lookup(file_path)
         
-        if not os.path.exists(file_path):
+        if cached is None and not await blocking_io.exists(file_path):
             raise HTTPException(status_code=404, detail="Chunk not found")
         
         # Determine content type based on file extension
-        content_type = "application/octet-stream"
-        if chunk_name.endswith('.m3u8'):
-            content_type = "application/vnd.apple.mpegurl"
-        elif chunk_name.endswith('.ts'):
-            content_type = "video/MP2T"
-        elif chunk_name.endswith('.mpd'):
-            content_type = "application/dash+xml"
-        elif chunk_name.endswith(('.m4s', '.mp4')):
-            content_type = "video/mp4"
+        media_type = content_type(chunk_name)
+        
+        if cached is not None:
+            return Response(content=cached, media_type=media_type)
         
         # Return the file using FileResponse
         return FileResponse(
             path=file_path,
-            media_type=content_type,
+            media_type=media_type,
             filename=os.path.basename(chunk_name)
         )
         
@@ -1,5 +1,11 @@
-from fastapi import APIRouter, HTTPException
+import os
+import json
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from app import conversion_tasks
+from services.job_control import cancel_task
+from services.tracing import task_traces
 
 router = APIRouter(tags=["tasks"])
 
@@ -10,23 +16,100 @@ async def get_task_status(task_id: int):
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    # With a preview, the stream is playable as soon as the preview phase is published
+    phases = task.get("phases")
+    playable = task.get("status") == "completed" or bool(phases and phases["preview"]["status"] == "completed")
     return {
         "task_id": task_id,
         "status": task.get("status", "unknown"),
         "progress": task.get("progress", 0),
         "error": task.get("error"),
-        "stream_url": f"/stream/{task_id}" if task.get("status") == "completed" else None
+        "priority": task.get("priority", "normal"),
+        "phases": phases,
+        "stream_url": f"/stream/{task_id}" if playable else None
     }
 
+LIST_FIELDS = ("task_id", "status", "filename", "created_at", "streaming_protocol", "media_format", "progress", "error")
+DEFAULT_LIST_FIELDS = ("task_id", "status", "filename", "created_at")
+MAX_PAGE_SIZE = 500
+
+
+def _split_param(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+
+@router.post("/tasks/{task_id}/cancel")
+async def cancel_conversion(task_id: int):
+    """Cancel a pending or running conversion and kill its ffmpeg process tree"""
+    if task_id not in conversion_tasks:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not cancel_task(task_id, conversion_tasks):
+        raise HTTPException(status_code=409, detail="Task already finished")
+    return {"task_id": task_id, "status": "cancelled"}
+
+
+@router.get("/tasks/{task_id}/trace")
+async def get_task_trace(
+    task_id: int,
+    format: str = Query("json", description="json, or jsonl for OpenTelemetry-style spans, one per line")
+):
+    """Stage timeline of a task: upload, disk write, queue wait, probe, ffmpeg start, first segment, encode, manifest"""
+    trace = task_traces.get(task_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace recorded for this task")
+    if format == "jsonl":
+        lines = "".join(json.dumps(span) + "\n" for span in trace.otel_spans())
+        return PlainTextResponse(lines, media_type="application/x-ndjson")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be json or jsonl")
+    return trace.to_dict()
+
+
 @router.get("/tasks/")
-async def list_tasks():
-    """List all conversion tasks"""
-    return [
-        {
-            "task_id": task_id,
-            "status": task.get("status", "unknown"),
-            "filename": task.get("input", "").split("/")[-1],
-            "created_at": task.get("created_at")
-        }
-        for task_id, task in conversion_tasks.items()
-    ]
+async def list_tasks(
+    status: Optional[str] = Query(None, description="Comma-separated statuses to include"),
+    protocol: Optional[str] = Query(None, description="Streaming protocol: hls, dash or rtsp"),
+    created_after: Optional[str] = Query(None, description="ISO-8601 timestamp, UTC unless an offset is given (inclusive)"),
+    created_before: Optional[str] = Query(None, description="ISO-8601 timestamp, UTC unless an offset is given (inclusive)"),
+    order: str = Query("desc", description="Sort by creation time: asc or desc"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return")
+):
+    """List conversion tasks, one page at a time, from the status / creation-time indexes"""
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+
+    selected = _split_param(fields) or list(DEFAULT_LIST_FIELDS)
+    unknown = [field for field in selected if field not in LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    try:
+        page, next_cursor = conversion_tasks.query(
+            statuses=_split_param(status),
+            protocol=protocol,
+            created_after=created_after,
+            created_before=created_before,
+            descending=(order == "desc"),
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    items = []
+    for task_id, task in page:
+        item = {}
+        for field in selected:
+            if field == "task_id":
+                item[field] = task_id
+            elif field == "filename":
+                item[field] = task.get("filename") or os.path.basename(task.get("input", ""))
+            elif field == "status":
+                item[field] = task.get("status", "unknown")
+            else:
+                item[field] = task.get(field)
+        items.append(item)
+
+    return {"items": items, "next_cursor": next_cursor}
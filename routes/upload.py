@@ -1,36 +1,67 @@
-from fastapi import APIRouter, UploadFile, Form, HTTPException, File
+from fastapi import APIRouter, UploadFile, Form, HTTPException, File, Query, Request
 import os
 import shutil
 import uuid
 from pathlib import Path
 from app import app, conversion_tasks, UPLOAD_DIR, OUTPUT_DIR, RTSP_PORT
 import asyncio
-from services.video_converter import convert_video
+import time
+from typing import Optional
+from services.video_converter import convert_video, resolve_output_path
+from services import blocking_io
+from services.stream_ingest import ingest_stream, is_pipe_friendly, peek_stream
+from services.task_store import utc_now_iso
+from services.encoding_profiles import ENCODING_PROFILES
+from services.job_control import PRIORITIES
+from services.drain import reject_new_jobs
+from services.tracing import trace_for
 
 router = APIRouter(tags=["upload"])
 
+
+async def _resolve_output_path(output_dir: str, media_format: str, streaming_protocol: str):
+    """Map the requested media format/protocol to the packaging format and output path"""
+    media_format, output_path = resolve_output_path(output_dir, media_format, streaming_protocol)
+    await blocking_io.makedirs(os.path.dirname(output_path), exist_ok=True)
+    return media_format, output_path
+
+
 @router.post("/upload/")
 async def upload_video(
+    request: Request,
     file: UploadFile = File(...),
     media_format: str = Form(...),
     streaming_protocol: str = Form(...),
     segment_duration: int = Form(6),
     crf: int = Form(20),
-    resolution: str = Form("source")
+    resolution: str = Form("source"),
+    profile: Optional[str] = Form(None),
+    deadline: Optional[int] = Form(None),
+    priority: str = Form("normal"),
+    preview: bool = Form(False)
 ):
+    if profile and profile not in ENCODING_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding profile: {profile}")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(PRIORITIES)}")
+    reject_new_jobs()
+
+    # The multipart body has been received by the time the handler runs
+    received_at = time.time()
+    request_started = getattr(request.state, 'request_started', received_at)
     task_id = None
     try:
         print(f"Received upload request for file: {file.filename}")
         
         # Ensure upload directory exists
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        await blocking_io.makedirs(UPLOAD_DIR, exist_ok=True)
+        await blocking_io.makedirs(OUTPUT_DIR, exist_ok=True)
         
         # Create output directory based on input filename (without extension) with unique ID
         file_base = os.path.splitext(file.filename)[0]
         unique_id = str(uuid.uuid4())[:8]
         output_dir = os.path.join(OUTPUT_DIR, f"{file_base}_{unique_id}")
-        os.makedirs(output_dir, exist_ok=True)
+        await blocking_io.makedirs(output_dir, exist_ok=True)
         
         # Save the uploaded file with a unique name to avoid conflicts
         file_ext = os.path.splitext(file.filename)[1]
@@ -39,70 +70,44 @@ async def upload_video(
         
         print(f"Saving file to: {file_path}")
         
-        # Save the file
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Save the file in chunks off the event loop
+        write_started = time.time()
+        file_size = await blocking_io.save_upload(file, file_path)
+        write_finished = time.time()
         
-        print(f"File saved successfully. Size: {os.path.getsize(file_path)} bytes")
+        print(f"File saved successfully. Size: {file_size} bytes")
         
-        # Set output path based on format
-        # Frontend sends: hls, ts, cmaf, dash
-        # - hls           -> HLS (.m3u8)
-        # - ts            -> HLS (.m3u8) but RTSP 프로토콜에서 사용 (TS 기반)
-        # - cmaf + hls    -> HLS (.m3u8) 로 취급 (CMAF-HLS 조합)
-        # - cmaf + dash   -> DASH (.mpd)
-        # - dash          -> DASH (.mpd)
-
-        original_media_format = media_format
-
-        if media_format == 'hls':
-            media_format = 'hls'
-            output_path = os.path.join(output_dir, 'playlist.m3u8')
-        elif media_format == 'ts':
-            # TS 포맷은 내부적으로 HLS 파이프라인을 사용하되,
-            # 스트리밍 프로토콜에서 RTSP 를 선택하도록 UI에서 제한함.
-            media_format = 'hls'
-            output_path = os.path.join(output_dir, 'playlist.m3u8')
-        elif media_format == 'cmaf':
-            # CMAF + HLS  -> HLS(.m3u8)
-            # CMAF + DASH -> DASH(.mpd) in 'dash' subdirectory
-            if streaming_protocol == 'hls':
-                media_format = 'hls'
-                output_path = os.path.join(output_dir, 'playlist.m3u8')
-            else:
-                media_format = 'dash'
-                dash_dir = os.path.join(output_dir, 'dash')
-                os.makedirs(dash_dir, exist_ok=True)
-                output_path = os.path.join(dash_dir, 'playlist.mpd')
-        elif media_format == 'dash':
-            # DASH -> DASH(.mpd) in 'dash' subdirectory
-            media_format = 'dash'
-            dash_dir = os.path.join(output_dir, 'dash')
-            os.makedirs(dash_dir, exist_ok=True)
-            output_path = os.path.join(dash_dir, 'playlist.mpd')
-        else:
-            # fallback: mp4 파일 그대로 저장하는 경우 등
-            output_path = os.path.join(output_dir, 'output.mp4')
+        media_format, output_path = await _resolve_output_path(output_dir, media_format, streaming_protocol)
             
         print(f"Output will be saved to: {output_path}")
         
         # Create task entry
-        task_id = len(conversion_tasks) + 1
+        task_id = conversion_tasks.next_id()
         conversion_tasks[task_id] = {
             'input': file_path,
+            'filename': saved_filename,
             'output': output_path,
             'media_format': media_format,
             'streaming_protocol': streaming_protocol,
             'segment_duration': int(segment_duration),
             'crf': int(crf),
             'resolution': resolution,
+            'profile': profile,
+            'deadline': deadline,
+            'priority': priority,
+            'preview': preview and streaming_protocol in ('hls', 'dash'),
             'status': 'pending',
             'progress': 0,
-            'error': None
+            'error': None,
+            'created_at': utc_now_iso()
         }
         
         print(f"Created task {task_id} for {file.filename}")
+
+        trace = trace_for(task_id)
+        trace.record('upload_receive', request_started, received_at, bytes=file_size)
+        trace.record('disk_write', write_started, write_finished, bytes=file_size)
+        trace.mark('queued')
         
         # Start conversion in the background
         try:
@@ -141,3 +146,93 @@ async def upload_video(
             conversion_tasks[task_id]['status'] = 'failed'
             conversion_tasks[task_id]['error'] = error_msg
         raise HTTPException(status_code=500, detail=error_msg)
+
+
+@router.post("/upload/stream/")
+async def upload_video_stream(
+    request: Request,
+    filename: str = Query(...),
+    media_format: str = Query(...),
+    streaming_protocol: str = Query(...),
+    segment_duration: int = Query(6),
+    crf: int = Query(20),
+    resolution: str = Query("source"),
+    profile: Optional[str] = Query(None)
+):
+    """
+    Streaming ingest: the raw request body is piped into ffmpeg while it is
+    still arriving (and teed to the uploads directory), so the encode overlaps
+    with the upload. Only pipe-friendly containers are accepted: MPEG-TS,
+    MKV/WebM, and MP4/MOV whose moov box precedes mdat (fragmented/faststart).
+    """
+    if streaming_protocol not in ('hls', 'dash'):
+        raise HTTPException(status_code=400, detail="Streaming ingest supports only hls and dash")
+    if profile and profile not in ENCODING_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding profile: {profile}")
+    reject_new_jobs()
+
+    request_started = getattr(request.state, 'request_started', time.time())
+    head, body = await peek_stream(request.stream())
+    if not is_pipe_friendly(filename, head):
+        raise HTTPException(
+            status_code=415,
+            detail="Container is not pipe friendly; use MPEG-TS, MKV, fragmented MP4 or /upload/"
+        )
+
+    task_id = None
+    try:
+        print(f"Received streaming upload request for file: {filename}")
+
+        await blocking_io.makedirs(UPLOAD_DIR, exist_ok=True)
+        await blocking_io.makedirs(OUTPUT_DIR, exist_ok=True)
+
+        file_base = os.path.splitext(os.path.basename(filename))[0]
+        unique_id = str(uuid.uuid4())[:8]
+        output_dir = os.path.join(OUTPUT_DIR, f"{file_base}_{unique_id}")
+        await blocking_io.makedirs(output_dir, exist_ok=True)
+
+        file_ext = os.path.splitext(filename)[1]
+        saved_filename = f"{file_base}_{unique_id}{file_ext}"
+        file_path = os.path.join(UPLOAD_DIR, saved_filename)
+
+        media_format, output_path = await _resolve_output_path(output_dir, media_format, streaming_protocol)
+
+        task_id = conversion_tasks.next_id()
+        conversion_tasks[task_id] = {
+            'input': file_path,
+            'filename': saved_filename,
+            'output': output_path,
+            'media_format': media_format,
+            'streaming_protocol': streaming_protocol,
+            'segment_duration': int(segment_duration),
+            'crf': int(crf),
+            'resolution': resolution,
+            'profile': profile,
+            'ingest': 'stream',
+            'status': 'pending',
+            'progress': 0,
+            'error': None,
+            'created_at': utc_now_iso()
+        }
+
+        # Returns once the body is fully received; the encode tail runs in the background
+        await ingest_stream(task_id, conversion_tasks, body)
+        trace_for(task_id).record('upload_receive', request_started, time.time(),
+                                  bytes=conversion_tasks[task_id].get('bytes_received', 0))
+
+        return {
+            "task_id": task_id,
+            "status": conversion_tasks[task_id]['status'],
+            "message": "Upload received, conversion finishing",
+            "output_path": output_path,
+            "stream_url": f"/api/v1/stream/{task_id}",
+            "status_url": f"/api/v1/tasks/{task_id}"
+        }
+
+    except Exception as e:
+        error_msg = f"Error during streaming upload: {str(e)}"
+        print(error_msg)
+        if task_id and task_id in conversion_tasks:
+            conversion_tasks[task_id]['status'] = 'failed'
+            conversion_tasks[task_id]['error'] = error_msg
+        raise HTTPException(status_code=500, detail=error_msg)
@@ -0,0 +1,77 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+import aiofiles
+
+# Bounded pool for filesystem calls made from async handlers, so slow network
+# storage stalls a worker thread instead of the event loop.
+FS_THREADS = int(os.environ.get("FS_THREADS", "8"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Created on first use and again after shutdown(), so a later app lifespan in
+# the same process (tests, embedded servers) gets a working pool
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FS_THREADS, thread_name_prefix="fs")
+        return _executor
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking callable on the filesystem thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), functools.partial(func, *args, **kwargs))
+
+
+async def makedirs(path: str, exist_ok: bool = True) -> None:
+    await run_blocking(os.makedirs, path, exist_ok=exist_ok)
+
+
+async def exists(path: str) -> bool:
+    return await run_blocking(os.path.exists, path)
+
+
+async def getsize(path: str) -> int:
+    return await run_blocking(os.path.getsize, path)
+
+
+async def listdir(path: str) -> List[str]:
+    """List a directory, returning an empty list if it does not exist"""
+    def _listdir():
+        if not os.path.isdir(path):
+            return []
+        return os.listdir(path)
+    return await run_blocking(_listdir)
+
+
+async def save_upload(upload_file, file_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> int:
+    """
+    Stream an UploadFile to disk in chunks without blocking the event loop.
+    Returns the number of bytes written.
+    """
+    written = 0
+    async with aiofiles.open(file_path, "wb") as f:
+        while True:
+            chunk = await upload_file.read(chunk_size)
+            if not chunk:
+                break
+            await f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        pool, _executor = _executor, None
+    if pool is not None:
+        pool.shutdown(wait=False)
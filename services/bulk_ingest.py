@@ -0,0 +1,362 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.task_store import utc_now_iso
+from services.video_converter import convert_video, resolve_output_path
+
+# Bulk ingest converts files that already sit on this host in place (no
+# upload, no copy) on a process pool, using the same converter as the API.
+# Progress is kept in an append-only journal so a run can be stopped and
+# restarted; interrupted HLS encodes continue from their checkpoint. The API
+# server imports completed entries from the journal into its task registry.
+#
+# Each worker process has its own encode_stats, cpu_allocator and preemption
+# state: priorities only order jobs within one worker, and a bulk job never
+# preempts (or is preempted by) another worker's or the API server's encodes.
+VIDEO_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.mkv', '.webm', '.avi', '.flv', '.ts', '.mts', '.m2ts')
+JOURNAL_NAME = '.bulk_ingest.jsonl'
+
+DEFAULT_SETTINGS = {
+    'media_format': 'hls',
+    'streaming_protocol': 'hls',
+    'segment_duration': 6,
+    'crf': 20,
+    'resolution': 'source',
+    'profile': None,
+    'deadline': None,
+    'priority': 'low',
+}
+
+
+def fingerprint(path: str) -> str:
+    """Size and mtime, so a file replaced after conversion is converted again"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def output_dir_for(output_root: str, path: str) -> str:
+    """Stable per-file output directory, so a restarted run finds its own checkpoint"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+    return os.path.join(output_root, f"{stem}_{digest}")
+
+
+def scan_files(paths: Iterable[str]) -> Iterator[str]:
+    """Video files under the given files/directories, as absolute paths in a stable order"""
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            if path.lower().endswith(VIDEO_EXTENSIONS):
+                yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(VIDEO_EXTENSIONS) and not name.startswith('.'):
+                    yield os.path.join(root, name)
+
+
+def settled_files(paths: Iterable[str], previous: Dict[str, Tuple[int, float]]) -> Tuple[List[str], Dict[str, Tuple[int, float]]]:
+    """
+    Files whose size and mtime did not change since the previous poll (i.e. no
+    longer being copied in), plus the signatures to compare against next time.
+    """
+    current: Dict[str, Tuple[int, float]] = {}
+    settled = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        current[path] = (stat.st_size, stat.st_mtime)
+        if previous.get(path) == current[path] and stat.st_size > 0:
+            settled.append(path)
+    return settled, current
+
+
+class IngestJournal:
+    """Append-only JSON-lines record of each file's state; the last entry per file wins"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        line = "\n"
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A run killed mid-write can leave a truncated last line
+                        continue
+                    self.entries[entry['path']] = entry
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a')
+        if not line.endswith("\n"):
+            self._file.write("\n")
+
+    def state(self, path: str, file_fingerprint: str) -> Optional[str]:
+        entry = self.entries.get(path)
+        if entry is None or entry.get('fingerprint') != file_fingerprint:
+            return None
+        return entry['state']
+
+    def record(self, path: str, state: str, **fields) -> None:
+        entry = {'path': path, 'state': state, 'at': utc_now_iso(), **fields}
+        self.entries[path] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for entry in self.entries.values():
+            counts[entry['state']] = counts.get(entry['state'], 0) + 1
+        return counts
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def convert_file(path: str, output_dir: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Process-pool worker: run one conversion through convert_video and report the outcome"""
+    media_format, output_path = resolve_output_path(output_dir, settings['media_format'], settings['streaming_protocol'])
+    task = {
+        'input': path,
+        'filename': os.path.basename(path),
+        'output': output_path,
+        'media_format': media_format,
+        'streaming_protocol': settings['streaming_protocol'],
+        'segment_duration': int(settings['segment_duration']),
+        'crf': int(settings['crf']),
+        'resolution': settings['resolution'],
+        'profile': settings['profile'],
+        'deadline': settings['deadline'],
+        'priority': settings['priority'],
+        'ingest': 'bulk',
+        'status': 'pending',
+        'progress': 0,
+        'error': None,
+        'created_at': utc_now_iso(),
+    }
+    tasks = {1: task}
+    asyncio.run(convert_video(1, tasks, output_dir))
+    return {'status': task['status'], 'error': task['error'], 'output': output_path, 'profile': task.get('profile'),
+            'media_format': media_format}
+
+
+class BulkIngest:
+    """Feeds local files to a pool of converter processes and journals their progress"""
+
+    def __init__(self, output_root: str, settings: Optional[Dict[str, Any]] = None,
+                 journal_path: Optional[str] = None, workers: Optional[int] = None, retry_failed: bool = False):
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        if self.settings['streaming_protocol'] not in ('hls', 'dash'):
+            raise ValueError("Bulk ingest supports only hls and dash")
+        self.output_root = output_root
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.retry_failed = retry_failed
+        self.journal = IngestJournal(journal_path or os.path.join(output_root, JOURNAL_NAME))
+        self.inflight: Dict[Future, str] = {}
+        self.results = {'completed': 0, 'failed': 0, 'cancelled': 0, 'skipped': 0}
+
+    def needs_conversion(self, path: str) -> bool:
+        state = self.journal.state(path, fingerprint(path))
+        if state == 'completed' or (state == 'failed' and not self.retry_failed):
+            return False
+        # 'started' means a previous run was stopped part way; run it again
+        return True
+
+    def _submit(self, pool: ProcessPoolExecutor, path: str) -> None:
+        output_dir = output_dir_for(self.output_root, path)
+        self.journal.record(path, 'started', fingerprint=fingerprint(path), output_dir=output_dir)
+        future = pool.submit(convert_file, path, output_dir, self.settings)
+        self.inflight[future] = path
+
+    def _collect(self, timeout: Optional[float] = None) -> None:
+        done, _ = wait(list(self.inflight), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            path = self.inflight.pop(future)
+            entry = self.journal.entries[path]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = {'status': 'failed', 'error': f"Worker error: {e}"}
+            state = outcome['status'] if outcome['status'] in ('completed', 'cancelled') else 'failed'
+            self.journal.record(path, state, fingerprint=entry['fingerprint'], output_dir=entry['output_dir'],
+                                output=outcome.get('output'), profile=outcome.get('profile'),
+                                error=outcome.get('error'), media_format=outcome.get('media_format'),
+                                streaming_protocol=self.settings['streaming_protocol'],
+                                segment_duration=int(self.settings['segment_duration']),
+                                crf=int(self.settings['crf']), resolution=self.settings['resolution'])
+            self.results[state] += 1
+            print(f"[{state}] {path}" + (f": {outcome['error']}" if outcome.get('error') else ""))
+
+    def run(self, paths: Iterable[str]) -> Dict[str, int]:
+        """Convert every video under `paths` that has not been converted yet"""
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for path in scan_files(paths):
+                if not self.needs_conversion(path):
+                    self.results['skipped'] += 1
+                    continue
+                # Keep the submission queue short so a stop loses little queued work
+                while len(self.inflight) >= self.workers * 2:
+                    self._collect()
+                self._submit(pool, path)
+            while self.inflight:
+                self._collect()
+        return self.results
+
+    def watch(self, folder: str, interval: float = 5.0, stop: Optional[threading.Event] = None) -> Dict[str, int]:
+        """Poll `folder` and convert new files once they stop growing, until `stop` is set"""
+        stop = stop or threading.Event()
+        signatures: Dict[str, Tuple[int, float]] = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while not stop.is_set():
+                settled, signatures = settled_files(scan_files([folder]), signatures)
+                queued = set(self.inflight.values())
+                for path in settled:
+                    if path not in queued and self.needs_conversion(path):
+                        self._submit(pool, path)
+                if self.inflight:
+                    self._collect(timeout=0)
+                stop.wait(interval)
+            while self.inflight:
+                self._collect()
+        return self.results
+
+    def close(self) -> None:
+        self.journal.close()
+
+
+BULK_IMPORT_INTERVAL = float(os.environ.get("BULK_IMPORT_INTERVAL", "30"))
+
+
+def read_journal(path: str) -> Dict[str, Dict[str, Any]]:
+    """Last entry per file of a journal (read-only; unlike IngestJournal it never opens it for writing)"""
+    entries: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry['path']] = entry
+    except OSError:
+        pass
+    return entries
+
+
+def _entry_time(entry: Dict[str, Any]) -> float:
+    """When a journal entry was written (epoch seconds), or now if it has no valid time"""
+    try:
+        return datetime.fromisoformat(entry['at']).replace(tzinfo=timezone.utc).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+class BulkResultImporter:
+    """
+    Registers files completed by the bulk ingest CLI as tasks of the API
+    server, so they can be found through /tasks and played through /stream.
+    The journal is re-read whenever it changes, while the CLI keeps running.
+    """
+
+    def __init__(self, journal_path: str, interval: float = BULK_IMPORT_INTERVAL):
+        self.journal_path = journal_path
+        self.interval = interval
+        # source path -> (fingerprint, task id)
+        self.registered: Dict[str, Tuple[str, int]] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _changed_entries(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            stat = os.stat(self.journal_path)
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return None
+        self._signature = signature
+        return read_journal(self.journal_path)
+
+    def register(self, conversion_tasks, entries: Dict[str, Dict[str, Any]]) -> List[int]:
+        """Add or update a completed task per journal entry; returns the task ids touched"""
+        touched = []
+        for path, entry in entries.items():
+            if entry.get('state') != 'completed' or not entry.get('output'):
+                continue
+            known = self.registered.get(path)
+            if known is not None and known[0] == entry.get('fingerprint'):
+                continue
+            output = entry['output']
+            protocol = entry.get('streaming_protocol') or ('dash' if output.endswith('.mpd') else 'hls')
+            task = {
+                'input': path,
+                'filename': os.path.basename(path),
+                'output': output,
+                'media_format': entry.get('media_format') or protocol,
+                'streaming_protocol': protocol,
+                'segment_duration': entry.get('segment_duration', DEFAULT_SETTINGS['segment_duration']),
+                'crf': entry.get('crf', DEFAULT_SETTINGS['crf']),
+                'resolution': entry.get('resolution', DEFAULT_SETTINGS['resolution']),
+                'profile': entry.get('profile'),
+                'ingest': 'bulk',
+                'status': 'completed',
+                'progress': 100,
+                'error': None,
+                'created_at': entry.get('at') or utc_now_iso(),
+            }
+            # A file converted again (it changed) keeps its task id
+            task_id = known[1] if known is not None else conversion_tasks.next_id()
+            # No coroutine writes to an imported task, so it need not wait out the spill delay
+            finished_at = min(_entry_time(entry), time.time() - conversion_tasks.spill_after)
+            conversion_tasks.put(task_id, task, finished_at=finished_at, spill=False)
+            self.registered[path] = (entry.get('fingerprint'), task_id)
+            touched.append(task_id)
+        return touched
+
+    async def import_once(self, conversion_tasks) -> List[int]:
+        from services import blocking_io
+        entries = await blocking_io.run_blocking(self._changed_entries)
+        if not entries:
+            return []
+        # Register in batches and spill between them, so a large journal never
+        # holds more than TASK_HOT_LIMIT tasks in memory or blocks on one big write
+        items = list(entries.items())
+        touched = []
+        for start in range(0, len(items), conversion_tasks.spill_batch):
+            touched += self.register(conversion_tasks, dict(items[start:start + conversion_tasks.spill_batch]))
+            await conversion_tasks.spill_idle()
+        if touched:
+            print(f"Registered {len(touched)} bulk-ingested file(s) from {self.journal_path}")
+        return touched
+
+    def start(self, conversion_tasks) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(conversion_tasks))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, conversion_tasks) -> None:
+        while True:
+            try:
+                await self.import_once(conversion_tasks)
+            except Exception as e:
+                print(f"Bulk journal import failed: {e}")
+            await asyncio.sleep(self.interval)
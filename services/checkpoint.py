@@ -0,0 +1,151 @@
+import os
+import json
+import glob
+from typing import Any, Dict, List, Optional, Tuple
+
+CHECKPOINT_FILE = 'checkpoint.json'
+RESUME_SUFFIX = '.resume.m3u8'
+
+# Task fields needed to restart a conversion from its checkpoint
+CHECKPOINT_FIELDS = (
+    'input', 'filename', 'output', 'media_format', 'streaming_protocol', 'segment_duration',
+    'crf', 'resolution', 'profile', 'priority', 'created_at', 'ingest', 'preview',
+)
+
+
+def checkpoint_path(output_path: str) -> str:
+    return os.path.join(os.path.dirname(output_path), CHECKPOINT_FILE)
+
+
+def write_checkpoint(task: Dict[str, Any], state: str) -> None:
+    """Persist the task parameters and its state ('running', 'completed', 'cancelled', ...)"""
+    data = {field: task.get(field) for field in CHECKPOINT_FIELDS}
+    data['state'] = state
+    path = checkpoint_path(task['output'])
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def find_interrupted(output_root: str) -> List[Dict[str, Any]]:
+    """Checkpoints left 'running' by a crash, restart or drain, or 'queued' by a drain"""
+    found = []
+    for pattern in (os.path.join(output_root, '*', CHECKPOINT_FILE),
+                    os.path.join(output_root, '*', '*', CHECKPOINT_FILE)):
+        for path in glob.glob(pattern):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get('state') in ('running', 'queued'):
+                found.append(data)
+    return found
+
+
+def parse_hls_playlist(playlist_path: str) -> Tuple[List[str], List[Tuple[List[str], str]], bool]:
+    """
+    Split a media playlist into header lines and segments.
+
+    Each segment is (tag lines, uri), where the tag lines include its #EXTINF.
+    Only segments that are listed are returned, which means ffmpeg had finished
+    writing them. The flag reports whether #EXT-X-ENDLIST was present.
+    """
+    header: List[str] = []
+    segments: List[Tuple[List[str], str]] = []
+    ended = False
+    if not os.path.exists(playlist_path):
+        return header, segments, ended
+    pending: List[str] = []
+    with open(playlist_path) as f:
+        for raw in f:
+            line = raw.strip()
+            if not line:
+                continue
+            if line == '#EXT-X-ENDLIST':
+                ended = True
+            elif line.startswith('#EXTINF') or line == '#EXT-X-DISCONTINUITY' or pending or segments:
+                # Once the first segment starts, tags belong to the next segment
+                if line.startswith('#'):
+                    pending.append(line)
+                else:
+                    segments.append((pending, line))
+                    pending = []
+            elif line.startswith('#'):
+                header.append(line)
+    return header, segments, ended
+
+
+def segment_duration(tags: List[str]) -> float:
+    for tag in tags:
+        if tag.startswith('#EXTINF:'):
+            return float(tag[len('#EXTINF:'):].split(',')[0])
+    return 0.0
+
+
+def write_hls_playlist(playlist_path: str, header: List[str], segments: List[Tuple[List[str], str]],
+                       ended: bool) -> None:
+    """Atomically write a media playlist"""
+    target = max([segment_duration(tags) for tags, _ in segments] or [0])
+    lines = []
+    for line in header:
+        if line.startswith('#EXT-X-TARGETDURATION'):
+            line = f'#EXT-X-TARGETDURATION:{int(target + 0.999)}'
+        elif ended and line.startswith('#EXT-X-PLAYLIST-TYPE'):
+            # Encodes write an EVENT playlist as they go; once complete it is VOD
+            line = '#EXT-X-PLAYLIST-TYPE:VOD'
+        lines.append(line)
+    for tags, uri in segments:
+        lines.extend(tags)
+        lines.append(uri)
+    if ended:
+        lines.append('#EXT-X-ENDLIST')
+    tmp_path = playlist_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, playlist_path)
+
+
+def finish_hls_playlist(playlist_path: str) -> None:
+    """Mark a completed encode's EVENT playlist as VOD"""
+    header, segments, _ = parse_hls_playlist(playlist_path)
+    if segments:
+        write_hls_playlist(playlist_path, header, segments, True)
+
+
+def fold_resume_playlist(playlist_path: str, ended: bool = False) -> Tuple[int, float]:
+    """
+    Merge the segments of an interrupted or finished resume run (written to a
+    side playlist) into the main playlist, with a discontinuity at the seam.
+    Returns the number of finished segments and the media time they cover.
+    """
+    header, segments, _ = parse_hls_playlist(playlist_path)
+    resume_path = playlist_path.replace('.m3u8', RESUME_SUFFIX)
+    resume_header, resume_segments, _ = parse_hls_playlist(resume_path)
+    if resume_segments:
+        first_tags, first_uri = resume_segments[0]
+        if segments and '#EXT-X-DISCONTINUITY' not in first_tags:
+            resume_segments[0] = (['#EXT-X-DISCONTINUITY'] + first_tags, first_uri)
+        segments.extend(resume_segments)
+        header = header or resume_header
+    if resume_segments or ended:
+        write_hls_playlist(playlist_path, header, segments, ended)
+    if os.path.exists(resume_path):
+        os.remove(resume_path)
+    return len(segments), sum(segment_duration(tags) for tags, _ in segments)
+
+
+def hls_resume_point(playlist_path: str) -> Optional[Tuple[int, float]]:
+    """
+    (next segment number, media offset) to resume an interrupted HLS encode from,
+    or None if there is nothing to resume.
+    """
+    _, segments, ended = parse_hls_playlist(playlist_path)
+    resume_path = playlist_path.replace('.m3u8', RESUME_SUFFIX)
+    if ended or not (segments or os.path.exists(resume_path)):
+        return None
+    count, offset = fold_resume_playlist(playlist_path)
+    if count == 0:
+        return None
+    return count, offset
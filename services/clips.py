@@ -0,0 +1,227 @@
+import os
+import copy
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Tuple
+
+from services import blocking_io, checkpoint
+from services.encoding_profiles import DEFAULT_PROFILE, audio_args, video_args
+from services.job_control import JobCancelled, JobInterrupted
+from services.video_converter import _run_ffmpeg
+
+# Clips and compilations are cut from segments that are already encoded.
+# Segments inside a range are referenced in place; only a segment cut by a
+# range boundary is re-encoded (HLS). Each range, and each trimmed segment,
+# starts after a discontinuity so players reset their timestamps there.
+TRIM_TOLERANCE = 0.05
+
+HLS_HEADER = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:0', '#EXT-X-MEDIA-SEQUENCE:0',
+              '#EXT-X-PLAYLIST-TYPE:VOD']
+DASH_NS = 'urn:mpeg:dash:schema:mpd:2011'
+_NS = {'mpd': DASH_NS}
+ET.register_namespace('', DASH_NS)
+ET.register_namespace('xsi', 'http://www.w3.org/2001/XMLSchema-instance')
+
+
+def parse_ranges(value: str) -> List[Tuple[int, float, float]]:
+    """'1:10-25,3:0-12.5' -> [(1, 10.0, 25.0), (3, 0.0, 12.5)]"""
+    ranges = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            task_part, time_part = item.split(':', 1)
+            start, end = time_part.split('-', 1)
+            ranges.append((int(task_part), float(start), float(end)))
+        except ValueError:
+            raise ValueError(f"Invalid range '{item}', expected task_id:start-end")
+    if not ranges:
+        raise ValueError("At least one range is required")
+    for _, start, end in ranges:
+        if start < 0 or end <= start:
+            raise ValueError(f"Invalid time range {start}-{end}")
+    return ranges
+
+
+def plan_hls_clip(sources: List[Tuple[str, float, float]], clip_dir: str) -> List[Dict[str, Any]]:
+    """
+    Segments of an HLS clip for [(source playlist, start, end)]. Each item has
+    the segment's duration, the index of its range in 'source', and either a
+    'uri' relative to `clip_dir` (reused as is) or a 'trim' of (source segment
+    path, offset, duration) to re-encode.
+    """
+    plan: List[Dict[str, Any]] = []
+    for index, (playlist_path, start, end) in enumerate(sources):
+        source_dir = os.path.dirname(playlist_path)
+        _, segments, _ = checkpoint.parse_hls_playlist(playlist_path)
+        position = 0.0
+        first_in_range = True
+        for tags, uri in segments:
+            seg_start = position
+            seg_end = position + checkpoint.segment_duration(tags)
+            position = seg_end
+            if seg_end <= start or seg_start >= end:
+                continue
+            clip_start, clip_end = max(start, seg_start), min(end, seg_end)
+            item: Dict[str, Any] = {
+                'source': index,
+                'duration': clip_end - clip_start,
+                # New range, or timestamps that jump inside the source (resumed encodes)
+                'discontinuity': bool(plan) and (first_in_range or '#EXT-X-DISCONTINUITY' in tags),
+            }
+            segment_path = os.path.join(source_dir, uri)
+            if clip_start - seg_start > TRIM_TOLERANCE or seg_end - clip_end > TRIM_TOLERANCE:
+                item['trim'] = (segment_path, clip_start - seg_start, clip_end - clip_start)
+            else:
+                item['uri'] = os.path.relpath(segment_path, clip_dir).replace(os.sep, '/')
+            # Re-encoded segments do not continue the timestamps of their neighbours
+            if plan and ('trim' in item or 'trim' in plan[-1]):
+                item['discontinuity'] = True
+            plan.append(item)
+            first_in_range = False
+    return plan
+
+
+def _iso_duration(seconds: float) -> str:
+    return f"PT{seconds:.3f}S"
+
+
+def _segment_template(representation, adaptation) -> Any:
+    template = representation.find('mpd:SegmentTemplate', _NS)
+    return template if template is not None else adaptation.find('mpd:SegmentTemplate', _NS)
+
+
+def _timeline(template) -> List[Tuple[int, int, int]]:
+    """(number, t, d) for every segment of a SegmentTemplate with a SegmentTimeline"""
+    segments = []
+    number = int(template.get('startNumber', '1'))
+    t = 0
+    for s in template.find('mpd:SegmentTimeline', _NS).findall('mpd:S', _NS):
+        t = int(s.get('t', t))
+        d = int(s.get('d'))
+        for _ in range(int(s.get('r', '0')) + 1):
+            segments.append((number, t, d))
+            number += 1
+            t += d
+    return segments
+
+
+def build_dash_clip(sources: List[Tuple[str, float, float]], clip_dir: str) -> Tuple[bytes, float]:
+    """
+    A multi-period MPD with one Period per (source MPD, start, end), each
+    pointing at the source's segments through a BaseURL. DASH ranges are
+    widened to whole segments, so nothing is re-encoded. Returns (MPD, duration).
+    """
+    root = None
+    periods = []
+    total = 0.0
+    for index, (mpd_path, start, end) in enumerate(sources):
+        source_root = ET.parse(mpd_path).getroot()
+        if root is None:
+            root = source_root
+        source_period = source_root.find('mpd:Period', _NS)
+        period = ET.Element(f'{{{DASH_NS}}}Period', {'id': str(index), 'start': _iso_duration(total)})
+        base_url = ET.SubElement(period, f'{{{DASH_NS}}}BaseURL')
+        base_url.text = os.path.relpath(os.path.dirname(mpd_path), clip_dir).replace(os.sep, '/') + '/'
+        period_duration = 0.0
+        for adaptation in source_period.findall('mpd:AdaptationSet', _NS):
+            adaptation = copy.deepcopy(adaptation)
+            for representation in adaptation.findall('mpd:Representation', _NS) or [adaptation]:
+                template = _segment_template(representation, adaptation)
+                timescale = int(template.get('timescale', '1'))
+                selected = [(n, t, d) for n, t, d in _timeline(template)
+                            if t / timescale < end and (t + d) / timescale > start]
+                if not selected:
+                    raise ValueError(f"Range {start}-{end} is outside {mpd_path}")
+                template.set('startNumber', str(selected[0][0]))
+                template.set('presentationTimeOffset', str(selected[0][1]))
+                timeline = template.find('mpd:SegmentTimeline', _NS)
+                for s in list(timeline):
+                    timeline.remove(s)
+                for i, (_, t, d) in enumerate(selected):
+                    attributes = {'t': str(t), 'd': str(d)} if i == 0 else {'d': str(d)}
+                    ET.SubElement(timeline, f'{{{DASH_NS}}}S', attributes)
+                period_duration = max(period_duration, sum(d for _, _, d in selected) / timescale)
+            period.append(adaptation)
+        period.set('duration', _iso_duration(period_duration))
+        periods.append(period)
+        total += period_duration
+
+    for old_period in root.findall('mpd:Period', _NS):
+        root.remove(old_period)
+    for period in periods:
+        root.append(period)
+    root.set('type', 'static')
+    root.set('mediaPresentationDuration', _iso_duration(total))
+    for attribute in ('availabilityStartTime', 'publishTime', 'minimumUpdatePeriod', 'timeShiftBufferDepth'):
+        root.attrib.pop(attribute, None)
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True), total
+
+
+def _write_file(path: str, data: bytes) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _trim_command(source_task: Dict[str, Any], segment_path: str, offset: float, duration: float, output_path: str) -> list:
+    """Re-encode part of one segment with the settings the source was encoded with"""
+    profile = source_task.get('profile') or DEFAULT_PROFILE
+    return [
+        'ffmpeg', '-y',
+        '-ss', f'{offset:.3f}',
+        '-i', segment_path,
+        '-t', f'{duration:.3f}',
+        *video_args(profile, int(source_task.get('crf', 20)), int(source_task.get('segment_duration', 6))),
+        *audio_args(profile),
+        '-f', 'mpegts',
+        output_path,
+    ]
+
+
+async def build_clip(task_id: int, conversion_tasks: dict, sources: List[Tuple[Dict[str, Any], float, float]]) -> None:
+    """Build the clip task's playlist from [(source task, start, end)] and update its status"""
+    task = conversion_tasks[task_id]
+    task['status'] = 'processing'
+    output_path = task['output']
+    clip_dir = os.path.dirname(output_path)
+    try:
+        await blocking_io.makedirs(clip_dir, exist_ok=True)
+        ranges = [(source['output'], start, end) for source, start, end in sources]
+        if task['streaming_protocol'] == 'dash':
+            mpd, duration = await blocking_io.run_blocking(build_dash_clip, ranges, clip_dir)
+            await blocking_io.run_blocking(_write_file, output_path, mpd)
+        else:
+            plan = await blocking_io.run_blocking(plan_hls_clip, ranges, clip_dir)
+            if not plan:
+                raise ValueError("The requested ranges contain no segments")
+            segments = []
+            trims = sum(1 for item in plan if 'trim' in item)
+            done = 0
+            for item in plan:
+                if 'trim' in item:
+                    segment_path, offset, duration = item['trim']
+                    uri = f"trim_{done:03d}.ts"
+                    cmd = _trim_command(sources[item['source']][0], segment_path, offset, duration, os.path.join(clip_dir, uri))
+                    await _run_ffmpeg(cmd, task_id, conversion_tasks, stage='trim')
+                    done += 1
+                    task['progress'] = int(done * 100 / trims)
+                else:
+                    uri = item['uri']
+                tags = (['#EXT-X-DISCONTINUITY'] if item['discontinuity'] else []) + [f"#EXTINF:{item['duration']:.6f},"]
+                segments.append((tags, uri))
+            await blocking_io.run_blocking(checkpoint.write_hls_playlist, output_path, HLS_HEADER, segments, True)
+            duration = sum(item['duration'] for item in plan)
+        task['duration'] = duration
+        task['progress'] = 100
+        task['status'] = 'completed'
+        print(f"Clip task {task_id} ready: {output_path} ({duration:.2f}s)")
+    except JobCancelled:
+        task['status'] = 'cancelled'
+    except JobInterrupted:
+        print(f"Clip task {task_id} was interrupted by a drain")
+    except Exception as e:
+        task['status'] = 'failed'
+        task['error'] = f"Error building clip: {e}"
+        print(task['error'])
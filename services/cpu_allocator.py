@@ -0,0 +1,155 @@
+import os
+import math
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+import psutil
+
+from services.job_control import preempted_tasks
+
+# Each ffmpeg job gets a thread budget and a CPU affinity set carved out of the
+# cores this process may use (affinity mask, capped by the cgroup CPU quota in
+# containers). A few cores are kept for the API process itself.
+# Off by default: the split is per process, so it only holds when a single API
+# process runs the encodes (one uvicorn worker, ingest_cli not running alongside)
+CPU_PARTITIONING = os.environ.get("CPU_PARTITIONING", "0") == "1"
+API_RESERVED_CORES = int(os.environ.get("API_RESERVED_CORES", "1"))
+# Pinning confines the event loop, the filesystem pool and upload threads to the
+# reserved cores, so it is a separate opt-in
+API_PIN_CORES = os.environ.get("API_PIN_CORES", "0") == "1"
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def cgroup_cpu_quota(root: str = CGROUP_ROOT) -> Optional[float]:
+    """CPUs allowed by the cgroup quota (v2 cpu.max or v1 cfs files), or None if unlimited"""
+    try:
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+            quota = int(f.read())
+        with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def _visible_cpus() -> List[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def with_thread_budget(cmd: list, threads: Optional[int]) -> list:
+    """Add an encoder thread count as an output option (just before the output URL)"""
+    if not threads:
+        return cmd
+    return cmd[:-1] + ['-threads', str(threads)] + cmd[-1:]
+
+
+def _set_affinity(process, cores: List[int]) -> None:
+    if process is None or process.returncode is not None:
+        return
+    try:
+        parent = psutil.Process(process.pid)
+        for proc in [parent] + parent.children(recursive=True):
+            proc.cpu_affinity(cores)
+    except (psutil.Error, AttributeError, OSError):
+        # No affinity support on this platform, or the process already exited
+        pass
+
+
+class CpuAllocator:
+    """
+    Splits the encode cores between running ffmpeg jobs.
+
+    Thread counts are fixed when a job starts (ffmpeg cannot change them later)
+    and sized to an equal share of the encode cores. Affinity sets are
+    rebalanced whenever a job starts or finishes: disjoint core ranges while
+    there are fewer jobs than cores, round-robin single cores beyond that.
+    Suspended (preempted) jobs keep their cores but are left out of the split.
+    """
+
+    def __init__(self, cpus: Optional[List[int]] = None, quota: Optional[float] = -1.0,
+                 reserved: int = API_RESERVED_CORES, enabled: bool = CPU_PARTITIONING,
+                 pin_api: bool = API_PIN_CORES):
+        self.enabled = enabled
+        self.pin_api = pin_api
+        visible = list(cpus) if cpus is not None else _visible_cpus()
+        self.quota = cgroup_cpu_quota() if quota == -1.0 else quota
+        # Under a quota, pin to as many cores as the quota pays for instead of spreading thin
+        pool = visible[:max(1, math.ceil(self.quota))] if self.quota else visible
+        if len(pool) > reserved > 0:
+            self.api_cores, self.encode_cores = pool[:reserved], pool[reserved:]
+        else:
+            self.api_cores, self.encode_cores = [], pool
+        self.jobs: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+
+    def _active(self) -> List[Hashable]:
+        return [key for key in self.jobs if key not in preempted_tasks]
+
+    def thread_budget(self) -> Optional[int]:
+        """Threads for a job about to start, or None when partitioning is off"""
+        if not self.enabled:
+            return None
+        return max(1, len(self.encode_cores) // (len(self._active()) + 1))
+
+    def start(self, key: Hashable, process, threads: Optional[int]) -> None:
+        if not self.enabled:
+            return
+        self.jobs[key] = {'process': process, 'threads': threads, 'cores': []}
+        self.rebalance()
+
+    def release(self, key: Hashable) -> None:
+        if self.jobs.pop(key, None) is not None:
+            self.rebalance()
+
+    def rebalance(self) -> None:
+        active = self._active()
+        cores = self.encode_cores
+        if not active:
+            return
+        if len(active) <= len(cores):
+            size, extra = divmod(len(cores), len(active))
+            start = 0
+            for index, key in enumerate(active):
+                end = start + size + (1 if index < extra else 0)
+                self._assign(key, cores[start:end])
+                start = end
+        else:
+            for index, key in enumerate(active):
+                self._assign(key, [cores[index % len(cores)]])
+
+    def _assign(self, key: Hashable, cores: List[int]) -> None:
+        job = self.jobs[key]
+        if job['cores'] != cores:
+            job['cores'] = cores
+            _set_affinity(job['process'], cores)
+
+    def pin_api_process(self) -> None:
+        """Keep this (API) process on the reserved cores when API_PIN_CORES is set; ffmpeg jobs are moved off them"""
+        if not self.enabled or not self.pin_api or not self.api_cores:
+            return
+        try:
+            psutil.Process().cpu_affinity(self.api_cores)
+            print(f"API pinned to CPUs {self.api_cores}; encodes use {self.encode_cores}")
+        except (psutil.Error, AttributeError, OSError) as e:
+            print(f"Could not pin API process: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "api_pinned": self.enabled and self.pin_api and bool(self.api_cores),
+            "cgroup_quota_cpus": self.quota,
+            "api_cores": self.api_cores,
+            "encode_cores": self.encode_cores,
+            "jobs": {str(key): {"threads": job['threads'], "cores": job['cores']} for key, job in self.jobs.items()},
+        }
+
+
+cpu_allocator = CpuAllocator()
@@ -0,0 +1,135 @@
+import os
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from services import blocking_io, checkpoint
+from services.job_control import encode_processes, interrupt_task
+
+# Drain mode, for redeploys: stop taking new jobs, give running encodes a grace
+# period to finish, then stop them at their last checkpoint. Queued jobs are
+# left as 'queued' checkpoints that the next instance picks up on startup.
+DRAIN_GRACE_SECONDS = float(os.environ.get("DRAIN_GRACE_SECONDS", "60"))
+DRAIN_POLL_INTERVAL = 0.5
+# How long interrupted encodes get to exit and record their state
+DRAIN_STOP_TIMEOUT = 10.0
+
+RUNNING_STATUSES = ('processing', 'preempted')
+
+
+def _running(conversion_tasks: dict) -> List[int]:
+    return [task_id for task_id, task in list(conversion_tasks.items()) if task.get('status') in RUNNING_STATUSES]
+
+
+class DrainController:
+    """Runs one drain per process lifetime and reports its progress"""
+
+    def __init__(self, grace: float = DRAIN_GRACE_SECONDS):
+        self.grace = grace
+        self.reset()
+
+    def reset(self) -> None:
+        self.state = 'serving'
+        self.grace_seconds = self.grace
+        self.reason: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.handed_off: List[int] = []
+        self.finished: List[int] = []
+        self.interrupted: List[int] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def draining(self) -> bool:
+        return self.state != 'serving'
+
+    def start(self, conversion_tasks: dict, reason: str, grace: Optional[float] = None) -> asyncio.Task:
+        """Begin draining (idempotent); the returned task completes once the drain is done"""
+        if self._task is None:
+            self.state = 'draining'
+            self.reason = reason
+            self.started_at = time.time()
+            self.grace_seconds = self.grace if grace is None else grace
+            print(f"Draining ({reason}): no new jobs are accepted")
+            self._task = asyncio.create_task(self._drain(conversion_tasks, self.grace_seconds))
+        return self._task
+
+    async def _drain(self, conversion_tasks: dict, grace: float) -> None:
+        await self._hand_off_queued(conversion_tasks)
+        # Suspended low-priority encodes would only use up the grace period
+        for task_id, task in list(conversion_tasks.items()):
+            if task.get('status') == 'preempted' and interrupt_task(task_id, conversion_tasks):
+                self.interrupted.append(task_id)
+
+        running = _running(conversion_tasks)
+        deadline = time.monotonic() + grace
+        while _running(conversion_tasks) and time.monotonic() < deadline:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+        left = _running(conversion_tasks)
+        self.finished = [task_id for task_id in running if task_id not in left]
+
+        # Out of time: stop the rest; their checkpoints stay resumable
+        for task_id in left:
+            if interrupt_task(task_id, conversion_tasks):
+                self.interrupted.append(task_id)
+        deadline = time.monotonic() + DRAIN_STOP_TIMEOUT
+        while any(task_id in encode_processes for task_id in self.interrupted) and time.monotonic() < deadline:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+        await self._stop_publishers()
+        self.state = 'drained'
+        self.finished_at = time.time()
+        print(f"Drain complete: {len(self.finished)} finished, {len(self.interrupted)} checkpointed, "
+              f"{len(self.handed_off)} handed off")
+
+    async def _hand_off_queued(self, conversion_tasks: dict) -> None:
+        """Persist jobs that have not started yet, for the next instance to run"""
+        for task_id, task in list(conversion_tasks.items()):
+            if task.get('status') != 'pending' or task.get('kind') == 'clip':
+                continue
+            if task.get('streaming_protocol') not in ('hls', 'dash') or not task.get('output'):
+                continue
+            try:
+                await blocking_io.makedirs(os.path.dirname(task['output']), exist_ok=True)
+                await blocking_io.run_blocking(checkpoint.write_checkpoint, task, 'queued')
+            except OSError as e:
+                print(f"Could not hand off task {task_id}: {e}")
+                continue
+            task['status'] = 'handed_off'
+            self.handed_off.append(task_id)
+
+    async def _stop_publishers(self) -> None:
+        """Stop RTSP servers and live channels, waiting for their ffmpeg processes to exit"""
+        from services.video_converter import _stop_rtsp_stream, rtsp_servers
+        from services.live_store import live_channels, stop_channel
+        for stream_id in list(rtsp_servers):
+            await _stop_rtsp_stream(stream_id)
+        for channel_id in list(live_channels):
+            try:
+                await stop_channel(channel_id)
+            except Exception as e:
+                print(f"Error stopping live channel {channel_id}: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "reason": self.reason,
+            "grace_seconds": self.grace_seconds,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "finished": self.finished,
+            "checkpointed": self.interrupted,
+            "handed_off": self.handed_off,
+        }
+
+
+def reject_new_jobs() -> None:
+    """Raise 503 for job-creating requests while the instance drains"""
+    if drain_controller.draining:
+        raise HTTPException(status_code=503, detail="Server is draining; submit the job to another instance",
+                            headers={"Retry-After": "30"})
+
+
+drain_controller = DrainController()
@@ -0,0 +1,307 @@
+import os
+import re
+import json
+import time
+import asyncio
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from fastapi import Request
+from fastapi.responses import Response
+
+from services import blocking_io
+
+# Edge mode: serve /static/output/... and /api/v1/chunks/... from an upstream
+# origin instance of this app, cached on local disk and in memory.
+EDGE_ORIGIN_URL = os.environ.get("EDGE_ORIGIN_URL")
+EDGE_CACHE_DIR = os.environ.get("EDGE_CACHE_DIR", "edge_cache")
+EDGE_MEMORY_BYTES = int(os.environ.get("EDGE_MEMORY_MB", "256")) * 1024 * 1024
+EDGE_DISK_BYTES = int(os.environ.get("EDGE_DISK_MB", "10240")) * 1024 * 1024
+EDGE_PREFETCH_SEGMENTS = int(os.environ.get("EDGE_PREFETCH_SEGMENTS", "2"))
+# Manifests can still change while the origin is encoding, so they expire quickly
+EDGE_MANIFEST_TTL = float(os.environ.get("EDGE_MANIFEST_TTL", "2"))
+
+EDGE_PATH_PREFIXES = ("/static/output/", "/api/v1/chunks/")
+MANIFEST_EXTENSIONS = ('.m3u8', '.mpd')
+_SEGMENT_NUMBER = re.compile(r'^(.*?)(\d+)(\.[A-Za-z0-9]+)$')
+
+
+def _is_manifest(name: str) -> bool:
+    return name.endswith(MANIFEST_EXTENSIONS)
+
+
+def next_segment_names(name: str, count: int):
+    """playlist_004.ts -> playlist_005.ts, ... (keeps zero padding); empty for non-numbered names"""
+    match = _SEGMENT_NUMBER.match(name)
+    if not match or _is_manifest(name):
+        return []
+    prefix, number, ext = match.groups()
+    width = len(number)
+    return [f"{prefix}{str(int(number) + i).zfill(width)}{ext}" for i in range(1, count + 1)]
+
+
+class EdgeCache:
+    """
+    Read-through cache in front of an origin instance.
+
+    Concurrent misses for the same key share one origin request, segments that
+    follow a requested segment are prefetched in the background, and entries
+    are written to disk so the cache survives restarts. Both tiers are LRUs
+    bounded by bytes; disk recency survives restarts through file mtimes.
+    """
+
+    def __init__(self, origin: str, cache_dir: str = EDGE_CACHE_DIR, memory_bytes: int = EDGE_MEMORY_BYTES,
+                 prefetch: int = EDGE_PREFETCH_SEGMENTS, manifest_ttl: float = EDGE_MANIFEST_TTL,
+                 disk_bytes: int = EDGE_DISK_BYTES):
+        self.origin = origin.rstrip('/')
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.prefetch = prefetch
+        self.manifest_ttl = manifest_ttl
+        self._memory: "OrderedDict[str, Tuple[bytes, Dict[str, Any]]]" = OrderedDict()
+        self._memory_used = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Background prefetches, held so they are not garbage-collected mid-run
+        self._prefetches: set = set()
+        # Disk entries (file name -> bytes incl. metadata), least recently used first.
+        # Disk reads and writes run on the filesystem pool, hence the lock
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_used = 0
+        self._disk_lock = threading.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "collapsed": 0,
+            "prefetched": 0, "origin_errors": 0, "origin_bytes": 0, "disk_evictions": 0,
+        }
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_disk_index()
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.origin,
+                timeout=httpx.Timeout(30.0),
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        for task in [*self._prefetches, *self._inflight.values()]:
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+    def _load_disk_index(self) -> None:
+        """Index the entries a previous run left on disk, oldest first, and trim them to the budget"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(('.json', '.tmp')):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+                size = stat.st_size + os.path.getsize(path + '.json')
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, size))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_used += size
+        with self._disk_lock:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """Remove least recently used disk entries until the cache fits (caller holds the lock)"""
+        while self._disk_used > self.disk_bytes and self._disk:
+            name, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            self.stats["disk_evictions"] += 1
+            path = os.path.join(self.cache_dir, name)
+            for victim in (path, path + '.json'):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+
+    def _fresh(self, key: str, meta: Dict[str, Any]) -> bool:
+        return not _is_manifest(meta.get('name', '')) or time.time() - meta['fetched_at'] < self.manifest_ttl
+
+    def _remember(self, key: str, body: bytes, meta: Dict[str, Any]) -> None:
+        if key in self._memory:
+            self._memory_used -= len(self._memory.pop(key)[0])
+        if len(body) > self.memory_bytes:
+            return
+        self._memory[key] = (body, meta)
+        self._memory_used += len(body)
+        while self._memory_used > self.memory_bytes:
+            _, (old_body, _) = self._memory.popitem(last=False)
+            self._memory_used -= len(old_body)
+
+    def _read_disk(self, key: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        path = self._disk_path(key)
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            with open(path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        name = os.path.basename(path)
+        with self._disk_lock:
+            if name in self._disk:
+                self._disk.move_to_end(name)
+        try:
+            # Keeps the LRU order across restarts
+            os.utime(path)
+        except OSError:
+            pass
+        return body, meta
+
+    def _write_disk(self, key: str, body: bytes, meta: Dict[str, Any]) -> None:
+        path = self._disk_path(key)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(body)
+        os.replace(path + '.tmp', path)
+        with open(path + '.json.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.json.tmp', path + '.json')
+        size = len(body) + os.path.getsize(path + '.json')
+        name = os.path.basename(path)
+        with self._disk_lock:
+            self._disk_used += size - self._disk.pop(name, 0)
+            self._disk[name] = size
+            self._evict_disk()
+
+    async def get(self, key: str, name: str) -> Tuple[int, bytes, Dict[str, Any]]:
+        """Return (status, body, meta) for an origin path + query, from cache when possible"""
+        cached = self._memory.get(key)
+        if cached and self._fresh(key, cached[1]):
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return 200, cached[0], cached[1]
+
+        cached = await blocking_io.run_blocking(self._read_disk, key)
+        if cached and self._fresh(key, cached[1]):
+            self.stats["disk_hits"] += 1
+            self._remember(key, *cached)
+            return 200, cached[0], cached[1]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["collapsed"] += 1
+            return await asyncio.shield(inflight)
+
+        self.stats["misses"] += 1
+        # The fetch is its own task, so a caller that disconnects does not abort it for the waiters
+        fetch = asyncio.create_task(self._fetch(key, name))
+        self._inflight[key] = fetch
+        fetch.add_done_callback(functools.partial(self._fetch_done, key))
+        return await asyncio.shield(fetch)
+
+    def _fetch_done(self, key: str, fetch: asyncio.Task) -> None:
+        if self._inflight.get(key) is fetch:
+            del self._inflight[key]
+        if not fetch.cancelled():
+            # Mark retrieved so a failure nobody awaited any more is not logged as never retrieved
+            fetch.exception()
+
+    async def _fetch(self, key: str, name: str) -> Tuple[int, bytes, Dict[str, Any]]:
+        try:
+            response = await self.client().get(key)
+        except httpx.HTTPError:
+            self.stats["origin_errors"] += 1
+            raise
+        meta = {
+            'name': name,
+            'content_type': response.headers.get('content-type', 'application/octet-stream'),
+            'fetched_at': time.time(),
+        }
+        if response.status_code != 200:
+            return response.status_code, response.content, meta
+        body = response.content
+        self.stats["origin_bytes"] += len(body)
+        self._remember(key, body, meta)
+        await blocking_io.run_blocking(self._write_disk, key, body, meta)
+        return 200, body, meta
+
+    def schedule_prefetch(self, key: str, name: str) -> None:
+        """Warm the cache with the segments following `name` in the same rendition"""
+        for next_name in next_segment_names(name, self.prefetch):
+            next_key = key.replace(name, next_name, 1) if name in key else None
+            if not next_key or next_key in self._memory or next_key in self._inflight:
+                continue
+            task = asyncio.create_task(self._prefetch(next_key, next_name))
+            self._prefetches.add(task)
+            task.add_done_callback(self._prefetches.discard)
+
+    async def _prefetch(self, key: str, name: str) -> None:
+        try:
+            status, _, _ = await self.get(key, name)
+            if status == 200:
+                self.stats["prefetched"] += 1
+        except Exception as e:
+            print(f"Edge prefetch failed for {key}: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "origin": self.origin,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_used,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_used,
+            "prefetches_running": len(self._prefetches),
+            "inflight": len(self._inflight),
+            **self.stats,
+        }
+
+
+edge_cache: Optional[EdgeCache] = None
+
+
+def _segment_name(request: Request) -> str:
+    if request.url.path.startswith("/api/v1/chunks/"):
+        return request.query_params.get("chunk_name", "")
+    return request.url.path.rsplit("/", 1)[-1]
+
+
+def install_edge_cache(app, origin: str) -> EdgeCache:
+    """Route segment and manifest requests through the edge cache instead of local files"""
+    global edge_cache
+    edge_cache = EdgeCache(origin)
+    cache = edge_cache
+
+    @app.middleware("http")
+    async def edge_cache_middleware(request: Request, call_next):
+        path = request.url.path
+        if request.method != "GET" or not path.startswith(EDGE_PATH_PREFIXES):
+            return await call_next(request)
+        key = path + (f"?{request.url.query}" if request.url.query else "")
+        name = _segment_name(request)
+        try:
+            status, body, meta = await cache.get(key, name)
+        except httpx.HTTPError as e:
+            return Response(content=f"Origin unavailable: {e}", status_code=502)
+        if status == 200:
+            cache.schedule_prefetch(key, name)
+        return Response(
+            content=body,
+            status_code=status,
+            media_type=meta['content_type'],
+            headers={"Access-Control-Allow-Origin": "*"},
+        )
+
+    @app.on_event("shutdown")
+    async def close_edge_cache():
+        await cache.close()
+
+    print(f"Edge cache mode: serving segments from {origin}")
+    return cache
@@ -0,0 +1,204 @@
+import os
+import asyncio
+from typing import Any, Dict, List, Optional
+
+# Named encoding profiles. Every ffmpeg command in the converter takes its
+# preset / tune / GOP / rate-control / audio settings from here.
+#   gop_seconds: keyframe interval; None aligns keyframes with the segment duration
+#   rate_control: 'crf' uses the job's CRF; 'vbv' uses a fixed bitrate ladder rung
+ENCODING_PROFILES: Dict[str, Dict[str, Any]] = {
+    'archive': {
+        'preset': 'slow',
+        'tune': None,
+        'gop_seconds': None,
+        'rate_control': {'mode': 'crf'},
+        'audio': {'codec': 'aac', 'bitrate': '160k', 'channels': 2},
+    },
+    'high': {
+        'preset': 'medium',
+        'tune': None,
+        'gop_seconds': None,
+        'rate_control': {'mode': 'crf'},
+        'audio': {'codec': 'aac', 'bitrate': '128k', 'channels': 2},
+    },
+    'balanced': {
+        'preset': 'veryfast',
+        'tune': None,
+        'gop_seconds': None,
+        'rate_control': {'mode': 'crf'},
+        'audio': {'codec': 'aac', 'bitrate': '128k', 'channels': 2},
+    },
+    'fast': {
+        'preset': 'superfast',
+        'tune': None,
+        'gop_seconds': None,
+        'rate_control': {'mode': 'crf'},
+        'audio': {'codec': 'aac', 'bitrate': '128k', 'channels': 2},
+    },
+    'ultrafast': {
+        'preset': 'ultrafast',
+        'tune': None,
+        'gop_seconds': None,
+        'rate_control': {'mode': 'crf'},
+        'audio': {'codec': 'aac', 'bitrate': '96k', 'channels': 2},
+    },
+    'live': {
+        'preset': 'veryfast',
+        'tune': 'zerolatency',
+        'gop_seconds': 2,
+        'rate_control': {'mode': 'crf'},
+        'audio': {'codec': 'aac', 'bitrate': '128k', 'channels': 2},
+    },
+    'ladder_2000k': {
+        'preset': 'medium',
+        'tune': None,
+        'gop_seconds': 2,
+        'rate_control': {'mode': 'vbv', 'bitrate': '2000k', 'maxrate': '2200k', 'bufsize': '4000k',
+                         'profile': 'high', 'level': '4.0'},
+        'audio': {'codec': 'aac', 'bitrate': '128k', 'channels': 2},
+    },
+}
+
+# Profiles the policy may choose from, best compression first
+PROFILE_TIERS: List[str] = ['archive', 'high', 'balanced', 'fast', 'ultrafast']
+DEFAULT_PROFILE = 'balanced'
+
+# Turnaround target used when an upload does not give its own deadline
+DEFAULT_DEADLINE_SECONDS = float(os.environ.get("ENCODE_DEADLINE_SECONDS", "600"))
+
+# Starting guesses for encode speed (media seconds per wall second) per preset,
+# replaced by measurements from this host as jobs finish
+PRIOR_SPEEDS: Dict[str, float] = {
+    'slow': 0.6,
+    'medium': 1.2,
+    'veryfast': 3.5,
+    'superfast': 5.0,
+    'ultrafast': 8.0,
+}
+SPEED_SMOOTHING = 0.3
+
+
+def get_profile(name: Optional[str]) -> Dict[str, Any]:
+    if name not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile: {name}")
+    return ENCODING_PROFILES[name]
+
+
+def video_args(name: str, crf: int = 20, segment_duration: Optional[int] = None,
+               stream_index: Optional[int] = None) -> List[str]:
+    """
+    ffmpeg libx264 options for a profile. With `stream_index` the per-stream
+    options are written with a stream specifier (e.g. -c:v:0) for multi-output ladders.
+    """
+    profile = get_profile(name)
+    spec = f':v:{stream_index}' if stream_index is not None else ':v'
+    args = [f'-c{spec}', 'libx264', f'-preset{spec}', profile['preset']]
+    if profile['tune']:
+        args.extend([f'-tune{spec}', profile['tune']])
+
+    rate_control = profile['rate_control']
+    if rate_control['mode'] == 'crf':
+        args.extend([f'-crf{spec}', str(crf)])
+    else:
+        args.extend([
+            f'-b{spec}', rate_control['bitrate'],
+            f'-maxrate{spec}', rate_control['maxrate'],
+            f'-bufsize{spec}', rate_control['bufsize'],
+        ])
+        if rate_control.get('profile'):
+            args.extend([f'-profile{spec}', rate_control['profile']])
+        if rate_control.get('level'):
+            args.extend([f'-level{spec}', rate_control['level']])
+
+    gop_seconds = profile['gop_seconds'] or segment_duration
+    if gop_seconds:
+        # Time-based keyframes keep segment boundaries aligned regardless of frame rate
+        args.extend(['-force_key_frames', f'expr:gte(t,n_forced*{gop_seconds})', '-sc_threshold', '0'])
+    return args
+
+
+def audio_args(name: str, stream_index: Optional[int] = None) -> List[str]:
+    audio = get_profile(name)['audio']
+    spec = f':a:{stream_index}' if stream_index is not None else ':a'
+    return [f'-c{spec}', audio['codec'], f'-b{spec}', audio['bitrate'], '-ac', str(audio['channels'])]
+
+
+class EncodeStats:
+    """Measured encode speed per preset on this host, plus the number of running encodes"""
+
+    def __init__(self):
+        self.speeds: Dict[str, float] = dict(PRIOR_SPEEDS)
+        self.samples: Dict[str, int] = {}
+        self.active_jobs = 0
+
+    def job_started(self) -> None:
+        self.active_jobs += 1
+
+    def job_finished(self) -> None:
+        self.active_jobs = max(0, self.active_jobs - 1)
+
+    def record(self, preset: str, media_seconds: float, wall_seconds: float, concurrent_jobs: int = 1) -> None:
+        """
+        Record a finished encode. The observed speed is scaled by the number of
+        encodes that shared the host so the stored value is the single-job speed.
+        """
+        if media_seconds <= 0 or wall_seconds <= 0:
+            return
+        speed = media_seconds / wall_seconds * max(1, concurrent_jobs)
+        previous = self.speeds.get(preset)
+        if previous is None or not self.samples.get(preset):
+            self.speeds[preset] = speed
+        else:
+            self.speeds[preset] = previous + SPEED_SMOOTHING * (speed - previous)
+        self.samples[preset] = self.samples.get(preset, 0) + 1
+
+    def estimate_seconds(self, profile_name: str, media_seconds: float, active_jobs: Optional[int] = None) -> float:
+        """Estimated wall time to encode `media_seconds` when sharing the host with running encodes"""
+        active = self.active_jobs if active_jobs is None else active_jobs
+        speed = self.speeds.get(get_profile(profile_name)['preset'], 1.0)
+        return media_seconds / speed * (active + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "active_jobs": self.active_jobs,
+            "speeds": {preset: round(speed, 3) for preset, speed in self.speeds.items()},
+            "samples": dict(self.samples),
+        }
+
+
+encode_stats = EncodeStats()
+
+
+def select_profile(media_seconds: Optional[float], deadline_seconds: Optional[float] = None,
+                   active_jobs: Optional[int] = None, stats: EncodeStats = encode_stats) -> str:
+    """
+    Pick the best-compressing tier expected to finish within the deadline given
+    the current number of running encodes. Falls back to the fastest tier when
+    nothing fits, and to the default profile when the duration is unknown.
+    """
+    if not media_seconds:
+        return DEFAULT_PROFILE
+    deadline = deadline_seconds if deadline_seconds else DEFAULT_DEADLINE_SECONDS
+    for name in PROFILE_TIERS:
+        if stats.estimate_seconds(name, media_seconds, active_jobs) <= deadline:
+            return name
+    return PROFILE_TIERS[-1]
+
+
+async def probe_duration(input_path: str) -> Optional[float]:
+    """Media duration in seconds via ffprobe, or None if it cannot be determined"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            input_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        if process.returncode != 0:
+            return None
+        return float(stdout.decode().strip())
+    except (OSError, ValueError):
+        return None
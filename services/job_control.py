@@ -0,0 +1,139 @@
+from typing import Any, Dict, Set
+
+import psutil
+
+PRIORITIES = ('high', 'normal', 'low')
+
+# Running ffmpeg encode processes by task id, with the job's priority
+encode_processes: Dict[int, Any] = {}
+encode_priorities: Dict[int, str] = {}
+# Low-priority jobs currently suspended to make room for high-priority work
+preempted_tasks: Set[int] = set()
+
+
+class JobCancelled(Exception):
+    """Raised inside the converter when a task was cancelled by the user"""
+
+
+class JobInterrupted(Exception):
+    """Raised inside the converter when a drain stopped the task; its checkpoint stays resumable"""
+
+
+def kill_process_tree(process) -> None:
+    """Terminate an ffmpeg process and anything it spawned"""
+    if not process or process.returncode is not None:
+        return
+    try:
+        parent = psutil.Process(process.pid)
+        children = parent.children(recursive=True)
+        for child in children:
+            child.terminate()
+        parent.terminate()
+        # Stopped processes cannot act on SIGTERM until they are continued
+        for proc in children + [parent]:
+            try:
+                proc.resume()
+            except psutil.Error:
+                pass
+    except psutil.NoSuchProcess:
+        pass
+
+
+def _set_suspended(process, suspended: bool) -> None:
+    try:
+        parent = psutil.Process(process.pid)
+        for proc in [parent] + parent.children(recursive=True):
+            if suspended:
+                proc.suspend()
+            else:
+                proc.resume()
+    except psutil.NoSuchProcess:
+        pass
+
+
+def register_encode(task_id: int, process, priority: str, conversion_tasks: dict) -> None:
+    """
+    Track a running encode. A high-priority job suspends every running
+    low-priority encode until no high-priority work is left; a new low-priority
+    job starts suspended if high-priority work is already running.
+    """
+    encode_processes[task_id] = process
+    encode_priorities[task_id] = priority
+    if priority == 'high':
+        for other_id, other_priority in list(encode_priorities.items()):
+            if other_priority == 'low' and other_id not in preempted_tasks:
+                _preempt(other_id, conversion_tasks)
+    elif priority == 'low' and 'high' in encode_priorities.values():
+        _preempt(task_id, conversion_tasks)
+
+
+def unregister_encode(task_id: int, conversion_tasks: dict) -> None:
+    encode_processes.pop(task_id, None)
+    priority = encode_priorities.pop(task_id, None)
+    preempted_tasks.discard(task_id)
+    if priority == 'high' and 'high' not in encode_priorities.values():
+        for other_id in list(preempted_tasks):
+            _resume(other_id, conversion_tasks)
+
+
+def _rebalance_cores() -> None:
+    # Imported here: cpu_allocator imports this module for preempted_tasks
+    from services.cpu_allocator import cpu_allocator
+    cpu_allocator.rebalance()
+
+
+def _preempt(task_id: int, conversion_tasks: dict) -> None:
+    process = encode_processes.get(task_id)
+    if process is None or process.returncode is not None:
+        return
+    _set_suspended(process, True)
+    preempted_tasks.add(task_id)
+    # The suspended job's cores go to the jobs still running
+    _rebalance_cores()
+    task = conversion_tasks.get(task_id)
+    if task is not None and task.get('status') == 'processing':
+        task['status'] = 'preempted'
+    print(f"Preempted low-priority task {task_id}")
+
+
+def _resume(task_id: int, conversion_tasks: dict) -> None:
+    preempted_tasks.discard(task_id)
+    process = encode_processes.get(task_id)
+    if process is None or process.returncode is not None:
+        return
+    _set_suspended(process, False)
+    _rebalance_cores()
+    task = conversion_tasks.get(task_id)
+    if task is not None and task.get('status') == 'preempted':
+        task['status'] = 'processing'
+    print(f"Resumed task {task_id}")
+
+
+def cancel_task(task_id: int, conversion_tasks: dict) -> bool:
+    """
+    Mark a task cancelled and kill its ffmpeg tree. Returns False if the task
+    had already finished.
+    """
+    task = conversion_tasks[task_id]
+    if task.get('status') in ('completed', 'failed', 'cancelled', 'interrupted', 'handed_off'):
+        return False
+    task['status'] = 'cancelled'
+    process = encode_processes.get(task_id)
+    if process is not None:
+        kill_process_tree(process)
+    return True
+
+
+def interrupt_task(task_id: int, conversion_tasks: dict) -> bool:
+    """
+    Stop a running task so the next instance can resume it from its
+    checkpoint. Returns False if the task had already finished.
+    """
+    task = conversion_tasks[task_id]
+    if task.get('status') not in ('pending', 'processing', 'preempted'):
+        return False
+    task['status'] = 'interrupted'
+    process = encode_processes.get(task_id)
+    if process is not None:
+        kill_process_tree(process)
+    return True
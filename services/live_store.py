@@ -0,0 +1,243 @@
+import os
+import time
+import uuid
+import secrets
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from services.encoding_profiles import audio_args, video_args
+from services.job_control import kill_process_tree
+from services.cpu_allocator import cpu_allocator, with_thread_budget
+
+# Live channels take a local push feed, and ffmpeg publishes the packaged
+# segments and playlists back to this app with HTTP PUT. They are kept in a
+# bounded in-memory ring buffer, so live channels never touch static/output.
+LIVE_BIND_HOST = os.environ.get("LIVE_BIND_HOST", "127.0.0.1")
+# Where ffmpeg PUTs its output. Unset: this server's own address, from the request creating the channel
+LIVE_PUBLISH_BASE = os.environ.get("LIVE_PUBLISH_BASE")
+LIVE_DEFAULT_PORT = int(os.environ.get("PORT", "8000"))
+# Ended or failed channels stay listed (and playable to the end) this long, then are dropped
+LIVE_ENDED_TTL = float(os.environ.get("LIVE_ENDED_TTL", "300"))
+LIVE_MAX_SEGMENT_BYTES = int(os.environ.get("LIVE_MAX_CHANNEL_MB", "256")) * 1024 * 1024
+
+DEFAULT_INGEST_PORTS = {'rtmp': 1935, 'srt': 9000, 'tcp': 9100}
+MANIFEST_NAMES = {'hls': 'index.m3u8', 'dash': 'manifest.mpd'}
+
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.mpd': 'application/dash+xml',
+    '.ts': 'video/MP2T',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+}
+
+
+def publish_base(server: Optional[tuple] = None) -> str:
+    """Base URL the channel's ffmpeg publishes to: LIVE_PUBLISH_BASE, or the address this server listens on"""
+    if LIVE_PUBLISH_BASE:
+        return LIVE_PUBLISH_BASE.rstrip('/')
+    host, port = server if server else ('127.0.0.1', LIVE_DEFAULT_PORT)
+    if host in ('0.0.0.0', '::', '', None):
+        host = '127.0.0.1'
+    elif ':' in host:
+        host = f"[{host}]"
+    return f"http://{host}:{port}/api/v1/live"
+
+
+def content_type_for(name: str) -> str:
+    return CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+
+
+class LiveChannel:
+    """
+    A live channel's packaged output. Manifests are replaced on every PUT;
+    segments go into a ring buffer holding the playlist window plus a few
+    extra segments for players that are slightly behind, bounded by bytes too.
+    """
+
+    def __init__(self, channel_id: str, protocol: str, ingest: str, port: int,
+                 segment_duration: int, window: int, crf: int, publish_url: Optional[str] = None):
+        self.channel_id = channel_id
+        # Secret part of the publish URL: only this channel's ffmpeg can write into it
+        self.ingest_token = secrets.token_urlsafe(16)
+        self.publish_url = publish_url or publish_base()
+        self.protocol = protocol
+        self.ingest = ingest
+        self.port = port
+        self.segment_duration = segment_duration
+        self.window = window
+        self.crf = crf
+        self.max_segments = window * 2
+        self.manifests: Dict[str, bytes] = {}
+        self.segments: "OrderedDict[str, bytes]" = OrderedDict()
+        self.segment_bytes = 0
+        self.process = None
+        self.status = 'waiting'
+        self.created_at = time.time()
+        self.ended_at: Optional[float] = None
+        self.last_write: Optional[float] = None
+        self.segments_received = 0
+        self.bytes_received = 0
+
+    @property
+    def manifest_name(self) -> str:
+        return MANIFEST_NAMES[self.protocol]
+
+    def ingest_url(self) -> str:
+        if self.ingest == 'rtmp':
+            return f"rtmp://{LIVE_BIND_HOST}:{self.port}/live/{self.channel_id}"
+        if self.ingest == 'srt':
+            return f"srt://{LIVE_BIND_HOST}:{self.port}"
+        return f"tcp://{LIVE_BIND_HOST}:{self.port}"
+
+    def put(self, name: str, data: bytes) -> None:
+        self.last_write = time.time()
+        self.bytes_received += len(data)
+        if name.endswith(('.m3u8', '.mpd')):
+            self.manifests[name] = data
+            if self.status == 'waiting':
+                self.status = 'live'
+            return
+        if name in self.segments:
+            self.segment_bytes -= len(self.segments.pop(name))
+        # Init segments are needed for the whole session, keep them out of the ring
+        if name.startswith('init'):
+            self.manifests[name] = data
+            return
+        self.segments[name] = data
+        self.segment_bytes += len(data)
+        self.segments_received += 1
+        while self.segments and (len(self.segments) > self.max_segments
+                                 or self.segment_bytes > LIVE_MAX_SEGMENT_BYTES):
+            _, old = self.segments.popitem(last=False)
+            self.segment_bytes -= len(old)
+
+    def delete(self, name: str) -> None:
+        data = self.segments.pop(name, None)
+        if data is not None:
+            self.segment_bytes -= len(data)
+
+    def get(self, name: str) -> Optional[bytes]:
+        if name in self.manifests:
+            return self.manifests[name]
+        return self.segments.get(name)
+
+    def build_command(self) -> list:
+        publish = f"{self.publish_url}/{self.channel_id}/ingest/{self.ingest_token}"
+        if self.ingest == 'rtmp':
+            cmd = ['ffmpeg', '-listen', '1', '-i', self.ingest_url()]
+        elif self.ingest == 'srt':
+            cmd = ['ffmpeg', '-i', f"{self.ingest_url()}?mode=listener"]
+        else:
+            cmd = ['ffmpeg', '-f', 'mpegts', '-i', f"{self.ingest_url()}?listen=1"]
+
+        cmd.extend([
+            *video_args('live', self.crf, self.segment_duration),
+            *audio_args('live'),
+            '-method', 'PUT',
+            '-http_persistent', '1',
+        ])
+        if self.protocol == 'hls':
+            cmd.extend([
+                '-f', 'hls',
+                '-hls_time', str(self.segment_duration),
+                '-hls_list_size', str(self.window),
+                '-hls_flags', 'delete_segments+independent_segments',
+                '-hls_segment_filename', f"{publish}/segment_%05d.ts",
+                f"{publish}/{self.manifest_name}",
+            ])
+        else:
+            cmd.extend([
+                '-f', 'dash',
+                '-seg_duration', str(self.segment_duration),
+                '-window_size', str(self.window),
+                '-extra_window_size', '2',
+                '-remove_at_exit', '1',
+                '-use_template', '1',
+                '-use_timeline', '1',
+                '-adaptation_sets', 'id=0,streams=v id=1,streams=a',
+                '-init_seg_name', 'init-stream$RepresentationID$.$ext$',
+                '-media_seg_name', 'chunk-stream$RepresentationID$-$Number%05d$.$ext$',
+                f"{publish}/{self.manifest_name}",
+            ])
+        return cmd
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "channel_id": self.channel_id,
+            "status": self.status,
+            "protocol": self.protocol,
+            "ingest_url": self.ingest_url(),
+            "playback_url": f"/api/v1/live/{self.channel_id}/{self.manifest_name}",
+            "segment_duration": self.segment_duration,
+            "window": self.window,
+            "segments_buffered": len(self.segments),
+            "buffered_bytes": self.segment_bytes,
+            "segments_received": self.segments_received,
+            "bytes_received": self.bytes_received,
+        }
+
+
+# Active live channels by id
+live_channels: Dict[str, LiveChannel] = {}
+# Channel watchers end channels and evict them after the TTL; held here until they finish
+_watchers: Set[asyncio.Task] = set()
+
+
+async def start_channel(protocol: str = 'hls', ingest: str = 'rtmp', port: Optional[int] = None,
+                        segment_duration: int = 2, window: int = 6, crf: int = 23,
+                        server: Optional[tuple] = None) -> LiveChannel:
+    """Create a channel and start the ffmpeg listener that packages its feed"""
+    if protocol not in MANIFEST_NAMES:
+        raise ValueError(f"Unsupported live protocol: {protocol}")
+    if ingest not in DEFAULT_INGEST_PORTS:
+        raise ValueError(f"Unsupported ingest type: {ingest}")
+    port = port or DEFAULT_INGEST_PORTS[ingest]
+    for other in live_channels.values():
+        if other.port == port and other.status in ('waiting', 'live'):
+            raise ValueError(f"Ingest port {port} is already used by channel {other.channel_id}")
+
+    channel = LiveChannel(str(uuid.uuid4())[:8], protocol, ingest, port, segment_duration, window, crf,
+                          publish_base(server))
+    threads = cpu_allocator.thread_budget()
+    cmd = with_thread_budget(channel.build_command(), threads)
+    print(f"Starting live channel {channel.channel_id}: {' '.join(cmd)}")
+    channel.process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    live_channels[channel.channel_id] = channel
+    cpu_allocator.start(f"live:{channel.channel_id}", channel.process, threads)
+    watcher = asyncio.create_task(_watch_channel(channel))
+    _watchers.add(watcher)
+    watcher.add_done_callback(_watchers.discard)
+    return channel
+
+
+async def _watch_channel(channel: LiveChannel) -> None:
+    _, error = await channel.process.communicate()
+    cpu_allocator.release(f"live:{channel.channel_id}")
+    if channel.status == 'stopped':
+        return
+    channel.status = 'ended' if channel.process.returncode == 0 else 'failed'
+    channel.ended_at = time.time()
+    if channel.status == 'failed':
+        print(f"Live channel {channel.channel_id} ffmpeg exited: {error.decode(errors='replace')[-2000:]}")
+    # Let players finish the buffered window, then release the channel and its segments
+    await asyncio.sleep(LIVE_ENDED_TTL)
+    if live_channels.get(channel.channel_id) is channel:
+        del live_channels[channel.channel_id]
+        channel.segments.clear()
+        channel.manifests.clear()
+        channel.segment_bytes = 0
+
+
+async def stop_channel(channel_id: str) -> None:
+    channel = live_channels.pop(channel_id)
+    channel.status = 'stopped'
+    if channel.process is not None:
+        kill_process_tree(channel.process)
+        await channel.process.wait()
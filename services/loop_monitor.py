@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from typing import Deque, Dict, Any, Optional
+
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", "0.25"))
+LOOP_LAG_SAMPLES = 1000
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LoopLagMonitor:
+    """
+    Measures event-loop stalls.
+
+    A coroutine on the loop wakes every `interval` seconds and records how late
+    it was woken. A watchdog thread watches the last tick; when the loop has not
+    ticked for longer than `threshold` it captures the loop thread's stack, so
+    the blocking call site shows up in the log while the stall is happening.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD,
+                 samples: int = LOOP_LAG_SAMPLES):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: Deque[float] = deque(maxlen=samples)
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.last_stall: Optional[Dict[str, Any]] = None
+        self._last_tick = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._reported_tick: Optional[float] = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_tick = now
+            self.lags.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > self.threshold:
+                self.stall_count += 1
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            tick = self._last_tick
+            stalled_for = time.monotonic() - tick
+            if stalled_for <= self.threshold or self._reported_tick == tick:
+                continue
+            # Report each stall once, from the first sample over the threshold
+            self._reported_tick = tick
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>"
+            self.last_stall = {
+                "stalled_for_ms": round(stalled_for * 1000, 1),
+                "at": time.time(),
+                "stack": stack,
+            }
+            print(f"Event loop stalled for {stalled_for * 1000:.0f} ms, call site:\n{stack}")
+
+    def stats(self) -> Dict[str, Any]:
+        lags = list(self.lags)
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": len(lags),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "p99_lag_ms": round(_percentile(lags, 99) * 1000, 2),
+            "stall_count": self.stall_count,
+            "last_stall": self.last_stall,
+        }
+
+
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,274 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+import cProfile
+import functools
+import pstats
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services import blocking_io
+
+# On-demand profiling of the running process. 'sample' mode walks the stacks
+# of the event-loop thread (or every thread) from a background thread, so it
+# sees time spent under each route handler and converter coroutine and can be
+# filtered to them; 'cprofile' mode instruments everything run on the loop.
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_KEEP = 5
+TRACEMALLOC_FRAMES = 25
+TOP_ENTRIES = 20
+
+Stack = Tuple[str, ...]
+
+
+_CWD = os.getcwd()
+
+
+@functools.lru_cache(maxsize=4096)
+def _code_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(_CWD):
+        filename = os.path.relpath(filename, _CWD)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _frame_label(frame) -> str:
+    return _code_label(frame.f_code)
+
+
+def _walk(frame) -> List[Any]:
+    """Frames of a thread's stack, outermost first"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def tag_stack(frames: List[Any], targets: Optional[Iterable[str]]) -> Optional[Stack]:
+    """
+    Collapsed-stack entry for a sample. With `targets` (function names), only
+    samples running under one of them are kept, rooted at the outermost match.
+    """
+    if not targets:
+        return tuple(_frame_label(frame) for frame in frames)
+    for index, frame in enumerate(frames):
+        if frame.f_code.co_name in targets:
+            return (f"[{frame.f_code.co_name}]",) + tuple(_frame_label(f) for f in frames[index:])
+    return None
+
+
+def collapse(samples: Counter) -> str:
+    """Brendan Gregg's collapsed-stack format (`a;b;c count`), for flamegraph.pl / speedscope"""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in samples.most_common())
+
+
+def top_functions(samples: Counter, limit: int = TOP_ENTRIES) -> Dict[str, List[Dict[str, Any]]]:
+    """Functions by self samples (leaf frames) and by inclusive samples (anywhere on the stack)"""
+    own: Counter = Counter()
+    inclusive: Counter = Counter()
+    total = sum(samples.values()) or 1
+    for stack, count in samples.items():
+        frames = [label for label in stack if not label.startswith('[')]
+        if frames:
+            own[frames[-1]] += count
+        for label in set(frames):
+            inclusive[label] += count
+
+    def rows(counter):
+        return [{"function": label, "samples": count, "percent": round(count * 100.0 / total, 1)}
+                for label, count in counter.most_common(limit)]
+    return {"self": rows(own), "inclusive": rows(inclusive)}
+
+
+class StackSampler:
+    """Samples thread stacks every `interval` seconds from a daemon thread"""
+
+    def __init__(self, thread_ids: Optional[List[int]] = None, interval: float = PROFILE_INTERVAL,
+                 targets: Optional[Iterable[str]] = None):
+        # None samples every thread except the sampler itself
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.targets = set(targets or ())
+        self.samples: Counter = Counter()
+        self.taken = 0
+        self.untagged = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def sample_once(self) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            self.taken += 1
+            stack = tag_stack(_walk(frame), self.targets)
+            if stack is None:
+                self.untagged += 1
+                continue
+            if self.thread_ids is None or len(self.thread_ids) > 1:
+                stack = (f"thread:{names.get(thread_id, thread_id)}",) + stack
+            self.samples[stack] += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample_once()
+
+
+def _pstats_bytes(profile: cProfile.Profile) -> bytes:
+    with tempfile.NamedTemporaryFile(suffix='.pstats', delete=False) as f:
+        path = f.name
+    try:
+        profile.dump_stats(path)
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def _cprofile_top(profile: cProfile.Profile, limit: int = TOP_ENTRIES) -> List[Dict[str, Any]]:
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, name), (calls, primitive, own, cumulative, _) in stats.stats.items():
+        rows.append({"function": f"{name} ({os.path.basename(filename)}:{line})", "calls": calls,
+                     "self_seconds": round(own, 6), "cumulative_seconds": round(cumulative, 6)})
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:limit]
+
+
+def _snapshot_bytes(snapshot: tracemalloc.Snapshot) -> bytes:
+    with tempfile.NamedTemporaryFile(suffix='.tracemalloc', delete=False) as f:
+        path = f.name
+    try:
+        snapshot.dump(path)
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def _memory_top(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int = TOP_ENTRIES) -> List[Dict[str, Any]]:
+    return [{"location": str(stat.traceback), "size_bytes": stat.size, "size_diff_bytes": stat.size_diff,
+             "count": stat.count, "count_diff": stat.count_diff}
+            for stat in after.compare_to(before, 'lineno')[:limit]]
+
+
+class ProfileCapture:
+    """One finished capture and its downloadable artifacts"""
+
+    def __init__(self, mode: str, seconds: float, targets: List[str]):
+        self.id = str(uuid.uuid4())[:8]
+        self.mode = mode
+        self.seconds = seconds
+        self.targets = targets
+        self.started_at = time.time()
+        self.summary: Dict[str, Any] = {}
+        # format -> (bytes, media type, file extension)
+        self.artifacts: Dict[str, Tuple[bytes, str, str]] = {}
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "seconds": self.seconds,
+            "targets": self.targets,
+            "started_at": self.started_at,
+            "formats": list(self.artifacts),
+            **self.summary,
+        }
+
+
+class Profiler:
+    """Runs one capture at a time and keeps the last few for download"""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.keep = keep
+        self.captures: "OrderedDict[str, ProfileCapture]" = OrderedDict()
+        self.running: Optional[ProfileCapture] = None
+
+    async def capture(self, mode: str = 'sample', seconds: float = 10.0, interval: float = PROFILE_INTERVAL,
+                      targets: Optional[List[str]] = None, memory: bool = False,
+                      all_threads: bool = False) -> ProfileCapture:
+        """
+        Profile the process for `seconds` while it keeps serving. Must be
+        awaited on the event loop, whose thread is the one profiled by default.
+        """
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError("mode must be sample or cprofile")
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            raise ValueError(f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}")
+        if targets and mode != 'sample':
+            raise ValueError("Route/function targets need mode=sample")
+        if self.running is not None:
+            raise RuntimeError(f"Capture {self.running.id} is already running")
+
+        capture = ProfileCapture(mode, seconds, list(targets or []))
+        self.running = capture
+        started_tracing = False
+        try:
+            if memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                    started_tracing = True
+                before = await blocking_io.run_blocking(tracemalloc.take_snapshot)
+
+            if mode == 'sample':
+                sampler = StackSampler(None if all_threads else [threading.get_ident()], interval, targets)
+                sampler.start()
+                try:
+                    await asyncio.sleep(seconds)
+                finally:
+                    await blocking_io.run_blocking(sampler.stop)
+                capture.artifacts['collapsed'] = (collapse(sampler.samples).encode(), 'text/plain', 'folded')
+                capture.summary = {"samples": sampler.taken, "kept_samples": sum(sampler.samples.values()),
+                                   "untagged_samples": sampler.untagged, "interval_ms": interval * 1000,
+                                   "top": top_functions(sampler.samples)}
+            else:
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    await asyncio.sleep(seconds)
+                finally:
+                    profile.disable()
+                data = await blocking_io.run_blocking(_pstats_bytes, profile)
+                capture.artifacts['pstats'] = (data, 'application/octet-stream', 'pstats')
+                capture.summary = {"top": await blocking_io.run_blocking(_cprofile_top, profile)}
+
+            if memory:
+                after = await blocking_io.run_blocking(tracemalloc.take_snapshot)
+                data = await blocking_io.run_blocking(_snapshot_bytes, after)
+                capture.artifacts['tracemalloc'] = (data, 'application/octet-stream', 'tracemalloc')
+                current, peak = tracemalloc.get_traced_memory()
+                capture.summary["memory"] = {"traced_bytes": current, "peak_bytes": peak,
+                                             "top_growth": await blocking_io.run_blocking(_memory_top, before, after)}
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            self.running = None
+
+        self.captures[capture.id] = capture
+        while len(self.captures) > self.keep:
+            self.captures.popitem(last=False)
+        return capture
+
+
+profiler = Profiler()
@@ -0,0 +1,252 @@
+import os
+import re
+import time
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+
+# Off by default: clients are told apart by peer address, and behind a proxy or
+# CDN every viewer would share one bucket. Enable it when clients connect
+# directly, or set RATE_LIMIT_TRUST_FORWARDED behind a proxy that sets X-Forwarded-For.
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "0") == "1"
+
+# Segment delivery and upload limits. Rates are bytes/second; 0 disables a limit.
+DELIVERY_CLIENT_BPS = int(os.environ.get("RATE_LIMIT_CLIENT_BPS", str(50 * 1024 * 1024 // 8)))
+DELIVERY_CLIENT_BURST = int(os.environ.get("RATE_LIMIT_CLIENT_BURST", str(8 * 1024 * 1024)))
+DELIVERY_TASK_BPS = int(os.environ.get("RATE_LIMIT_TASK_BPS", "0"))
+DELIVERY_TASK_BURST = int(os.environ.get("RATE_LIMIT_TASK_BURST", str(32 * 1024 * 1024)))
+# Total delivery budget (e.g. the NIC), shared fairly between clients that are downloading
+DELIVERY_TOTAL_BPS = int(os.environ.get("RATE_LIMIT_TOTAL_BPS", "0"))
+DELIVERY_REQUESTS_PER_SECOND = float(os.environ.get("RATE_LIMIT_REQUESTS_PER_SECOND", "20"))
+DELIVERY_REQUEST_BURST = int(os.environ.get("RATE_LIMIT_REQUEST_BURST", "40"))
+DELIVERY_MAX_CONCURRENT = int(os.environ.get("RATE_LIMIT_MAX_CONCURRENT", "6"))
+UPLOAD_CLIENT_BPS = int(os.environ.get("RATE_LIMIT_UPLOAD_BPS", "0"))
+UPLOAD_CLIENT_BURST = int(os.environ.get("RATE_LIMIT_UPLOAD_BURST", str(16 * 1024 * 1024)))
+UPLOAD_REQUESTS_PER_SECOND = float(os.environ.get("RATE_LIMIT_UPLOAD_REQUESTS_PER_SECOND", "2"))
+UPLOAD_REQUEST_BURST = int(os.environ.get("RATE_LIMIT_UPLOAD_REQUEST_BURST", "5"))
+TRUST_FORWARDED = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+
+# Large bodies are sent in slices so pacing stays smooth
+PACING_CHUNK = 64 * 1024
+IDLE_BUCKET_SECONDS = 600
+
+_CHUNKS_PATH = re.compile(r'^/api/v1/chunks/(\d+)')
+_STATIC_PATH = re.compile(r'^/static/output/([^/]+)/')
+_LIVE_PATH = re.compile(r'^/api/v1/live/([^/]+)/(?!ingest/)')
+
+
+class TokenBucket:
+    """Token bucket that may go into debt; callers sleep for the returned delay"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, rate: float) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def try_take(self, amount: float = 1) -> bool:
+        self._refill(self.rate)
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def reserve(self, amount: float, rate: Optional[float] = None) -> float:
+        """Take `amount` tokens and return how long to wait before using them"""
+        rate = rate or self.rate
+        self._refill(rate)
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / rate
+
+
+def classify(path: str, method: str) -> Tuple[Optional[str], Optional[str]]:
+    """('delivery' | 'upload' | None, task key) for a request"""
+    if path.startswith('/api/v1/upload') and method == 'POST':
+        return 'upload', None
+    if method not in ('GET', 'HEAD'):
+        return None, None
+    for pattern, prefix in ((_CHUNKS_PATH, 'task'), (_STATIC_PATH, 'output'), (_LIVE_PATH, 'live')):
+        match = pattern.match(path)
+        if match:
+            return 'delivery', f"{prefix}:{match.group(1)}"
+    return None, None
+
+
+class RateLimiter:
+    """Per-client and per-task buckets, concurrency counts and throttling counters"""
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.active: Dict[str, int] = {}
+        self.last_pruned = time.monotonic()
+        self.counters = {
+            "throttled_requests": 0,
+            "rejected_rate": 0,
+            "rejected_concurrency": 0,
+            "throttled_bytes": 0,
+            "throttle_delay_seconds": 0.0,
+            "delivered_bytes": 0,
+            "uploaded_bytes": 0,
+        }
+
+    def bucket(self, kind: str, key: str, rate: float, burst: float) -> TokenBucket:
+        bucket = self.buckets.get((kind, key))
+        if bucket is None:
+            bucket = self.buckets[(kind, key)] = TokenBucket(rate, burst)
+        return bucket
+
+    def prune(self) -> None:
+        now = time.monotonic()
+        if now - self.last_pruned < 60:
+            return
+        self.last_pruned = now
+        for bucket_key, bucket in list(self.buckets.items()):
+            if now - bucket.updated > IDLE_BUCKET_SECONDS:
+                del self.buckets[bucket_key]
+
+    def fair_rate(self) -> float:
+        """Per-client byte rate: the client limit, or an equal share of the total budget"""
+        rates = [rate for rate in (DELIVERY_CLIENT_BPS,) if rate]
+        if DELIVERY_TOTAL_BPS:
+            rates.append(DELIVERY_TOTAL_BPS / max(1, len(self.active)))
+        return min(rates) if rates else 0
+
+    def delivery_delay(self, client: str, task_key: Optional[str], size: int) -> float:
+        delay = 0.0
+        rate = self.fair_rate()
+        if rate:
+            bucket = self.bucket('client_bytes', client, rate, DELIVERY_CLIENT_BURST)
+            delay = bucket.reserve(size, rate)
+        if DELIVERY_TASK_BPS and task_key:
+            bucket = self.bucket('task_bytes', task_key, DELIVERY_TASK_BPS, DELIVERY_TASK_BURST)
+            delay = max(delay, bucket.reserve(size))
+        return delay
+
+    def upload_delay(self, client: str, size: int) -> float:
+        if not UPLOAD_CLIENT_BPS:
+            return 0.0
+        return self.bucket('upload_bytes', client, UPLOAD_CLIENT_BPS, UPLOAD_CLIENT_BURST).reserve(size)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": RATE_LIMIT_ENABLED,
+            "trust_forwarded": TRUST_FORWARDED,
+            **self.counters,
+            "throttle_delay_seconds": round(self.counters["throttle_delay_seconds"], 3),
+            "active_clients": len(self.active),
+            "tracked_buckets": len(self.buckets),
+            "fair_share_bps": self.fair_rate(),
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+def _client_id(scope) -> str:
+    if TRUST_FORWARDED:
+        for name, value in scope.get('headers', []):
+            if name == b'x-forwarded-for':
+                return value.decode().split(',')[0].strip()
+    client = scope.get('client')
+    return client[0] if client else 'unknown'
+
+
+async def _reject(send, reason: str, retry_after: int = 1) -> None:
+    body = f'{{"detail": "{reason}"}}'.encode()
+    await send({
+        'type': 'http.response.start',
+        'status': 429,
+        'headers': [(b'content-type', b'application/json'), (b'retry-after', str(retry_after).encode()),
+                    (b'content-length', str(len(body)).encode()), (b'access-control-allow-origin', b'*')],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware that limits request rates and caps concurrent segment
+    requests per client, and paces segment and upload bodies through token
+    buckets per client and per task.
+    """
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        kind, task_key = classify(scope['path'], scope['method'])
+        if kind is None:
+            return await self.app(scope, receive, send)
+
+        limiter = self.limiter
+        counters = limiter.counters
+        client = _client_id(scope)
+        limiter.prune()
+
+        if kind == 'upload':
+            requests = limiter.bucket('upload_requests', client, UPLOAD_REQUESTS_PER_SECOND, UPLOAD_REQUEST_BURST)
+        else:
+            requests = limiter.bucket('requests', client, DELIVERY_REQUESTS_PER_SECOND, DELIVERY_REQUEST_BURST)
+        if not requests.try_take():
+            counters["rejected_rate"] += 1
+            return await _reject(send, "Too many requests")
+
+        if kind == 'upload':
+            async def paced_receive():
+                message = await receive()
+                size = len(message.get('body', b''))
+                if size:
+                    counters["uploaded_bytes"] += size
+                    delay = limiter.upload_delay(client, size)
+                    if delay > 0:
+                        counters["throttled_bytes"] += size
+                        counters["throttle_delay_seconds"] += delay
+                        await asyncio.sleep(delay)
+                return message
+            return await self.app(scope, paced_receive, send)
+
+        if DELIVERY_MAX_CONCURRENT and limiter.active.get(client, 0) >= DELIVERY_MAX_CONCURRENT:
+            counters["rejected_concurrency"] += 1
+            return await _reject(send, "Too many concurrent segment requests")
+
+        limiter.active[client] = limiter.active.get(client, 0) + 1
+        throttled = False
+
+        async def paced_send(message):
+            nonlocal throttled
+            if message['type'] != 'http.response.body':
+                return await send(message)
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if not body:
+                return await send(message)
+            for start in range(0, len(body), PACING_CHUNK):
+                piece = body[start:start + PACING_CHUNK]
+                delay = limiter.delivery_delay(client, task_key, len(piece))
+                if delay > 0:
+                    if not throttled:
+                        throttled = True
+                        counters["throttled_requests"] += 1
+                    counters["throttled_bytes"] += len(piece)
+                    counters["throttle_delay_seconds"] += delay
+                    await asyncio.sleep(delay)
+                counters["delivered_bytes"] += len(piece)
+                last = start + PACING_CHUNK >= len(body)
+                await send({'type': 'http.response.body', 'body': piece, 'more_body': more_body or not last})
+
+        try:
+            await self.app(scope, receive, paced_send)
+        finally:
+            remaining = limiter.active.get(client, 1) - 1
+            if remaining > 0:
+                limiter.active[client] = remaining
+            else:
+                limiter.active.pop(client, None)
@@ -0,0 +1,190 @@
+import os
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from services import blocking_io
+from services.edge_cache import next_segment_names
+
+# Read-ahead for segments served from local (possibly network) storage: when a
+# player fetches segment N of a rendition, segments N+1..N+k are read into a
+# bounded memory cache in the background so its next requests skip the disk.
+PREFETCH_SEGMENTS = int(os.environ.get("PREFETCH_SEGMENTS", "2"))
+PREFETCH_MEMORY_BYTES = int(os.environ.get("PREFETCH_MEMORY_MB", "64")) * 1024 * 1024
+PREFETCH_CONCURRENCY = int(os.environ.get("PREFETCH_CONCURRENCY", "2"))
+SESSION_IDLE_SECONDS = 120
+SEGMENT_EXTENSIONS = ('.ts', '.m4s')
+
+_SEGMENT_NUMBER = re.compile(r'^(.*?)(\d+)(\.[A-Za-z0-9]+)$')
+
+
+def is_segment(path: str) -> bool:
+    return path.endswith(SEGMENT_EXTENSIONS)
+
+
+def resolve_under(root: str, path: str) -> Optional[str]:
+    """`path` joined onto `root` and normalized, or None if it resolves outside `root`"""
+    root = os.path.realpath(root)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root:
+        return None
+    return full
+
+
+Signature = Tuple[int, int]
+
+
+def _signature(path: str) -> Optional[Signature]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_file(path: str) -> Optional[Tuple[bytes, Signature]]:
+    """Segment bytes with the (mtime_ns, size) they were read at; None if missing or still empty"""
+    try:
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            data = f.read()
+    except OSError:
+        # Not written yet (encode still running) or removed
+        return None
+    if not data or len(data) != stat.st_size:
+        # Created but not written yet, or growing while we read it
+        return None
+    return data, (stat.st_mtime_ns, stat.st_size)
+
+
+class SegmentPrefetcher:
+    """
+    Tracks each client's position per rendition and keeps an LRU of
+    read-ahead segments. Entries loaded by prefetch and evicted before anyone
+    asked for them are counted as wasted, to tune `depth`.
+    """
+
+    def __init__(self, depth: int = PREFETCH_SEGMENTS, memory_bytes: int = PREFETCH_MEMORY_BYTES,
+                 concurrency: int = PREFETCH_CONCURRENCY):
+        self.depth = depth
+        self.memory_bytes = memory_bytes
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # path -> [data, used, (mtime_ns, size)]; an entry only counts while the file still matches
+        self._cache: "OrderedDict[str, list]" = OrderedDict()
+        self._cache_bytes = 0
+        self._inflight: set = set()
+        # Running prefetch tasks, held so they are not garbage-collected mid-read
+        self._tasks: set = set()
+        # (client, rendition) -> {'number', 'last_seen'}
+        self.sessions: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.stats = {
+            "requests": 0, "hits": 0, "misses": 0, "prefetched": 0, "prefetched_bytes": 0,
+            "used": 0, "wasted": 0, "not_ready": 0, "stale": 0, "seeks": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.depth > 0
+
+    async def lookup(self, path: str) -> Optional[bytes]:
+        """Cached bytes for a segment, counting the hit or miss"""
+        self.stats["requests"] += 1
+        entry = self._cache.get(path)
+        if entry is not None and await blocking_io.run_blocking(_signature, path) != entry[2]:
+            # Rewritten since it was read (re-encode, resume, preview replaced) or removed
+            self._discard(path)
+            self.stats["stale"] += 1
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._cache.move_to_end(path)
+        if not entry[1]:
+            entry[1] = True
+            self.stats["used"] += 1
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def on_segment_request(self, client: str, path: str) -> None:
+        """Record the client's playback position and read ahead of it"""
+        if not self.enabled:
+            return
+        directory, name = os.path.split(path)
+        match = _SEGMENT_NUMBER.match(name)
+        if not match:
+            return
+        now = time.monotonic()
+        prefix, number, ext = match.groups()
+        key = (client, os.path.join(directory, prefix + ext))
+        session = self.sessions.get(key)
+        if session is not None and int(number) not in (session['number'], session['number'] + 1):
+            self.stats["seeks"] += 1
+        self.sessions[key] = {'number': int(number), 'last_seen': now}
+        self._prune_sessions(now)
+
+        for next_name in next_segment_names(name, self.depth):
+            next_path = os.path.join(directory, next_name)
+            if next_path not in self._cache and next_path not in self._inflight:
+                self._inflight.add(next_path)
+                task = asyncio.create_task(self._prefetch(next_path))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def _prune_sessions(self, now: float) -> None:
+        if len(self.sessions) < 1000:
+            return
+        for key, session in list(self.sessions.items()):
+            if now - session['last_seen'] > SESSION_IDLE_SECONDS:
+                del self.sessions[key]
+
+    async def _prefetch(self, path: str) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            async with self._semaphore:
+                read = await blocking_io.run_blocking(_read_file, path)
+        except Exception as e:
+            print(f"Segment prefetch failed for {path}: {e}")
+            read = None
+        finally:
+            self._inflight.discard(path)
+        if read is None:
+            self.stats["not_ready"] += 1
+            return
+        data, signature = read
+        self.stats["prefetched"] += 1
+        self.stats["prefetched_bytes"] += len(data)
+        self._store(path, data, signature)
+
+    def _store(self, path: str, data: bytes, signature: Signature) -> None:
+        if len(data) > self.memory_bytes or path in self._cache:
+            return
+        self._cache[path] = [data, False, signature]
+        self._cache_bytes += len(data)
+        while self._cache_bytes > self.memory_bytes:
+            self._discard(next(iter(self._cache)))
+
+    def _discard(self, path: str) -> None:
+        old, used, _ = self._cache.pop(path)
+        self._cache_bytes -= len(old)
+        if not used:
+            self.stats["wasted"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        prefetched = self.stats["prefetched"]
+        return {
+            "depth": self.depth,
+            **self.stats,
+            # Share of prefetched segments that were served before being evicted
+            "useful_ratio": round(self.stats["used"] / prefetched, 3) if prefetched else None,
+            "cache_entries": len(self._cache),
+            "cache_bytes": self._cache_bytes,
+            "inflight": len(self._inflight),
+            "sessions": len(self.sessions),
+        }
+
+
+segment_prefetcher = SegmentPrefetcher()
@@ -0,0 +1,410 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from fastapi.responses import RedirectResponse, Response
+
+from services import blocking_io, checkpoint
+
+# Converted output is always written to local disk by ffmpeg. With the S3
+# backend it is also published to an S3-compatible bucket while the encode
+# runs, and web nodes serve (or redirect to) the bucket, so any node can
+# serve any task. Uploads stay local scratch space for ffmpeg's input.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+STORAGE_BUCKET = os.environ.get("STORAGE_BUCKET", "streaming")
+STORAGE_ENDPOINT_URL = os.environ.get("STORAGE_ENDPOINT_URL")
+STORAGE_PREFIX = os.environ.get("STORAGE_PREFIX", "")
+# Redirect players to the bucket instead of proxying segment bytes
+STORAGE_REDIRECT = os.environ.get("STORAGE_REDIRECT", "0") == "1"
+# Public base URL of the bucket (CDN or public-read); presigned URLs otherwise
+STORAGE_PUBLIC_URL = os.environ.get("STORAGE_PUBLIC_URL")
+STORAGE_PART_SIZE = int(os.environ.get("STORAGE_PART_SIZE_MB", "8")) * 1024 * 1024
+STORAGE_CONCURRENCY = int(os.environ.get("STORAGE_CONCURRENCY", "8"))
+PUBLISH_INTERVAL = float(os.environ.get("STORAGE_PUBLISH_INTERVAL", "1"))
+
+OUTPUT_ROOT = "static/output"
+MANIFEST_EXTENSIONS = ('.m3u8', '.mpd')
+_SEGMENT_NUMBER = re.compile(r'^(.*?)(\d+)(\.[A-Za-z0-9]+)$')
+
+
+def content_type(name: str) -> str:
+    if name.endswith('.m3u8'):
+        return "application/vnd.apple.mpegurl"
+    if name.endswith('.ts'):
+        return "video/MP2T"
+    if name.endswith('.mpd'):
+        return "application/dash+xml"
+    if name.endswith(('.m4s', '.mp4')):
+        return "video/mp4"
+    return "application/octet-stream"
+
+
+def storage_key(path: str, root: str = OUTPUT_ROOT) -> str:
+    """static/output/movie_1a2b/playlist.m3u8 -> movie_1a2b/playlist.m3u8"""
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def task_output_dir(task: Dict[str, Any]) -> str:
+    """Directory holding everything a task produced (DASH output sits in a 'dash' subdirectory)"""
+    output_dir = os.path.dirname(task['output'])
+    if os.path.basename(output_dir) == 'dash':
+        output_dir = os.path.dirname(output_dir)
+    return output_dir
+
+
+class LocalStorage:
+    """Output served straight from the local output directory (the default)"""
+
+    name = 'local'
+    remote = False
+
+    def __init__(self, root: str = OUTPUT_ROOT):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def publish_file(self, path: str, key: str) -> int:
+        target = self.path(key)
+        if os.path.abspath(path) != os.path.abspath(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(path, target)
+        return os.path.getsize(target)
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def url(self, key: str) -> Optional[str]:
+        # Already reachable through the /static mount
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.name, "root": self.root}
+
+    def close(self) -> None:
+        pass
+
+
+class S3Storage:
+    """
+    S3-compatible bucket (AWS, MinIO, ...) through a boto3-style client.
+
+    Files above `part_size` go up as multipart uploads whose parts are sent in
+    parallel; the client keeps a connection pool sized for that concurrency.
+    """
+
+    name = 's3'
+    remote = True
+
+    def __init__(self, bucket: str = STORAGE_BUCKET, client=None, prefix: str = STORAGE_PREFIX,
+                 part_size: int = STORAGE_PART_SIZE, concurrency: int = STORAGE_CONCURRENCY,
+                 public_url: Optional[str] = STORAGE_PUBLIC_URL, endpoint_url: Optional[str] = STORAGE_ENDPOINT_URL):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.endpoint_url = endpoint_url
+        self._client = client
+        # Created on first multipart upload and again after close(), like blocking_io's pool
+        self._parts: Optional[ThreadPoolExecutor] = None
+        self._parts_lock = threading.Lock()
+        self.stats = {"objects": 0, "bytes": 0, "multipart": 0}
+
+    @property
+    def client(self):
+        # Created on first use, so a local-only setup never imports boto3
+        if self._client is None:
+            self._client = self._make_client()
+        return self._client
+
+    def _make_client(self):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        # Publishing threads plus multipart parts share the pool
+        config = Config(max_pool_connections=self.concurrency * 2, retries={'max_attempts': 5, 'mode': 'adaptive'})
+        return boto3.client('s3', endpoint_url=self.endpoint_url, config=config)
+
+    def _part_pool(self) -> ThreadPoolExecutor:
+        with self._parts_lock:
+            if self._parts is None:
+                self._parts = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="s3-part")
+            return self._parts
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def publish_file(self, path: str, key: str) -> int:
+        size = os.path.getsize(path)
+        object_key = self.object_key(key)
+        if size <= self.part_size:
+            with open(path, 'rb') as f:
+                self.client.put_object(Bucket=self.bucket, Key=object_key, Body=f.read(),
+                                       ContentType=content_type(key))
+        else:
+            self._multipart(path, object_key, size, content_type(key))
+        self.stats["objects"] += 1
+        self.stats["bytes"] += size
+        return size
+
+    def _upload_part(self, path: str, object_key: str, upload_id: str, number: int) -> Dict[str, Any]:
+        with open(path, 'rb') as f:
+            f.seek((number - 1) * self.part_size)
+            body = f.read(self.part_size)
+        result = self.client.upload_part(Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                                         PartNumber=number, Body=body)
+        return {'PartNumber': number, 'ETag': result['ETag']}
+
+    def _multipart(self, path: str, object_key: str, size: int, media_type: str) -> None:
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=object_key,
+                                                        ContentType=media_type)['UploadId']
+        try:
+            count = -(-size // self.part_size)
+            parts_pool = self._part_pool()
+            futures = [parts_pool.submit(self._upload_part, path, object_key, upload_id, number)
+                       for number in range(1, count + 1)]
+            parts = [future.result() for future in futures]
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                                                  MultipartUpload={'Parts': parts})
+            self.stats["multipart"] += 1
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id)
+            raise
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))['Body'].read()
+        except Exception as e:
+            if _is_not_found(e):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except Exception as e:
+            if _is_not_found(e):
+                return False
+            raise
+
+    def url(self, key: str) -> Optional[str]:
+        if self.public_url:
+            return f"{self.public_url}/{self.object_key(key)}"
+        return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': self.object_key(key)},
+                                                  ExpiresIn=3600)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.name, "bucket": self.bucket, "prefix": self.prefix, "redirect": STORAGE_REDIRECT,
+                "part_size": self.part_size, "concurrency": self.concurrency, **self.stats}
+
+    def close(self) -> None:
+        with self._parts_lock:
+            parts, self._parts = self._parts, None
+        if parts is not None:
+            parts.shutdown(wait=False)
+
+
+def _media_segment(name: str):
+    """Regex match (prefix, number, ext) for numbered media segments; None for init segments and manifests"""
+    if name.endswith(MANIFEST_EXTENSIONS) or 'init' in os.path.basename(name):
+        return None
+    return _SEGMENT_NUMBER.match(name)
+
+
+def _is_not_found(error: Exception) -> bool:
+    response = getattr(error, 'response', None) or {}
+    return str(response.get('Error', {}).get('Code')) in ('404', 'NoSuchKey', 'NotFound')
+
+
+def create_storage(backend: str = STORAGE_BACKEND):
+    if backend == 'local':
+        return LocalStorage()
+    if backend == 's3':
+        return S3Storage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+storage = create_storage()
+
+
+async def serve_from_storage(path: str):
+    """
+    Response for a local output path that should come from the bucket, or None
+    to serve the local file. Segments redirect to the bucket when
+    STORAGE_REDIRECT is set; manifests are always proxied so their relative
+    segment URIs keep pointing at this server (presigned URLs are per object).
+    """
+    if not storage.remote:
+        return None
+    key = storage_key(path)
+    if STORAGE_REDIRECT and not path.endswith(MANIFEST_EXTENSIONS):
+        url = await blocking_io.run_blocking(storage.url, key)
+        return RedirectResponse(url, status_code=307)
+    if await blocking_io.exists(path):
+        return None
+    data = await blocking_io.run_blocking(storage.read, key)
+    if data is None:
+        return None
+    return Response(content=data, media_type=content_type(path), headers={'Access-Control-Allow-Origin': '*'})
+
+
+class SegmentPublisher:
+    """
+    Copies a task's output directory to the storage backend while ffmpeg is
+    still writing it. A segment is published once a later segment of the same
+    rendition exists (ffmpeg has closed it); an HLS playlist is published once
+    every segment it lists is in the store, so remote players never see a
+    reference to a missing object. `stop` publishes the rest, manifests last.
+    """
+
+    def __init__(self, backend, directory: str, key_prefix: Optional[str] = None,
+                 concurrency: int = STORAGE_CONCURRENCY):
+        self.backend = backend
+        self.directory = directory
+        self.key_prefix = key_prefix if key_prefix is not None else storage_key(directory)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="publish")
+        # relative path -> (size, mtime) when it was published
+        self.published: Dict[str, tuple] = {}
+        self._previous: Dict[str, tuple] = {}
+        self.stats = {"files": 0, "bytes": 0, "errors": 0, "first_publish": None, "last_publish": None}
+
+    def _scan(self) -> Dict[str, tuple]:
+        files = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[os.path.relpath(path, self.directory).replace(os.sep, '/')] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def _pending(self, files: Dict[str, tuple], final: bool) -> List[str]:
+        changed = [name for name, signature in files.items()
+                   if self.published.get(name) != signature and not name.endswith(MANIFEST_EXTENSIONS)]
+        if final:
+            return changed
+        # The newest segment of each rendition may still be open in ffmpeg
+        newest: Dict[str, int] = {}
+        for name in changed:
+            match = _media_segment(name)
+            if match:
+                prefix, number, ext = match.groups()
+                newest[prefix + ext] = max(newest.get(prefix + ext, -1), int(number))
+        for name, signature in files.items():
+            match = _media_segment(name)
+            if match and self.published.get(name) == signature:
+                prefix, number, ext = match.groups()
+                newest[prefix + ext] = max(newest.get(prefix + ext, -1), int(number))
+        ready = []
+        for name in changed:
+            match = _media_segment(name)
+            if match:
+                prefix, number, ext = match.groups()
+                if int(number) < newest[prefix + ext]:
+                    ready.append(name)
+            elif self._previous.get(name) == files[name] and files[name][0] > 0:
+                # Init segments and other files, once they stopped changing between polls
+                ready.append(name)
+        return ready
+
+    def _hls_playlist_ready(self, name: str) -> bool:
+        path = os.path.join(self.directory, *name.split('/'))
+        try:
+            _, segments, _ = checkpoint.parse_hls_playlist(path)
+        except OSError:
+            return False
+        if not segments:
+            # A header-only playlist would tell remote players the stream has nothing in it
+            return False
+        base = os.path.dirname(name)
+        return all((f"{base}/{uri}" if base else uri) in self.published for _, uri in segments)
+
+    async def _publish(self, names: List[str], files: Dict[str, tuple]) -> None:
+        loop = asyncio.get_running_loop()
+
+        async def publish_one(name):
+            key = f"{self.key_prefix}/{name}"
+            path = os.path.join(self.directory, *name.split('/'))
+            try:
+                size = await loop.run_in_executor(self._executor, self.backend.publish_file, path, key)
+            except Exception as e:
+                # Retried on the next poll
+                self.stats["errors"] += 1
+                print(f"Failed to publish {key}: {e}")
+                return
+            self.published[name] = files[name]
+            self.stats["files"] += 1
+            self.stats["bytes"] += size
+            now = time.time()
+            self.stats["first_publish"] = self.stats["first_publish"] or now
+            self.stats["last_publish"] = now
+
+        await asyncio.gather(*(publish_one(name) for name in names))
+
+    async def publish_ready(self, final: bool = False) -> None:
+        files = await blocking_io.run_blocking(self._scan)
+        pending = self._pending(files, final)
+        self._previous = files
+        await self._publish(pending, files)
+        manifests = [name for name, signature in files.items()
+                     if name.endswith(MANIFEST_EXTENSIONS) and self.published.get(name) != signature]
+        if not final:
+            # DASH manifests are only published with the finished output
+            manifests = [name for name in manifests if name.endswith('.m3u8')
+                         and await blocking_io.run_blocking(self._hls_playlist_ready, name)]
+        await self._publish(manifests, files)
+
+    async def run(self, stop: asyncio.Event, interval: float = PUBLISH_INTERVAL) -> None:
+        """Publish in the background until `stop` is set"""
+        while not stop.is_set():
+            try:
+                await self.publish_ready()
+            except Exception as e:
+                # Retried on the next poll; `stop` publishes whatever is left
+                self.stats["errors"] += 1
+                print(f"Publishing {self.key_prefix} failed: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, interval: float = PUBLISH_INTERVAL) -> "SegmentPublisher":
+        self._stop = asyncio.Event()
+        self._runner = asyncio.create_task(self.run(self._stop, interval))
+        return self
+
+    async def stop(self, publish_rest: bool = True) -> Dict[str, Any]:
+        """Stop the background loop; publish everything left when the encode succeeded"""
+        self._stop.set()
+        await self._runner
+        if publish_rest:
+            await self.publish_ready(final=True)
+        self._executor.shutdown(wait=False)
+        return {"backend": self.backend.name, "key_prefix": self.key_prefix, **self.stats}
+
+
+def start_publishing(output_dir: str) -> Optional[SegmentPublisher]:
+    """Background publisher for an encode's output directory, or None with local storage"""
+    if not storage.remote:
+        return None
+    return SegmentPublisher(storage, output_dir).start()
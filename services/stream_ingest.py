@@ -0,0 +1,211 @@
+import os
+import time
+import struct
+import asyncio
+from typing import AsyncIterator, Optional, Set, Tuple
+
+import aiofiles
+
+from services import blocking_io
+from services.encoding_profiles import DEFAULT_PROFILE
+from services.job_control import register_encode, unregister_encode
+from services.cpu_allocator import cpu_allocator, with_thread_budget
+from services.storage import SegmentPublisher, start_publishing, task_output_dir
+from services.tracing import trace_for, watch_first_segment
+from services.video_converter import _build_hls_command, _build_dash_command
+
+# Containers ffmpeg can demux from a non-seekable pipe as the bytes arrive
+PIPE_FRIENDLY_EXTENSIONS = ('.ts', '.mts', '.m2ts', '.mkv', '.webm')
+# ISO-BMFF files are only pipe friendly when the moov box precedes mdat
+# (fragmented MP4 or "faststart" files)
+ISOBMFF_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+PROBE_BYTES = 64 * 1024
+
+# Encode tails still running after their upload returned; they finalize the task
+# status, so they are held here until done rather than left to the garbage collector
+_finishing: Set[asyncio.Task] = set()
+
+
+def _moov_before_mdat(head: bytes) -> bool:
+    """Walk the top-level ISO-BMFF boxes in `head` and report whether moov comes first"""
+    offset = 0
+    while offset + 8 <= len(head):
+        size, box_type = struct.unpack(">I4s", head[offset:offset + 8])
+        if box_type == b'moov':
+            return True
+        if box_type == b'mdat':
+            return False
+        if size == 1:
+            if offset + 16 > len(head):
+                return False
+            size = struct.unpack(">Q", head[offset + 8:offset + 16])[0]
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+def is_pipe_friendly(filename: str, head: bytes) -> bool:
+    """Decide whether an upload can be fed to ffmpeg's stdin while it is still arriving"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in PIPE_FRIENDLY_EXTENSIONS:
+        return True
+    if ext in ISOBMFF_EXTENSIONS:
+        return _moov_before_mdat(head)
+    return False
+
+
+async def peek_stream(body: AsyncIterator[bytes], size: int = PROBE_BYTES) -> Tuple[bytes, AsyncIterator[bytes]]:
+    """
+    Buffer at least `size` bytes from the front of `body` (or all of it if shorter).
+    Returns the buffered head and an iterator that replays it followed by the rest.
+    """
+    iterator = body.__aiter__()
+    head = b''
+    exhausted = False
+    while len(head) < size:
+        try:
+            head += await iterator.__anext__()
+        except StopAsyncIteration:
+            exhausted = True
+            break
+
+    async def replay():
+        if head:
+            yield head
+        if not exhausted:
+            async for chunk in iterator:
+                yield chunk
+
+    return head, replay()
+
+
+async def _drain(stream) -> bytes:
+    """Keep reading a subprocess pipe so ffmpeg never blocks on a full stderr buffer"""
+    data = bytearray()
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            return bytes(data)
+        data.extend(chunk)
+
+
+async def ingest_stream(task_id: int, conversion_tasks: dict, body: AsyncIterator[bytes]) -> asyncio.Task:
+    """
+    Feed an upload body straight into ffmpeg's stdin while teeing it to the
+    task's input path for archival, so encoding overlaps with the upload.
+
+    Returns once the whole body has been received. The remaining encode is left
+    to a background task, which updates the task status; it is returned and
+    also kept referenced here until it finishes.
+    """
+    task = conversion_tasks[task_id]
+    task['status'] = 'processing'
+    archive_path = task['input']
+    output_path = task['output']
+    segment_duration = int(task.get('segment_duration', 6))
+    crf = int(task.get('crf', 20))
+    resolution = task.get('resolution', 'source')
+    profile = task.get('profile') or DEFAULT_PROFILE
+
+    await blocking_io.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    if task['streaming_protocol'] == 'hls':
+        # Not resumable (the input is the request body), so ffmpeg can write the VOD playlist itself
+        cmd = _build_hls_command('pipe:0', output_path, segment_duration, crf, resolution, profile, playlist_type='vod')
+    elif task['streaming_protocol'] == 'dash':
+        cmd = _build_dash_command('pipe:0', output_path, segment_duration, crf, resolution, profile)
+    else:
+        raise ValueError(f"Streaming ingest does not support protocol: {task['streaming_protocol']}")
+
+    print(f"Starting streaming ingest for task {task_id}: {' '.join(cmd)}")
+    trace = trace_for(task_id)
+    threads = cpu_allocator.thread_budget()
+    spawn_started = time.time()
+    process = await asyncio.create_subprocess_exec(
+        *with_thread_budget(cmd, threads),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    trace.mark('encode_started')
+    trace.record('ffmpeg_start', spawn_started, trace.marks['encode_started'])
+    stderr_task = asyncio.create_task(_drain(process.stderr))
+    watcher = asyncio.create_task(
+        watch_first_segment(trace, os.path.dirname(output_path), trace.marks['encode_started']))
+    register_encode(task_id, process, task.get('priority') or 'normal', conversion_tasks)
+    cpu_allocator.start(task_id, process, threads)
+    publisher = start_publishing(task_output_dir(task))
+
+    received = 0
+    feeding = True
+    try:
+        async with aiofiles.open(archive_path, 'wb') as archive:
+            async for chunk in body:
+                await archive.write(chunk)
+                received += len(chunk)
+                if feeding:
+                    try:
+                        process.stdin.write(chunk)
+                        await process.stdin.drain()
+                    except (BrokenPipeError, ConnectionResetError):
+                        # ffmpeg exited early; keep archiving, the error is reported below
+                        feeding = False
+    except Exception:
+        process.kill()
+        await process.wait()
+        stderr_task.cancel()
+        watcher.cancel()
+        trace.finish('failed')
+        unregister_encode(task_id, conversion_tasks)
+        cpu_allocator.release(task_id)
+        if publisher:
+            await publisher.stop(publish_rest=False)
+        raise
+    finally:
+        if process.stdin and not process.stdin.is_closing():
+            process.stdin.close()
+
+    task['bytes_received'] = received
+    print(f"Streaming ingest for task {task_id} received {received} bytes")
+    finisher = asyncio.create_task(_finish_stream_conversion(task_id, conversion_tasks, process, stderr_task, watcher,
+                                                             publisher))
+    _finishing.add(finisher)
+    finisher.add_done_callback(_finishing.discard)
+    return finisher
+
+
+async def _finish_stream_conversion(task_id: int, conversion_tasks: dict, process, stderr_task: asyncio.Task,
+                                    watcher: asyncio.Task, publisher: Optional[SegmentPublisher] = None):
+    task = conversion_tasks[task_id]
+    trace = trace_for(task_id)
+    try:
+        await process.wait()
+        error = await stderr_task
+        watcher.cancel()
+        encode_end = time.time()
+        trace.record('encode', trace.marks['encode_started'], encode_end, returncode=process.returncode)
+        unregister_encode(task_id, conversion_tasks)
+        cpu_allocator.release(task_id)
+        if task.get('status') in ('cancelled', 'interrupted'):
+            # An interrupted stream cannot be resumed: its body came from the client
+            print(f"Streaming conversion for task {task_id} was {task['status']}")
+            return
+        if process.returncode != 0:
+            raise Exception(f"FFmpeg error: {error.decode(errors='replace')}")
+        if await blocking_io.exists(task['output']):
+            trace.record('manifest_ready', encode_end, time.time())
+        if publisher:
+            task['storage'] = await publisher.stop()
+            publisher = None
+        task['status'] = 'completed'
+        print(f"Successfully completed streaming conversion for task {task_id}")
+    except Exception as e:
+        error_msg = f"Error in streaming conversion: {str(e)}"
+        print(error_msg)
+        task['status'] = 'failed'
+        task['error'] = error_msg
+    finally:
+        if publisher:
+            await publisher.stop(publish_rest=False)
+        trace.finish(task.get('status'))
@@ -0,0 +1,737 @@
+import os
+import sys
+import asyncio
+import time
+import base64
+import bisect
+import heapq
+import json
+import atexit
+import pickle
+import sqlite3
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from collections.abc import MutableMapping
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services import blocking_io
+
+# Index key: (created_at ISO string, task_id). ISO-8601 UTC strings sort
+# chronologically, and task_id breaks ties between tasks created in the same second.
+IndexKey = Tuple[str, int]
+
+# Only active and recently used tasks are kept in memory. Finished tasks past
+# the hot limit are spilled to SQLite and read back when looked up.
+TASK_HOT_LIMIT = int(os.environ.get("TASK_HOT_LIMIT", "1000"))
+# Each store spills to its own new file here (task_store-<pid>-*.sqlite3), removed at exit
+TASK_SPILL_DIR = os.environ.get("TASK_SPILL_DIR") or tempfile.gettempdir()
+# A task that just finished may still be written to by its coroutine
+TASK_SPILL_AFTER = float(os.environ.get("TASK_SPILL_AFTER", "60"))
+# Tasks written per spill batch, and how often the background spill runs (seconds)
+TASK_SPILL_BATCH = int(os.environ.get("TASK_SPILL_BATCH", "200"))
+TASK_SPILL_INTERVAL = float(os.environ.get("TASK_SPILL_INTERVAL", "5"))
+
+FINISHED_STATUSES = frozenset(('completed', 'failed', 'cancelled', 'interrupted', 'handed_off'))
+# Enum-like values are interned, so every task shares one string object per value
+INTERNED_FIELDS = frozenset(('status', 'streaming_protocol', 'media_format', 'resolution', 'profile',
+                             'priority', 'kind', 'ingest'))
+_MAX_KEY_ID = 2 ** 62
+
+
+def utc_now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_utc_timestamp(value: str) -> str:
+    """
+    Normalize an ISO-8601 timestamp to the ``YYYY-MM-DDTHH:MM:SSZ`` form the
+    index keys use, so string comparisons stay chronological. Values without
+    an offset are taken as UTC. Raises ValueError on anything else.
+    """
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid timestamp: {value!r} (expected ISO-8601, e.g. 2024-05-01T12:00:00Z)")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def encode_cursor(key: IndexKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> IndexKey:
+    try:
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), int(task_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class TaskRecord(MutableMapping):
+    """
+    A task entry: a mapping like the plain dicts the routes and converter
+    use, but with the common fields in slots and rarer ones in an overflow
+    dict created on first use. Reports status changes to its owning store.
+    """
+
+    FIELDS = ('input', 'filename', 'output', 'media_format', 'streaming_protocol', 'segment_duration', 'crf',
+              'resolution', 'profile', 'deadline', 'priority', 'preview', 'ingest', 'kind', 'status', 'progress',
+              'error', 'created_at', 'duration')
+    __slots__ = FIELDS + ('_extra', '_store', '_task_id')
+    _SLOTS = frozenset(FIELDS)
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None, store: Optional["TaskStore"] = None,
+                 task_id: Optional[int] = None):
+        self._extra: Optional[Dict[str, Any]] = None
+        self._store = None
+        self._task_id = task_id
+        for key, value in (data or {}).items():
+            self[key] = value
+        self._store = store
+
+    def __getitem__(self, key):
+        if key in self._SLOTS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if isinstance(value, str) and key in INTERNED_FIELDS:
+            value = sys.intern(value)
+        if key in self._SLOTS:
+            old = getattr(self, key, None)
+            setattr(self, key, value)
+            if key == 'status' and old != value and self._store is not None:
+                self._store._reindex_status(self._task_id, old, value)
+            elif key == 'streaming_protocol' and old != value and self._store is not None:
+                self._store._reindex_protocol(self._task_id, old, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._SLOTS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for key in self.FIELDS if hasattr(self, key)) + len(self._extra or ())
+
+    def get(self, key, default=None):
+        if key in self._SLOTS:
+            return getattr(self, key, default)
+        return self._extra.get(key, default) if self._extra else default
+
+    def __contains__(self, key):
+        if key in self._SLOTS:
+            return hasattr(self, key)
+        return bool(self._extra) and key in self._extra
+
+    def __repr__(self):
+        return f"TaskRecord({dict(self)!r})"
+
+    def memory_bytes(self) -> int:
+        """Approximate footprint; interned values are shared between tasks and not counted"""
+        size = sys.getsizeof(self)
+        for key in self.FIELDS:
+            value = getattr(self, key, None)
+            if value is not None and key not in INTERNED_FIELDS:
+                size += sys.getsizeof(value)
+        if self._extra is not None:
+            size += _deep_size(self._extra)
+        return size
+
+
+def _deep_size(value: Any) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(item) for item in value)
+    return size
+
+
+class SpillStore:
+    """Finished tasks on disk (SQLite), with the columns the listing indexes need"""
+
+    def __init__(self, path: Optional[str] = None):
+        # None: a new file private to this store, created on the first spill (after any fork)
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Opened on the first spill, so short-lived processes never create the file
+        if self._conn is None:
+            if self.path is None:
+                fd, self.path = tempfile.mkstemp(prefix=f"task_store-{os.getpid()}-", suffix=".sqlite3",
+                                                 dir=TASK_SPILL_DIR)
+                os.close(fd)
+                atexit.register(self.remove)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # An explicit path may hold a table from an earlier run
+            self._conn.execute("DROP TABLE IF EXISTS tasks")
+            self._conn.execute(
+                "CREATE TABLE tasks (task_id INTEGER PRIMARY KEY, created_at TEXT NOT NULL, status TEXT NOT NULL, "
+                "protocol TEXT, finished_at REAL, data BLOB NOT NULL)")
+            self._conn.execute("CREATE INDEX tasks_created ON tasks (created_at, task_id)")
+            self._conn.execute("CREATE INDEX tasks_status ON tasks (status, created_at, task_id)")
+            self._conn.execute("CREATE INDEX tasks_protocol ON tasks (protocol, created_at, task_id)")
+        return self._conn
+
+    def put_many(self, rows: List[Tuple[int, str, str, Optional[str], float, bytes]]) -> None:
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def get(self, task_id: int) -> Optional[Tuple[Dict[str, Any], float]]:
+        """A spilled task and the (monotonic) time it finished at"""
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT data, finished_at FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return (pickle.loads(row[0]), row[1]) if row else None
+
+    def status(self, task_id: int) -> Optional[str]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, task_id: int) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+
+    def clear(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM tasks")
+
+    def query(self, statuses: Optional[List[str]], protocol: Optional[str], low: Optional[IndexKey],
+              high: Optional[IndexKey], descending: bool, limit: int) -> Iterator[Tuple[IndexKey, Dict[str, Any]]]:
+        if self._conn is None:
+            return iter(())
+        clauses, params = [], []
+        if statuses:
+            clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if protocol:
+            clauses.append("protocol = ?")
+            params.append(protocol)
+        if low is not None:
+            clauses.append("(created_at, task_id) > (?, ?)")
+            params.extend((low[0], max(-1, min(low[1], _MAX_KEY_ID))))
+        if high is not None:
+            clauses.append("(created_at, task_id) < (?, ?)")
+            params.extend((high[0], min(high[1], _MAX_KEY_ID)))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        direction = "DESC" if descending else "ASC"
+        sql = (f"SELECT created_at, task_id, data FROM tasks {where} "
+               f"ORDER BY created_at {direction}, task_id {direction} LIMIT ?")
+        with self._lock:
+            rows = self._conn.execute(sql, (*params, limit)).fetchall()
+        return (((created_at, task_id), pickle.loads(data)) for created_at, task_id, data in rows)
+
+    def remove(self) -> None:
+        """Close the connection and delete the spill file"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
+
+    def size_bytes(self) -> int:
+        if self._conn is None:
+            return 0
+        total = 0
+        for suffix in ('', '-wal'):
+            try:
+                total += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return total
+
+
+class TaskStore(dict):
+    """
+    The conversion task registry.
+
+    Behaves like the plain ``{task_id: task_dict}`` mapping the routes and
+    converter already use, but keeps secondary indexes by creation time and by
+    status up to date, so listings can page through tasks without scanning and
+    serializing every entry.
+
+    Only the hot set (active tasks and the most recently used finished ones,
+    up to ``hot_limit``) is held in memory. Older finished tasks are spilled
+    to a SQLite file and rehydrated by ``store[task_id]`` / ``get`` / ``in``.
+    ``len()`` and iteration cover the hot set only; ``total()`` and ``query()``
+    cover all tasks, and ``next_id()`` allocates new task ids.
+
+    Inserts spill at most ``spill_batch`` tasks inline. ``start_spilling()``
+    runs a background loop that spills the rest in batches, writing on the
+    filesystem pool, and is woken when a task finishes past the hot limit.
+    """
+
+    def __init__(self, hot_limit: int = TASK_HOT_LIMIT, spill_path: Optional[str] = None,
+                 spill_after: float = TASK_SPILL_AFTER, spill_batch: int = TASK_SPILL_BATCH):
+        super().__init__()
+        self.hot_limit = hot_limit
+        self.spill_after = spill_after
+        self.spill_batch = spill_batch
+        self._by_created: List[IndexKey] = []
+        self._by_status: Dict[str, List[IndexKey]] = {}
+        self._by_protocol: Dict[str, List[IndexKey]] = {}
+        # Hot task ids, least recently used first
+        self._recent: "OrderedDict[int, None]" = OrderedDict()
+        self._finished_at: Dict[int, float] = {}
+        # No hot task finished before this (monotonic), so inserts skip the victim scan until it ages
+        self._earliest_finish = float('inf')
+        self._spill = SpillStore(spill_path)
+        self._last_id = 0
+        self._cold_counts: Counter = Counter()
+        # Task ids being written by the background spill (still hot until the write lands)
+        self._spilling: set = set()
+        self._spill_task: Optional[asyncio.Task] = None
+        self._spill_wake: Optional[asyncio.Event] = None
+        self._spill_scheduled = False
+        self.stats = {"spilled": 0, "rehydrated": 0}
+
+    @staticmethod
+    def _key(task_id: int, task: Dict[str, Any]) -> IndexKey:
+        return (task.get('created_at') or '', task_id)
+
+    def __setitem__(self, task_id, task):
+        self.put(task_id, task)
+
+    def put(self, task_id, task, finished_at: Optional[float] = None, spill: bool = True) -> None:
+        """
+        Insert or replace a task. ``finished_at`` (epoch seconds) backdates a
+        task that finished before it was registered; ``spill=False`` leaves
+        spilling to the caller (``spill_idle``), for bulk inserts.
+        """
+        if dict.__contains__(self, task_id):
+            self._unindex(task_id, dict.__getitem__(self, task_id))
+        elif self._cold_status(task_id) is not None:
+            self._drop_cold(task_id)
+        if finished_at is not None and task.get('status') in FINISHED_STATUSES:
+            self._finished_at[task_id] = time.monotonic() - max(0.0, time.time() - finished_at)
+        self._insert_hot(task_id, TaskRecord(task, None, task_id))
+        if isinstance(task_id, int):
+            self._last_id = max(self._last_id, task_id)
+        if spill:
+            self._spill_cold_tasks()
+
+    def _insert_hot(self, task_id: int, task: TaskRecord) -> None:
+        task._store = self
+        task._task_id = task_id
+        super().__setitem__(task_id, task)
+        key = self._key(task_id, task)
+        bisect.insort(self._by_created, key)
+        bisect.insort(self._by_status.setdefault(task.get('status', 'unknown'), []), key)
+        if task.get('streaming_protocol'):
+            bisect.insort(self._by_protocol.setdefault(task['streaming_protocol'], []), key)
+        self._recent[task_id] = None
+        if task.get('status') in FINISHED_STATUSES:
+            self._note_finished(task_id, self._finished_at.get(task_id, time.monotonic()))
+
+    def __getitem__(self, task_id):
+        if dict.__contains__(self, task_id):
+            self._recent.move_to_end(task_id)
+            return dict.__getitem__(self, task_id)
+        task = self._rehydrate(task_id)
+        if task is None:
+            raise KeyError(task_id)
+        return task
+
+    def get(self, task_id, default=None):
+        try:
+            return self[task_id]
+        except KeyError:
+            return default
+
+    def __contains__(self, task_id):
+        return dict.__contains__(self, task_id) or self._cold_status(task_id) is not None
+
+    def total(self) -> int:
+        """Number of tasks, in memory and spilled (len() and iteration cover the hot set only)"""
+        return dict.__len__(self) + sum(self._cold_counts.values())
+
+    def next_id(self) -> int:
+        """A task id not used by any task registered so far"""
+        return self._last_id + 1
+
+    def __delitem__(self, task_id):
+        if not dict.__contains__(self, task_id):
+            if self._cold_status(task_id) is None:
+                raise KeyError(task_id)
+            self._drop_cold(task_id)
+            return
+        self._remove_hot(task_id)
+
+    def pop(self, task_id, *default):
+        if dict.__contains__(self, task_id):
+            return self._remove_hot(task_id)
+        task = self._rehydrate(task_id)
+        if task is None:
+            if default:
+                return default[0]
+            raise KeyError(task_id)
+        return self._remove_hot(task_id)
+
+    def _remove_hot(self, task_id: int) -> TaskRecord:
+        task = dict.__getitem__(self, task_id)
+        self._unindex(task_id, task)
+        super().__delitem__(task_id)
+        self._recent.pop(task_id, None)
+        self._finished_at.pop(task_id, None)
+        task._store = None
+        return task
+
+    def clear(self):
+        super().clear()
+        self._by_created.clear()
+        self._by_status.clear()
+        self._by_protocol.clear()
+        self._recent.clear()
+        self._finished_at.clear()
+        self._spill.clear()
+        self._cold_counts.clear()
+
+    # -- spilling ------------------------------------------------------------
+
+    def _cold_status(self, task_id) -> Optional[str]:
+        if not self._cold_counts or not isinstance(task_id, int):
+            return None
+        return self._spill.status(task_id)
+
+    def _drop_cold(self, task_id: int) -> Optional[Tuple[Dict[str, Any], float]]:
+        row = self._spill.get(task_id)
+        if row is None:
+            return None
+        self._spill.delete(task_id)
+        status = row[0].get('status', 'unknown')
+        self._cold_counts[status] -= 1
+        if not self._cold_counts[status]:
+            del self._cold_counts[status]
+        return row
+
+    def _rehydrate(self, task_id) -> Optional[TaskRecord]:
+        if not self._cold_counts or not isinstance(task_id, int):
+            return None
+        row = self._drop_cold(task_id)
+        if row is None:
+            return None
+        data, finished_at = row
+        task = TaskRecord(data, None, task_id)
+        # Keep the original finish time, so it can be spilled again right away
+        self._finished_at[task_id] = finished_at
+        self._insert_hot(task_id, task)
+        self.stats["rehydrated"] += 1
+        # Polling old tasks must not grow the hot set; the task just asked for stays
+        self._spill_cold_tasks(keep=task_id)
+        return task
+
+    def _note_finished(self, task_id: int, finished_at: float) -> None:
+        self._finished_at[task_id] = finished_at
+        self._earliest_finish = min(self._earliest_finish, finished_at)
+
+    def _spill_victims(self, keep: Optional[int] = None) -> List[int]:
+        """Least recently used finished tasks past the hot limit, at most one batch"""
+        excess = min(dict.__len__(self) - len(self._spilling) - self.hot_limit, self.spill_batch)
+        cutoff = time.monotonic() - self.spill_after
+        if excess <= 0 or self._earliest_finish > cutoff:
+            return []
+        victims = []
+        earliest = float('inf')
+        for task_id in self._recent:
+            if len(victims) == excess:
+                break
+            finished_at = self._finished_at.get(task_id)
+            if finished_at is None:
+                continue
+            if finished_at <= cutoff and task_id != keep and task_id not in self._spilling:
+                victims.append(task_id)
+            else:
+                earliest = min(earliest, finished_at)
+        else:
+            # Scanned every hot task: nothing else can be spilled before `earliest` ages
+            self._earliest_finish = earliest
+        return victims
+
+    def _spill_rows(self, victims: List[int]) -> List[Tuple[int, str, str, Optional[str], float, bytes]]:
+        rows = []
+        for task_id in victims:
+            task = dict.__getitem__(self, task_id)
+            try:
+                # pickle keeps int keys, tuples and other values exactly as they were
+                data = pickle.dumps(dict(task), pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                print(f"Keeping task {task_id} in memory, it cannot be spilled: {e}")
+                continue
+            rows.append((task_id, task.get('created_at') or '', task.get('status', 'unknown'),
+                         task.get('streaming_protocol'), self._finished_at[task_id], data))
+        return rows
+
+    def _spill_cold_tasks(self, keep: Optional[int] = None) -> None:
+        """Move one batch of least recently used finished tasks (except `keep`) to disk"""
+        rows = self._spill_rows(self._spill_victims(keep))
+        if not rows:
+            return
+        self._spill.put_many(rows)
+        for task_id, _, status, _, _, _ in rows:
+            self._remove_hot(task_id)
+            self._cold_counts[status] += 1
+        self.stats["spilled"] += len(rows)
+
+    async def spill_idle(self) -> int:
+        """Spill everything past the hot limit in batches, writing off the event loop; returns the count"""
+        spilled = 0
+        while True:
+            victims = self._spill_victims()
+            rows = self._spill_rows(victims)
+            if not rows:
+                return spilled
+            tasks = {task_id: dict.__getitem__(self, task_id) for task_id in victims}
+            self._spilling.update(tasks)
+            try:
+                await blocking_io.run_blocking(self._spill.put_many, rows)
+            finally:
+                self._spilling.difference_update(tasks)
+            moved = 0
+            for task_id, _, status, _, _, _ in rows:
+                task = tasks[task_id]
+                if dict.get(self, task_id) is task and task.get('status', 'unknown') == status:
+                    self._remove_hot(task_id)
+                    self._cold_counts[status] += 1
+                    moved += 1
+                else:
+                    # Replaced, removed or reopened during the write: the row is stale
+                    self._spill.delete(task_id)
+            self.stats["spilled"] += moved
+            spilled += moved
+
+    def _schedule_spill(self) -> None:
+        """A task finished: spill soon, outside whatever code changed its status"""
+        if self._spill_scheduled or dict.__len__(self) <= self.hot_limit:
+            return
+        if self._spill_wake is not None:
+            self._spill_wake.set()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._spill_cold_tasks()
+            return
+        self._spill_scheduled = True
+
+        def spill():
+            self._spill_scheduled = False
+            self._spill_cold_tasks()
+        loop.call_soon(spill)
+
+    async def _spill_loop(self, interval: float) -> None:
+        while True:
+            try:
+                await self.spill_idle()
+            except Exception as e:
+                print(f"Spilling finished tasks failed: {e}")
+            try:
+                await asyncio.wait_for(self._spill_wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._spill_wake.clear()
+
+    def start_spilling(self, interval: float = TASK_SPILL_INTERVAL) -> None:
+        if self._spill_task is None:
+            self._spill_wake = asyncio.Event()
+            self._spill_task = asyncio.create_task(self._spill_loop(interval))
+
+    async def stop_spilling(self) -> None:
+        if self._spill_task is not None:
+            self._spill_task.cancel()
+            try:
+                await self._spill_task
+            except asyncio.CancelledError:
+                pass
+            self._spill_task = None
+            self._spill_wake = None
+
+    # -- indexes -------------------------------------------------------------
+
+    @staticmethod
+    def _remove_key(keys: List[IndexKey], key: IndexKey) -> None:
+        index = bisect.bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            del keys[index]
+
+    def _unindex(self, task_id: int, task: Dict[str, Any]) -> None:
+        key = self._key(task_id, task)
+        self._remove_key(self._by_created, key)
+        status_keys = self._by_status.get(task.get('status', 'unknown'))
+        if status_keys is not None:
+            self._remove_key(status_keys, key)
+        if task.get('streaming_protocol'):
+            self._remove_key(self._by_protocol.get(task['streaming_protocol'], []), key)
+
+    def _reindex_status(self, task_id: int, old: Optional[str], new: str) -> None:
+        key = self._key(task_id, dict.__getitem__(self, task_id))
+        self._remove_key(self._by_status.get(old or 'unknown', []), key)
+        bisect.insort(self._by_status.setdefault(new, []), key)
+        if new in FINISHED_STATUSES:
+            self._note_finished(task_id, time.monotonic())
+            self._schedule_spill()
+        else:
+            self._finished_at.pop(task_id, None)
+
+    def _reindex_protocol(self, task_id: int, old: Optional[str], new: Optional[str]) -> None:
+        key = self._key(task_id, dict.__getitem__(self, task_id))
+        if old:
+            self._remove_key(self._by_protocol.get(old, []), key)
+        if new:
+            bisect.insort(self._by_protocol.setdefault(new, []), key)
+
+    def status_counts(self) -> Dict[str, int]:
+        counts = Counter({status: len(keys) for status, keys in self._by_status.items() if keys})
+        counts.update(self._cold_counts)
+        return dict(counts)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        hot = list(dict.values(self))
+        hot_bytes = sum(task.memory_bytes() for task in hot)
+        # What the same tasks would take as plain dicts
+        dict_bytes = sum(_deep_size(dict(task)) - sum(sys.getsizeof(value) for key, value in task.items()
+                                                      if key in INTERNED_FIELDS and value is not None)
+                         for task in hot)
+        return {
+            "tasks": self.total(),
+            "hot_tasks": len(hot),
+            "spilled_tasks": sum(self._cold_counts.values()),
+            "hot_limit": self.hot_limit,
+            "hot_bytes": hot_bytes,
+            "bytes_per_hot_task": round(hot_bytes / len(hot)) if hot else 0,
+            "plain_dict_bytes_per_task": round(dict_bytes / len(hot)) if hot else 0,
+            "index_bytes": sys.getsizeof(self._by_created) + sum(sys.getsizeof(key) for key in self._by_created),
+            "spill_file_bytes": self._spill.size_bytes(),
+            **self.stats,
+        }
+
+    @staticmethod
+    def _slice(keys: List[IndexKey], low: Optional[IndexKey], high: Optional[IndexKey],
+               descending: bool) -> Iterable[IndexKey]:
+        """Keys strictly between `low` and `high` (either bound optional), in the requested order"""
+        start = bisect.bisect_right(keys, low) if low is not None else 0
+        end = bisect.bisect_left(keys, high) if high is not None else len(keys)
+        if descending:
+            return (keys[i] for i in range(end - 1, start - 1, -1))
+        return (keys[i] for i in range(start, end))
+
+    def _hot_matches(self, statuses: Optional[List[str]], protocol: Optional[str], low: Optional[IndexKey],
+                     high: Optional[IndexKey], descending: bool) -> Iterator[Tuple[IndexKey, Dict[str, Any]]]:
+        # Walk the smallest applicable index and filter the rest per task
+        by_protocol = self._by_protocol.get(protocol, []) if protocol else None
+        if statuses and (by_protocol is None
+                         or sum(len(self._by_status.get(status, [])) for status in statuses) < len(by_protocol)):
+            streams = [self._slice(self._by_status.get(status, []), low, high, descending) for status in statuses]
+            keys: Iterator[IndexKey] = heapq.merge(*streams, reverse=descending)
+        elif by_protocol is not None:
+            keys = iter(self._slice(by_protocol, low, high, descending))
+        else:
+            keys = iter(self._slice(self._by_created, low, high, descending))
+        for key in keys:
+            task = dict.get(self, key[1])
+            if task is None:
+                continue
+            if protocol and task.get('streaming_protocol') != protocol:
+                continue
+            if statuses and task.get('status', 'unknown') not in statuses:
+                continue
+            yield key, task
+
+    def query(
+        self,
+        statuses: Optional[List[str]] = None,
+        protocol: Optional[str] = None,
+        created_after: Optional[str] = None,
+        created_before: Optional[str] = None,
+        descending: bool = True,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Tuple[int, Dict[str, Any]]], Optional[str]]:
+        """
+        Page through tasks in creation order using the indexes.
+
+        Returns ``(items, next_cursor)`` where items are ``(task_id, task)`` pairs
+        and next_cursor is None once the listing is exhausted. Spilled tasks
+        are listed from disk without being brought back into memory.
+        """
+        created_after = parse_utc_timestamp(created_after) if created_after else None
+        created_before = parse_utc_timestamp(created_before) if created_before else None
+        # Bounds are exclusive keys; pad timestamps so same-second tasks are kept
+        low = (created_after, -1) if created_after else None
+        high = (created_before, float('inf')) if created_before else None
+        if cursor:
+            position = decode_cursor(cursor)
+            if descending:
+                high = position if high is None or position < high else high
+            else:
+                low = position if low is None or position > low else low
+
+        matches = self._hot_matches(statuses, protocol, low, high, descending)
+        if self._cold_counts:
+            cold = self._spill.query(statuses, protocol, low, high, descending, limit + 1)
+            matches = heapq.merge(matches, cold, key=lambda match: match[0], reverse=descending)
+
+        items = []
+        last_key = None
+        for key, task in matches:
+            if len(items) == limit:
+                return items, encode_cursor(last_key)
+            items.append((key[1], task))
+            last_key = key
+        return items, None
+
+
+class BoundedDict(OrderedDict):
+    """Dict that drops its least recently set entries beyond `maxlen`"""
+
+    def __init__(self, maxlen: int):
+        super().__init__()
+        self.maxlen = maxlen
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxlen:
+            self.popitem(last=False)
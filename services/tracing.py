@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import asyncio
+import secrets
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+from services import blocking_io
+
+# Per-task stage timeline: upload receive, disk write, queue wait, probe,
+# ffmpeg start, first segment, encode and manifest ready, as OpenTelemetry-style
+# spans sharing one trace id per task. Finished spans can also be appended to a
+# JSON-lines file for external tooling.
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH")
+MAX_TRACES = int(os.environ.get("TRACE_MAX_TASKS", "10000"))
+STAGE_SAMPLES = 1000
+SEGMENT_EXTENSIONS = ('.ts', '.m4s')
+
+STAGES = (
+    'upload_receive', 'disk_write', 'queue_wait', 'probe', 'ffmpeg_start',
+    'first_segment', 'preview_encode', 'encode', 'manifest_ready',
+)
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class RequestTimingMiddleware:
+    """ASGI middleware that records when an upload request arrived, before its body is read"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].startswith('/api/v1/upload'):
+            scope.setdefault('state', {})['request_started'] = time.time()
+        await self.app(scope, receive, send)
+
+
+class TaskTrace:
+    """Spans recorded for one task; times are wall-clock seconds since the epoch"""
+
+    def __init__(self, task_id: int):
+        self.task_id = task_id
+        self.trace_id = secrets.token_hex(16)
+        self.root_span_id = secrets.token_hex(8)
+        self.started = time.time()
+        self.ended: Optional[float] = None
+        self.status = 'in_progress'
+        self.marks: Dict[str, float] = {}
+        self.spans: List[Dict[str, Any]] = []
+
+    def record(self, name: str, start: float, end: float, **attributes) -> Dict[str, Any]:
+        span = {
+            "name": name,
+            "span_id": secrets.token_hex(8),
+            "start": start,
+            "end": end,
+            "duration_ms": round((end - start) * 1000, 3),
+            "attributes": attributes,
+        }
+        self.spans.append(span)
+        self.started = min(self.started, start)
+        stage_stats.add(name, end - start)
+        _export(self, span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        start = time.time()
+        try:
+            yield attributes
+        finally:
+            self.record(name, start, time.time(), **attributes)
+
+    def mark(self, name: str, at: Optional[float] = None) -> None:
+        self.marks[name] = at if at is not None else time.time()
+
+    def finish(self, status: str) -> None:
+        self.ended = time.time()
+        self.status = status
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.ended or time.time()
+        return {
+            "task_id": self.task_id,
+            "trace_id": self.trace_id,
+            "status": self.status,
+            "total_ms": round((end - self.started) * 1000, 3),
+            "spans": sorted(self.spans, key=lambda span: span["start"]),
+        }
+
+    def otel_spans(self) -> List[Dict[str, Any]]:
+        """Spans in the OpenTelemetry JSON shape, with a root span for the whole task"""
+        end = self.ended or time.time()
+        root = _otel_span(self, {"name": "task", "span_id": self.root_span_id, "start": self.started,
+                                 "end": end, "attributes": {"status": self.status}}, parent=None)
+        return [root] + [_otel_span(self, span) for span in sorted(self.spans, key=lambda s: s["start"])]
+
+
+def _otel_span(trace: TaskTrace, span: Dict[str, Any], parent: Optional[str] = "root") -> Dict[str, Any]:
+    attributes = {"task.id": trace.task_id, **span["attributes"]}
+    return {
+        "traceId": trace.trace_id,
+        "spanId": span["span_id"],
+        "parentSpanId": trace.root_span_id if parent else "",
+        "name": span["name"],
+        "startTimeUnixNano": int(span["start"] * 1e9),
+        "endTimeUnixNano": int(span["end"] * 1e9),
+        "attributes": [{"key": key, "value": {"stringValue": str(value)}} for key, value in attributes.items()],
+    }
+
+
+def _write_lines(path: str, lines: str) -> None:
+    with open(path, 'a') as f:
+        f.write(lines)
+
+
+def _export(trace: TaskTrace, span: Dict[str, Any]) -> None:
+    if not TRACE_EXPORT_PATH:
+        return
+    line = json.dumps(_otel_span(trace, span)) + "\n"
+    try:
+        asyncio.get_running_loop().run_in_executor(blocking_io.executor(), _write_lines, TRACE_EXPORT_PATH, line)
+    except RuntimeError:
+        _write_lines(TRACE_EXPORT_PATH, line)
+
+
+class StageStats:
+    """Recent durations per stage for p50/p95 reporting"""
+
+    def __init__(self, samples: int = STAGE_SAMPLES):
+        self.samples = samples
+        self.durations: Dict[str, Deque[float]] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations.setdefault(name, deque(maxlen=self.samples)).append(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        order = {name: index for index, name in enumerate(STAGES)}
+        return {
+            name: {
+                "count": len(values),
+                "p50_ms": round(_percentile(list(values), 50) * 1000, 1),
+                "p95_ms": round(_percentile(list(values), 95) * 1000, 1),
+            }
+            for name, values in sorted(self.durations.items(), key=lambda item: order.get(item[0], len(order)))
+        }
+
+
+stage_stats = StageStats()
+task_traces: "OrderedDict[int, TaskTrace]" = OrderedDict()
+
+
+def trace_for(task_id: int) -> TaskTrace:
+    trace = task_traces.get(task_id)
+    if trace is None:
+        trace = task_traces[task_id] = TaskTrace(task_id)
+        while len(task_traces) > MAX_TRACES:
+            task_traces.popitem(last=False)
+    return trace
+
+
+async def watch_first_segment(trace: TaskTrace, directory: str, started: float, interval: float = 0.25) -> None:
+    """Record the 'first_segment' span once a new segment file appears in `directory` (cancel when done)"""
+    # Segments left by an interrupted run do not count
+    existing = set(await blocking_io.listdir(directory))
+    while True:
+        names = await blocking_io.listdir(directory)
+        if any(name.endswith(SEGMENT_EXTENSIONS) and name not in existing for name in names):
+            trace.record('first_segment', started, time.time())
+            return
+        await asyncio.sleep(interval)
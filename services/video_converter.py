@@ -1,13 +1,58 @@
 import os
 import subprocess
 import asyncio
+import time
+import shutil
 import psutil
 from pathlib import Path
 from typing import Dict, Any
+from services import blocking_io
+from services.encoding_profiles import (
+    DEFAULT_PROFILE, audio_args, encode_stats, get_profile, probe_duration, select_profile, video_args
+)
+from services import checkpoint
+from services.job_control import JobCancelled, JobInterrupted, kill_process_tree, register_encode, unregister_encode
+from services.cpu_allocator import cpu_allocator, with_thread_budget
+from services.task_store import utc_now_iso
+from services.tracing import trace_for, watch_first_segment
+from services.storage import start_publishing, task_output_dir
 
 # Store RTSP server processes
 rtsp_servers: Dict[str, Any] = {}
 
+# Two-phase mode: a quick low-resolution preview is published first, and the
+# full-quality encode replaces its manifest when it finishes
+PREVIEW_PROFILE = os.environ.get("PREVIEW_PROFILE", "ultrafast")
+PREVIEW_RESOLUTION = os.environ.get("PREVIEW_RESOLUTION", "360p")
+PREVIEW_CRF = int(os.environ.get("PREVIEW_CRF", "28"))
+
+def resolve_output_path(output_dir: str, media_format: str, streaming_protocol: str):
+    """Map the requested media format/protocol to the packaging format and output path"""
+    # Set output path based on format
+    # Frontend sends: hls, ts, cmaf, dash
+    # - hls           -> HLS (.m3u8)
+    # - ts            -> HLS (.m3u8) but RTSP 프로토콜에서 사용 (TS 기반)
+    # - cmaf + hls    -> HLS (.m3u8) 로 취급 (CMAF-HLS 조합)
+    # - cmaf + dash   -> DASH (.mpd)
+    # - dash          -> DASH (.mpd)
+
+    if media_format in ('hls', 'ts'):
+        # TS 포맷은 내부적으로 HLS 파이프라인을 사용하되,
+        # 스트리밍 프로토콜에서 RTSP 를 선택하도록 UI에서 제한함.
+        return 'hls', os.path.join(output_dir, 'playlist.m3u8')
+    if media_format == 'cmaf':
+        # CMAF + HLS  -> HLS(.m3u8)
+        # CMAF + DASH -> DASH(.mpd) in 'dash' subdirectory
+        if streaming_protocol == 'hls':
+            return 'hls', os.path.join(output_dir, 'playlist.m3u8')
+        return 'dash', os.path.join(output_dir, 'dash', 'playlist.mpd')
+    if media_format == 'dash':
+        # DASH -> DASH(.mpd) in 'dash' subdirectory
+        return 'dash', os.path.join(output_dir, 'dash', 'playlist.mpd')
+    # fallback: mp4 파일 그대로 저장하는 경우 등
+    return media_format, os.path.join(output_dir, 'output.mp4')
+
+
 async def convert_video(task_id: int, conversion_tasks: dict, output_dir: str, rtsp_port: int = 8554):
     """
     Convert video to the specified format and protocol
@@ -17,6 +62,13 @@ async def convert_video(task_id: int, conversion_tasks: dict, output_dir: str, r
         return
         
     task = conversion_tasks[task_id]
+    trace = trace_for(task_id)
+    if 'queued' in trace.marks:
+        trace.record('queue_wait', trace.marks.pop('queued'), time.time())
+    if task.get('status') in ('cancelled', 'handed_off'):
+        print(f"Task {task_id} was {task['status'].replace('_', ' ')} before it started")
+        trace.finish(task['status'])
+        return
     task['status'] = 'processing'
     print(f"Starting conversion for task {task_id}")
     print(f"Input: {task.get('input')}")
@@ -42,30 +94,210 @@ async def convert_video(task_id: int, conversion_tasks: dict, output_dir: str, r
         
         # Create output directory if it doesn't exist
         output_dir = os.path.dirname(output_path)
-        os.makedirs(output_dir, exist_ok=True)
+        await blocking_io.makedirs(output_dir, exist_ok=True)
         print(f"Ensured output directory exists: {output_dir}")
         
         # Verify input file exists
-        if not os.path.exists(input_path):
+        if not await blocking_io.exists(input_path):
             raise FileNotFoundError(f"Input file not found: {input_path}")
         
-        if streaming_protocol == 'hls':
-            await _convert_to_hls(input_path, output_path, task_id, conversion_tasks, segment_duration, crf, resolution)
-        elif streaming_protocol == 'dash':
-            await _convert_to_dash(input_path, output_path, task_id, conversion_tasks, segment_duration, crf, resolution)
+        if task.get('status') == 'cancelled':
+            raise JobCancelled()
+        
+        if streaming_protocol in ('hls', 'dash'):
+            # Pick the encoding profile from the deadline, the running encodes and measured speeds
+            with trace.span('probe'):
+                duration = await probe_duration(input_path)
+            profile = task.get('profile') or select_profile(duration, task.get('deadline'))
+            task['profile'] = profile
+            task['duration'] = duration
+            print(f"Using encoding profile '{profile}' for task {task_id} (duration: {duration}s)")
+            # Persist the job so a crash or restart can resume it from its last segment
+            await blocking_io.run_blocking(checkpoint.write_checkpoint, task, 'running')
+
+            # With object storage, segments are published while ffmpeg is still writing them
+            publisher = start_publishing(task_output_dir(task))
+            try:
+                convert = _convert_to_hls if streaming_protocol == 'hls' else _convert_to_dash
+                encode_path = output_path
+                priority = task.get('priority') or 'normal'
+                if task.get('preview'):
+                    await _encode_preview(task_id, conversion_tasks, input_path, output_path, segment_duration)
+                    # The full encode writes a staging manifest beside the preview and
+                    # yields to other work; its manifest replaces the preview's when done
+                    encode_path = _phase_path(output_path, 'full')
+                    priority = 'high' if priority == 'high' else 'low'
+                    task['phases']['full']['status'] = 'processing'
+                encode_stats.job_started()
+                started = time.monotonic()
+                peak_jobs = encode_stats.active_jobs
+                try:
+                    await convert(input_path, encode_path, task_id, conversion_tasks, segment_duration, crf, resolution, profile,
+                                  priority=priority)
+                finally:
+                    peak_jobs = max(peak_jobs, encode_stats.active_jobs)
+                    encode_stats.job_finished()
+                if duration and not task.get('resume_offset'):
+                    encode_stats.record(get_profile(profile)['preset'], duration, time.monotonic() - started, peak_jobs)
+                if encode_path != output_path:
+                    await blocking_io.run_blocking(os.replace, encode_path, output_path)
+                    task['phases']['full'].update(status='completed', ready_at=utc_now_iso())
+                if await blocking_io.exists(output_path):
+                    ready = time.time()
+                    trace.record('manifest_ready', trace.marks.get('encode_end', ready), ready)
+            except BaseException as e:
+                full = (task.get('phases') or {}).get('full')
+                # An interrupted full encode resumes from its checkpoint; any other end is final
+                if full and full.get('status') == 'processing' and not isinstance(e, JobInterrupted):
+                    if isinstance(e, JobCancelled):
+                        full.update(status='cancelled', ended_at=utc_now_iso())
+                    else:
+                        full.update(status='failed', error=str(e), ended_at=utc_now_iso())
+                if publisher:
+                    await publisher.stop(publish_rest=False)
+                raise
+            if publisher:
+                task['storage'] = await publisher.stop()
+            await blocking_io.run_blocking(checkpoint.write_checkpoint, task, 'completed')
         elif streaming_protocol == 'rtsp':
             await _start_rtsp_stream(input_path, str(task_id), rtsp_port, task_id, conversion_tasks)
         
         task['status'] = 'completed'
         print(f"Successfully completed conversion for task {task_id}")
         
+    except JobCancelled:
+        task['status'] = 'cancelled'
+        await _finalize_checkpoint(task, 'cancelled')
+        print(f"Task {task_id} was cancelled")
+    except JobInterrupted:
+        # Stopped by a drain: leave the checkpoint 'running' so the next instance resumes it
+        if task.get('streaming_protocol') in ('hls', 'dash'):
+            try:
+                await blocking_io.run_blocking(checkpoint.write_checkpoint, task, 'running')
+            except OSError as e:
+                print(f"Could not update checkpoint: {e}")
+        print(f"Task {task_id} was interrupted and checkpointed")
     except Exception as e:
         error_msg = f"Error in convert_video: {str(e)}"
         print(error_msg)
         task['status'] = 'failed'
         task['error'] = error_msg
+        await _finalize_checkpoint(task, 'failed')
         # Don't re-raise to prevent unhandled exceptions in the background task
         print(f"Task {task_id} failed: {error_msg}")
+    finally:
+        trace.finish(task['status'])
+
+def _phase_path(output_path: str, name: str) -> str:
+    """playlist.m3u8 -> preview.m3u8 / full.m3u8 in the same directory"""
+    return os.path.join(os.path.dirname(output_path), name + os.path.splitext(output_path)[1])
+
+
+def _publish_manifest(source: str, target: str) -> None:
+    """Copy a manifest over the published one atomically, so players never read a partial file"""
+    tmp_path = target + '.tmp'
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+async def _encode_preview(task_id: int, conversion_tasks: dict, input_path: str, output_path: str, segment_duration: int):
+    """
+    Encode the low-resolution ultrafast preview and publish it as the task's
+    manifest. It runs at high priority, so low-priority full encodes pause for it.
+    """
+    task = conversion_tasks[task_id]
+    preview_path = _phase_path(output_path, 'preview')
+    task['phases'] = {
+        'preview': {'status': 'processing', 'manifest': os.path.basename(preview_path),
+                    'profile': PREVIEW_PROFILE, 'resolution': PREVIEW_RESOLUTION},
+        'full': {'status': 'pending', 'manifest': os.path.basename(output_path),
+                 'profile': task.get('profile'), 'resolution': task.get('resolution', 'source')},
+    }
+    phase = task['phases']['preview']
+    # A resumed job whose preview was already published goes straight to the full encode
+    if await blocking_io.exists(output_path):
+        phase['status'] = 'completed'
+        return
+
+    if task['streaming_protocol'] == 'hls':
+        cmd = _build_hls_command(input_path, preview_path, segment_duration, PREVIEW_CRF, PREVIEW_RESOLUTION, PREVIEW_PROFILE,
+                                 playlist_type='vod')
+    else:
+        cmd = _build_dash_command(input_path, preview_path, segment_duration, PREVIEW_CRF, PREVIEW_RESOLUTION, PREVIEW_PROFILE,
+                                  name_prefix='preview-')
+    try:
+        await _run_ffmpeg(cmd, task_id, conversion_tasks, priority='high', stage='preview_encode')
+        await blocking_io.run_blocking(_publish_manifest, preview_path, output_path)
+    except JobCancelled:
+        phase['status'] = 'cancelled'
+        raise
+    except JobInterrupted:
+        # Stopped by a drain, not broken: the next instance encodes the preview again
+        phase['status'] = 'interrupted'
+        raise
+    except Exception:
+        phase['status'] = 'failed'
+        raise
+    phase.update(status='completed', ready_at=utc_now_iso())
+    print(f"Preview for task {task_id} published at {output_path}")
+
+
+async def _finalize_checkpoint(task: dict, state: str):
+    """Record a terminal state for a job that already has a checkpoint"""
+    if task.get('output') and await blocking_io.exists(checkpoint.checkpoint_path(task['output'])):
+        try:
+            await blocking_io.run_blocking(checkpoint.write_checkpoint, task, state)
+        except OSError as e:
+            print(f"Could not update checkpoint: {e}")
+
+
+async def _run_ffmpeg(cmd: list, task_id: int, conversion_tasks: dict, priority: str | None = None, stage: str = 'encode'):
+    """
+    Run an encode, registered for cancellation and preemption. stderr is read
+    to the end while ffmpeg runs so a full pipe can never stall the encode.
+    `priority` overrides the task's priority; `stage` names the trace span.
+    """
+    task = conversion_tasks[task_id]
+    if task.get('status') == 'cancelled':
+        raise JobCancelled()
+    if task.get('status') == 'interrupted':
+        raise JobInterrupted()
+
+    trace = trace_for(task_id)
+    threads = cpu_allocator.thread_budget()
+    spawn_started = time.time()
+    process = await asyncio.create_subprocess_exec(
+        *with_thread_budget(cmd, threads),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    encode_started = time.time()
+    trace.record('ffmpeg_start', spawn_started, encode_started)
+    register_encode(task_id, process, priority or task.get('priority') or 'normal', conversion_tasks)
+    cpu_allocator.start(task_id, process, threads)
+    watcher = None
+    if not any(span['name'] == 'first_segment' for span in trace.spans):
+        watcher = asyncio.create_task(watch_first_segment(trace, os.path.dirname(task['output']), encode_started))
+    try:
+        _, error = await process.communicate()
+    except asyncio.CancelledError:
+        kill_process_tree(process)
+        raise
+    finally:
+        if watcher:
+            watcher.cancel()
+        unregister_encode(task_id, conversion_tasks)
+        cpu_allocator.release(task_id)
+    trace.mark('encode_end')
+    trace.record(stage, encode_started, trace.marks['encode_end'], returncode=process.returncode)
+
+    if task.get('status') == 'cancelled':
+        raise JobCancelled()
+    if task.get('status') == 'interrupted':
+        raise JobInterrupted()
+    if process.returncode != 0:
+        raise Exception(f"FFmpeg error: {error.decode(errors='replace')}")
+
 
 def _build_scale_filter(resolution: str) -> str | None:
     resolution = (resolution or 'source').lower()
@@ -78,54 +310,73 @@ def _build_scale_filter(resolution: str) -> str | None:
     return None
 
 
-async def _convert_to_hls(input_path: str, output_path: str, task_id: int, conversion_tasks: dict, segment_duration: int = 6, crf: int = 20, resolution: str = 'source'):
-    """Convert video to HLS format"""
-    # Ensure output directory exists
-    output_dir = os.path.dirname(output_path)
-    os.makedirs(output_dir, exist_ok=True)
-    
+def _build_hls_command(input_path: str, output_path: str, segment_duration: int = 6, crf: int = 20, resolution: str = 'source', profile: str = DEFAULT_PROFILE,
+                       start_number: int = 0, start_offset: float = 0.0, playlist_path: str | None = None,
+                       playlist_type: str = 'event') -> list:
+    """
+    Build the ffmpeg command line for HLS packaging.
+    A non-zero `start_offset` resumes the encode at that media time, numbering
+    segments from `start_number` and writing the playlist to `playlist_path`.
+    Encodes that are not resumable can ask for a 'vod' playlist directly.
+    """
     scale_filter = _build_scale_filter(resolution)
 
-    cmd = [
-        'ffmpeg',
-        '-y',  # Overwrite output files without asking
+    cmd = ['ffmpeg', '-y']  # Overwrite output files without asking
+    if start_offset:
+        cmd.extend(['-ss', f'{start_offset:.3f}'])
+    cmd.extend([
         '-i', input_path,
-        '-c:v', 'libx264',
-        '-preset', 'veryfast',
-        '-crf', str(crf),
-    ]
+        *video_args(profile, crf, segment_duration),
+    ])
 
     if scale_filter:
         cmd.extend(['-vf', scale_filter])
+    if start_offset:
+        # Keep timestamps continuous with the segments already written
+        cmd.extend(['-output_ts_offset', f'{start_offset:.3f}'])
 
     cmd.extend([
-        '-c:a', 'aac',
+        *audio_args(profile),
         '-hls_time', str(segment_duration),
-        '-hls_playlist_type', 'vod',
+        # ffmpeg only writes a VOD playlist when the encode ends. EVENT playlists are
+        # rewritten after every segment, so an interrupted encode leaves the list
+        # of finished segments to resume from; see checkpoint.finish_hls_playlist
+        '-hls_playlist_type', playlist_type,
         '-hls_segment_filename', output_path.replace('.m3u8', '_%03d.ts'),
         '-hls_flags', 'independent_segments',
-        '-start_number', '0',  # Start segment numbering from 0
-        output_path
+        '-start_number', str(start_number),  # Segment numbering starts from 0 unless resuming
+        playlist_path or output_path
     ])
-    
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    
-    await process.wait()
-    
-    if process.returncode != 0:
-        error = await process.stderr.read()
-        raise Exception(f"FFmpeg error: {error.decode()}")
+    return cmd
 
-async def _convert_to_dash(input_path: str, output_path: str, task_id: int, conversion_tasks: dict, segment_duration: int = 6, crf: int = 20, resolution: str = 'source'):
-    """Convert video to DASH format"""
-    output_dir = os.path.dirname(output_path)
+
+async def _convert_to_hls(input_path: str, output_path: str, task_id: int, conversion_tasks: dict, segment_duration: int = 6, crf: int = 20, resolution: str = 'source', profile: str = DEFAULT_PROFILE,
+                          priority: str | None = None):
+    """Convert video to HLS format"""
     # Ensure output directory exists
-    os.makedirs(output_dir, exist_ok=True)
+    output_dir = os.path.dirname(output_path)
+    await blocking_io.makedirs(output_dir, exist_ok=True)
     
+    # Resume from the last fully written segment of an interrupted run
+    resume_point = await blocking_io.run_blocking(checkpoint.hls_resume_point, output_path)
+    if resume_point:
+        start_number, start_offset = resume_point
+        conversion_tasks[task_id]['resume_offset'] = start_offset
+        print(f"Resuming task {task_id} at segment {start_number} ({start_offset:.2f}s)")
+        cmd = _build_hls_command(input_path, output_path, segment_duration, crf, resolution, profile,
+                                 start_number=start_number, start_offset=start_offset,
+                                 playlist_path=output_path.replace('.m3u8', checkpoint.RESUME_SUFFIX))
+        await _run_ffmpeg(cmd, task_id, conversion_tasks, priority)
+        await blocking_io.run_blocking(checkpoint.fold_resume_playlist, output_path, True)
+        return
+
+    cmd = _build_hls_command(input_path, output_path, segment_duration, crf, resolution, profile)
+    await _run_ffmpeg(cmd, task_id, conversion_tasks, priority)
+    await blocking_io.run_blocking(checkpoint.finish_hls_playlist, output_path)
+
+def _build_dash_command(input_path: str, output_path: str, segment_duration: int = 6, crf: int = 20, resolution: str = 'source', profile: str = DEFAULT_PROFILE,
+                        name_prefix: str = '') -> list:
+    """Build the ffmpeg command line for DASH packaging; `name_prefix` keeps segment names apart"""
     scale_filter = _build_scale_filter(resolution)
 
     cmd = [
@@ -134,16 +385,14 @@ async def _convert_to_dash(input_path: str, output_path: str, task_id: int, conv
         '-i', input_path,
         '-map', '0:v:0',
         '-map', '0:a:0',
-        '-c:v', 'libx264',
-        '-preset', 'veryfast',
-        '-crf', str(crf),
+        *video_args(profile, crf, segment_duration),
     ]
 
     if scale_filter:
         cmd.extend(['-vf', scale_filter])
 
     cmd.extend([
-        '-c:a', 'aac',
+        *audio_args(profile),
         '-f', 'dash',
         '-use_timeline', '1',
         '-use_template', '1',
@@ -151,22 +400,23 @@ async def _convert_to_dash(input_path: str, output_path: str, task_id: int, conv
         '-frag_duration', str(segment_duration),
         '-window_size', '5',
         '-adaptation_sets', 'id=0,streams=v id=1,streams=a',
-        '-init_seg_name', 'init-stream$RepresentationID$.$ext$',
-        '-media_seg_name', 'chunk-stream$RepresentationID$-$Number%05d$.$ext$',
+        '-init_seg_name', name_prefix + 'init-stream$RepresentationID$.$ext$',
+        '-media_seg_name', name_prefix + 'chunk-stream$RepresentationID$-$Number%05d$.$ext$',
         output_path
     ])
+    return cmd
+
+
+async def _convert_to_dash(input_path: str, output_path: str, task_id: int, conversion_tasks: dict, segment_duration: int = 6, crf: int = 20, resolution: str = 'source', profile: str = DEFAULT_PROFILE,
+                           priority: str | None = None):
+    """Convert video to DASH format"""
+    output_dir = os.path.dirname(output_path)
+    # Ensure output directory exists
+    await blocking_io.makedirs(output_dir, exist_ok=True)
     
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    
-    await process.wait()
-    
-    if process.returncode != 0:
-        error = await process.stderr.read()
-        raise Exception(f"FFmpeg error: {error.decode()}")
+    # DASH output has no segment-level resume point; an interrupted run starts over
+    cmd = _build_dash_command(input_path, output_path, segment_duration, crf, resolution, profile)
+    await _run_ffmpeg(cmd, task_id, conversion_tasks, priority)
 
 async def _start_rtsp_stream(input_path: str, stream_id: str, port: int, task_id: int, conversion_tasks: dict):
     """Start an RTSP stream for the input video"""
@@ -178,27 +428,28 @@ async def _start_rtsp_stream(input_path: str, stream_id: str, port: int, task_id
         '-re',  # Read input at native frame rate
         '-stream_loop', '-1',  # Loop the input
         '-i', input_path,
-        '-c:v', 'libx264',
-        '-preset', 'veryfast',
-        '-tune', 'zerolatency',
+        *video_args('live'),
         '-f', 'rtsp',
         f'rtsp://0.0.0.0:{port}/{stream_id}'
     ]
     
+    threads = cpu_allocator.thread_budget()
     process = await asyncio.create_subprocess_exec(
-        *cmd,
+        *with_thread_budget(cmd, threads),
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE
     )
     
     # Store the process for later cleanup
     rtsp_servers[stream_id] = process
+    cpu_allocator.start(f"rtsp:{stream_id}", process, threads)
     
     # Wait a moment to ensure the server starts
     await asyncio.sleep(1)
     
     # Check if the process is still running
     if process.returncode is not None:
+        cpu_allocator.release(f"rtsp:{stream_id}")
         error = await process.stderr.read()
         raise Exception(f"Failed to start RTSP server: {error.decode()}")
     
@@ -209,12 +460,40 @@ async def _stop_rtsp_stream(stream_id: str):
     """Stop an RTSP stream"""
     if stream_id in rtsp_servers:
         process = rtsp_servers.pop(stream_id)
+        cpu_allocator.release(f"rtsp:{stream_id}")
         try:
             if process and process.returncode is None:
-                parent = psutil.Process(process.pid)
-                for child in parent.children(recursive=True):
-                    child.terminate()
-                parent.terminate()
+                kill_process_tree(process)
                 await process.wait()
         except Exception as e:
             print(f"Error stopping RTSP server {stream_id}: {e}")
+
+
+def resume_interrupted_tasks(conversion_tasks: dict, output_root: str, rtsp_port: int = 8554) -> list:
+    """
+    Re-register conversions whose checkpoint was left 'running' by a crash or
+    restart and start them again; HLS jobs pick up after their last segment.
+    """
+    resumed = []
+    for data in checkpoint.find_interrupted(output_root):
+        if data.get('ingest') == 'bulk':
+            # Owned by the bulk ingest CLI, which resumes its own jobs
+            continue
+        data.pop('state', None)
+        task_id = conversion_tasks.next_id()
+        conversion_tasks[task_id] = {
+            **data,
+            'status': 'pending',
+            'progress': 0,
+            'error': None,
+            'resumed': True,
+        }
+        asyncio.create_task(convert_video(
+            task_id=task_id,
+            conversion_tasks=conversion_tasks,
+            output_dir=os.path.dirname(data['output']),
+            rtsp_port=rtsp_port
+        ))
+        resumed.append(task_id)
+        print(f"Resuming interrupted conversion of {data.get('input')} as task {task_id}")
+    return resumed
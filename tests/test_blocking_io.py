@@ -0,0 +1,15 @@
+# tests/test_blocking_io.py
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app import app
+from services import blocking_io
+
+
+def test_filesystem_pool_survives_app_restart():
+    """A second app lifespan in the same process still gets a working filesystem pool."""
+    for _ in range(2):
+        with TestClient(app):
+            pass
+    assert asyncio.run(blocking_io.exists(".")) is True
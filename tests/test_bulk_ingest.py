@@ -0,0 +1,108 @@
+# tests/test_bulk_ingest.py
+import os
+
+from services.bulk_ingest import BulkIngest, IngestJournal, fingerprint, output_dir_for, scan_files, settled_files
+
+
+def test_scan_and_settle(tmp_path):
+    (tmp_path / "b.mkv").write_bytes(b'x' * 10)
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "a.MP4").write_bytes(b'x' * 10)
+    (tmp_path / "notes.txt").write_text("skip")
+    (tmp_path / ".partial.mp4").write_bytes(b'x')
+
+    files = list(scan_files([str(tmp_path)]))
+    assert [os.path.basename(path) for path in files] == ["b.mkv", "a.MP4"]
+
+    # A file counts as settled once it looks the same on two consecutive polls
+    settled, signatures = settled_files(files, {})
+    assert settled == []
+    (tmp_path / "b.mkv").write_bytes(b'x' * 20)
+    settled, signatures = settled_files(files, signatures)
+    assert [os.path.basename(path) for path in settled] == ["a.MP4"]
+
+
+def test_journal_resumes_across_runs(tmp_path):
+    video = tmp_path / "movie.mp4"
+    video.write_bytes(b'x' * 10)
+    path = str(video)
+    journal_path = str(tmp_path / "out" / "journal.jsonl")
+
+    ingest = BulkIngest(str(tmp_path / "out"), journal_path=journal_path)
+    assert ingest.needs_conversion(path)
+    ingest.journal.record(path, 'started', fingerprint=fingerprint(path),
+                          output_dir=output_dir_for(str(tmp_path / "out"), path))
+    ingest.close()
+    with open(journal_path, 'a') as f:
+        f.write('{"path": "trunc')  # killed mid-write
+
+    # A stopped run leaves the file 'started', so it is converted again
+    ingest = BulkIngest(str(tmp_path / "out"), journal_path=journal_path)
+    assert ingest.needs_conversion(path)
+    ingest.journal.record(path, 'completed', fingerprint=fingerprint(path))
+    ingest.close()
+
+    journal = IngestJournal(journal_path)
+    assert journal.counts() == {'completed': 1}
+    journal.close()
+    assert not BulkIngest(str(tmp_path / "out"), journal_path=journal_path).needs_conversion(path)
+
+    # Replacing the source file makes it eligible again
+    video.write_bytes(b'y' * 30)
+    assert BulkIngest(str(tmp_path / "out"), journal_path=journal_path).needs_conversion(path)
+    assert output_dir_for("root", path) == output_dir_for("root", path)
+
+
+def test_completed_files_are_registered_as_tasks(tmp_path):
+    import asyncio
+    from services.bulk_ingest import BulkResultImporter
+    from services.task_store import TaskStore
+
+    journal_path = str(tmp_path / "journal.jsonl")
+    journal = IngestJournal(journal_path)
+    journal.record("/media/a.mp4", 'completed', fingerprint="1:1", output="static/output/a_1/playlist.m3u8",
+                   streaming_protocol='hls', media_format='hls')
+    journal.record("/media/b.mp4", 'failed', fingerprint="1:1", error="bad input")
+    journal.record("/media/c.mp4", 'completed', fingerprint="2:2", output="static/output/c_1/dash/playlist.mpd")
+
+    tasks = TaskStore()
+    tasks[1] = {'status': 'processing', 'created_at': "2025-11-21T01:00:00Z"}
+    importer = BulkResultImporter(journal_path)
+    assert asyncio.run(importer.import_once(tasks)) == [2, 3]
+    assert tasks[2]['status'] == 'completed' and tasks[2]['ingest'] == 'bulk'
+    assert tasks[3]['streaming_protocol'] == 'dash'
+    assert asyncio.run(importer.import_once(tasks)) == []
+
+    # A re-converted file updates its task instead of adding another
+    journal.record("/media/a.mp4", 'completed', fingerprint="3:3", output="static/output/a_1/playlist.m3u8")
+    journal.close()
+    assert asyncio.run(importer.import_once(tasks)) == [2]
+    assert tasks.next_id() == 4
+
+
+def test_large_journal_import_keeps_the_hot_set_bounded(tmp_path):
+    import asyncio
+    from services.bulk_ingest import BulkResultImporter
+    from services.task_store import TaskStore
+
+    journal_path = str(tmp_path / "journal.jsonl")
+    journal = IngestJournal(journal_path)
+    for number in range(500):
+        journal.record(f"/media/{number}.mp4", 'completed', fingerprint=f"{number}:1",
+                       output=f"static/output/{number}_1/playlist.m3u8")
+    journal.close()
+
+    tasks = TaskStore(hot_limit=50, spill_path=str(tmp_path / "tasks.sqlite3"), spill_batch=100)
+    hot_sizes = []
+    spill_idle = tasks.spill_idle
+
+    async def recording_spill_idle():
+        hot_sizes.append(len(tasks))
+        return await spill_idle()
+    tasks.spill_idle = recording_spill_idle
+
+    # Just-written entries are spilled at once, without waiting out TASK_SPILL_AFTER
+    assert len(asyncio.run(BulkResultImporter(journal_path).import_once(tasks))) == 500
+    assert max(hot_sizes) <= 50 + 100
+    assert len(tasks) == 50 and tasks.total() == 500
+    assert tasks[1]['ingest'] == 'bulk'
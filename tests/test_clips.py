@@ -0,0 +1,91 @@
+# tests/test_clips.py
+import asyncio
+import xml.etree.ElementTree as ET
+
+from services import clips
+from services.checkpoint import parse_hls_playlist
+
+PLAYLIST = "#EXTM3U\n#EXT-X-TARGETDURATION:6\n" + "".join(
+    f"#EXTINF:6.000000,\nplaylist_{i:03d}.ts\n" for i in range(5)) + "#EXT-X-ENDLIST\n"
+
+MPD = """<?xml version="1.0" encoding="utf-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT30S">
+  <Period id="0" start="PT0S">
+    <AdaptationSet id="0" contentType="video">
+      <Representation id="0" bandwidth="1000000">
+        <SegmentTemplate timescale="1000" initialization="init-stream$RepresentationID$.m4s"
+            media="chunk-stream$RepresentationID$-$Number%05d$.m4s" startNumber="1">
+          <SegmentTimeline><S t="0" d="6000" r="4" /></SegmentTimeline>
+        </SegmentTemplate>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+
+def _source(tmp_path, name, text, filename):
+    source_dir = tmp_path / name
+    source_dir.mkdir()
+    (source_dir / filename).write_text(text)
+    return str(source_dir / filename)
+
+
+def test_hls_plan_reuses_inner_segments_and_trims_boundaries(tmp_path):
+    a = _source(tmp_path, "a", PLAYLIST, "playlist.m3u8")
+    b = _source(tmp_path, "b", PLAYLIST, "playlist.m3u8")
+    plan = clips.plan_hls_clip([(a, 3, 18), (b, 6, 12)], str(tmp_path / "clip"))
+
+    assert [item.get('uri') for item in plan] == [None, "../a/playlist_001.ts", "../a/playlist_002.ts",
+                                                  "../b/playlist_001.ts"]
+    assert plan[0]['trim'] == (str(tmp_path / "a" / "playlist_000.ts"), 3, 3)
+    # After the trimmed head, and at the start of the second range
+    assert [item['discontinuity'] for item in plan] == [False, True, False, True]
+    assert sum(item['duration'] for item in plan) == 21
+
+
+def test_build_hls_clip_writes_playlist(tmp_path, monkeypatch):
+    playlist = _source(tmp_path, "a", PLAYLIST, "playlist.m3u8")
+    trims = []
+
+    async def fake_run_ffmpeg(cmd, task_id, conversion_tasks, priority=None, stage='encode'):
+        trims.append(cmd)
+        with open(cmd[-1], 'wb') as f:
+            f.write(b'ts')
+
+    monkeypatch.setattr(clips, "_run_ffmpeg", fake_run_ffmpeg)
+    source = {'output': playlist, 'profile': 'fast', 'crf': 23}
+    output = str(tmp_path / "clip" / "playlist.m3u8")
+    tasks = {2: {'output': output, 'streaming_protocol': 'hls', 'status': 'pending', 'progress': 0}}
+    asyncio.run(clips.build_clip(2, tasks, [(source, 0, 8)]))
+
+    assert tasks[2]['status'] == 'completed'
+    assert len(trims) == 1 and trims[0][trims[0].index('-ss') + 1] == '0.000'
+    _, segments, ended = parse_hls_playlist(output)
+    assert [uri for _, uri in segments] == ["../a/playlist_000.ts", "trim_000.ts"]
+    assert "#EXT-X-DISCONTINUITY" in segments[1][0]
+    assert ended
+
+
+def test_dash_clip_is_multi_period_on_segment_boundaries(tmp_path):
+    a = _source(tmp_path, "a", MPD, "playlist.mpd")
+    data, duration = clips.build_dash_clip([(a, 7, 13), (a, 0, 5)], str(tmp_path / "clip" / "dash"))
+    assert duration == 18
+
+    ns = {'mpd': clips.DASH_NS}
+    periods = ET.fromstring(data).findall('mpd:Period', ns)
+    assert [period.get('start') for period in periods] == ["PT0.000S", "PT12.000S"]
+    assert periods[0].find('mpd:BaseURL', ns).text == "../../a/"
+    template = periods[0].find('.//mpd:SegmentTemplate', ns)
+    assert template.get('startNumber') == "2" and template.get('presentationTimeOffset') == "6000"
+    assert [s.get('d') for s in template.findall('.//mpd:S', ns)] == ["6000", "6000"]
+
+
+def test_parse_ranges():
+    assert clips.parse_ranges("1:10-25, 3:0-12.5") == [(1, 10.0, 25.0), (3, 0.0, 12.5)]
+    for bad in ("", "1:5-2", "x:1-2", "1-2"):
+        try:
+            clips.parse_ranges(bad)
+        except ValueError:
+            continue
+        raise AssertionError(bad)
@@ -0,0 +1,73 @@
+# tests/test_cpu_allocator.py
+from services import cpu_allocator as cpu_allocator_module
+from services.cpu_allocator import CpuAllocator, cgroup_cpu_quota, with_thread_budget
+from services.job_control import preempted_tasks, register_encode, unregister_encode
+
+
+def test_cgroup_quota_parsing(tmp_path):
+    (tmp_path / "cpu.max").write_text("250000 100000\n")
+    assert cgroup_cpu_quota(str(tmp_path)) == 2.5
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert cgroup_cpu_quota(str(tmp_path)) is None
+
+    v1 = tmp_path / "v1"
+    (v1 / "cpu").mkdir(parents=True)
+    (v1 / "cpu" / "cpu.cfs_quota_us").write_text("200000")
+    (v1 / "cpu" / "cpu.cfs_period_us").write_text("100000")
+    assert cgroup_cpu_quota(str(v1)) == 2.0
+
+
+class FakeProcess:
+    # No such pid: suspending and pinning it are no-ops
+    pid = 999999
+    returncode = None
+
+
+def test_partitions_encode_cores_between_jobs(monkeypatch):
+    allocator = CpuAllocator(cpus=list(range(8)), quota=None, reserved=1, enabled=True)
+    monkeypatch.setattr(cpu_allocator_module, "cpu_allocator", allocator)
+    assert allocator.api_cores == [0]
+    assert allocator.thread_budget() == 7
+
+    tasks = {1: {'status': 'processing'}, 2: {'status': 'processing'}}
+    register_encode(1, FakeProcess(), 'low', tasks)
+    allocator.start(1, None, 7)
+    assert allocator.thread_budget() == 3
+    try:
+        # A high-priority job suspends the low one, which is left out of the split
+        register_encode(2, FakeProcess(), 'high', tasks)
+        allocator.start(2, None, 3)
+        assert 1 in preempted_tasks and tasks[1]['status'] == 'preempted'
+        assert allocator.jobs[2]['cores'] == list(range(1, 8))
+
+        # Once it finishes, the resumed job gets its share back before the release
+        unregister_encode(2, tasks)
+        assert tasks[1]['status'] == 'processing'
+        assert allocator.jobs[1]['cores'] == [1, 2, 3, 4]
+        assert allocator.jobs[2]['cores'] == [5, 6, 7]
+        allocator.release(2)
+        assert allocator.jobs[1]['cores'] == list(range(1, 8))
+    finally:
+        unregister_encode(2, tasks)
+        unregister_encode(1, tasks)
+
+
+def test_quota_limits_pool_and_thread_flag():
+    allocator = CpuAllocator(cpus=list(range(16)), quota=2.5, reserved=1, enabled=True)
+    assert allocator.api_cores == [0] and allocator.encode_cores == [1, 2]
+    assert CpuAllocator(cpus=[0], quota=None, reserved=1, enabled=True).encode_cores == [0]
+    assert CpuAllocator(cpus=[0, 1], quota=None, enabled=False).thread_budget() is None
+
+    assert with_thread_budget(['ffmpeg', '-i', 'in.mp4', 'out.m3u8'], 3) == \
+        ['ffmpeg', '-i', 'in.mp4', '-threads', '3', 'out.m3u8']
+    assert with_thread_budget(['ffmpeg', 'out.m3u8'], None) == ['ffmpeg', 'out.m3u8']
+
+
+def test_api_process_is_only_pinned_on_request(monkeypatch):
+    import psutil
+    calls = []
+    monkeypatch.setattr(psutil.Process, "cpu_affinity", lambda self, cores=None: calls.append(cores))
+    CpuAllocator(cpus=list(range(4)), quota=None, reserved=1, enabled=True).pin_api_process()
+    assert calls == []
+    CpuAllocator(cpus=list(range(4)), quota=None, reserved=1, enabled=True, pin_api=True).pin_api_process()
+    assert calls == [[0]]
@@ -0,0 +1,72 @@
+# tests/test_drain.py
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from services import checkpoint, drain
+from services.drain import DrainController
+
+
+def _task(tmp_path, name, status):
+    output_dir = tmp_path / name
+    output_dir.mkdir()
+    return {
+        'input': str(tmp_path / f"{name}.mp4"),
+        'filename': f"{name}.mp4",
+        'output': str(output_dir / "playlist.m3u8"),
+        'media_format': 'hls',
+        'streaming_protocol': 'hls',
+        'status': status,
+    }
+
+
+def test_drain_hands_off_finishes_and_checkpoints(tmp_path, monkeypatch):
+    monkeypatch.setattr(drain, "DRAIN_POLL_INTERVAL", 0.01)
+    tasks = {
+        1: _task(tmp_path, "queued", 'pending'),
+        2: _task(tmp_path, "quick", 'processing'),
+        3: _task(tmp_path, "slow", 'processing'),
+        4: _task(tmp_path, "suspended", 'preempted'),
+    }
+    controller = DrainController(grace=0.3)
+
+    async def scenario():
+        async def finish_quick():
+            await asyncio.sleep(0.05)
+            tasks[2]['status'] = 'completed'
+        asyncio.create_task(finish_quick())
+        await controller.start(tasks, 'test')
+
+    asyncio.run(scenario())
+    snapshot = controller.snapshot()
+    assert snapshot["state"] == 'drained'
+    assert snapshot["handed_off"] == [1] and snapshot["finished"] == [2]
+    assert sorted(snapshot["checkpointed"]) == [3, 4]
+    assert tasks[1]['status'] == 'handed_off' and tasks[3]['status'] == 'interrupted'
+
+    with open(checkpoint.checkpoint_path(tasks[1]['output'])) as f:
+        assert json.load(f)['state'] == 'queued'
+    resumable = checkpoint.find_interrupted(str(tmp_path))
+    assert [data['filename'] for data in resumable] == ["queued.mp4"]
+
+
+def test_draining_rejects_new_jobs(monkeypatch):
+    controller = DrainController()
+    monkeypatch.setattr(drain, "drain_controller", controller)
+    drain.reject_new_jobs()
+    controller.state = 'draining'
+    with pytest.raises(HTTPException) as error:
+        drain.reject_new_jobs()
+    assert error.value.status_code == 503
+
+
+def test_admin_endpoints_need_a_configured_token(test_app, monkeypatch):
+    from routes import admin
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", None)
+    assert test_app.get("/api/v1/admin/drain").status_code == 403
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    assert test_app.get("/api/v1/admin/drain").status_code == 403
+    response = test_app.get("/api/v1/admin/drain", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200 and response.json()["state"] == "serving"
@@ -0,0 +1,106 @@
+# tests/test_edge_cache.py
+import asyncio
+
+import httpx
+
+from services.edge_cache import EdgeCache, next_segment_names
+
+
+def test_next_segment_names_keep_padding():
+    assert next_segment_names("playlist_009.ts", 2) == ["playlist_010.ts", "playlist_011.ts"]
+    assert next_segment_names("chunk-stream0-00001.m4s", 1) == ["chunk-stream0-00002.m4s"]
+    assert next_segment_names("playlist.m3u8", 2) == []
+
+
+def test_concurrent_misses_collapse_and_cache_persists(tmp_path):
+    requests = []
+
+    async def origin(request):
+        requests.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=b"segment", headers={"content-type": "video/MP2T"})
+
+    async def scenario():
+        cache = EdgeCache("http://origin", cache_dir=str(tmp_path), prefetch=0)
+        cache._client = httpx.AsyncClient(base_url="http://origin", transport=httpx.MockTransport(origin))
+        key = "/static/output/a/playlist_000.ts"
+        results = await asyncio.gather(*[cache.get(key, "playlist_000.ts") for _ in range(5)])
+        await cache.close()
+
+        # A new instance (e.g. after a restart) is served from disk
+        restarted = EdgeCache("http://origin", cache_dir=str(tmp_path), prefetch=0)
+        status, body, _ = await restarted.get(key, "playlist_000.ts")
+        return results, cache.stats, restarted.stats, status, body
+
+    results, stats, restarted_stats, status, body = asyncio.run(scenario())
+    assert requests == ["/static/output/a/playlist_000.ts"]
+    assert all(result[1] == b"segment" for result in results)
+    assert stats["collapsed"] == 4
+    assert (status, body) == (200, b"segment")
+    assert restarted_stats["disk_hits"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    async def origin(request):
+        return httpx.Response(200, content=b"x" * 1000, headers={"content-type": "video/MP2T"})
+
+    async def scenario():
+        cache = EdgeCache("http://origin", cache_dir=str(tmp_path), prefetch=0, memory_bytes=0, disk_bytes=2500)
+        cache._client = httpx.AsyncClient(base_url="http://origin", transport=httpx.MockTransport(origin))
+        for number in range(3):
+            await cache.get(f"/static/output/a/playlist_00{number}.ts", f"playlist_00{number}.ts")
+        await cache.close()
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cache.snapshot()["disk_entries"] == 2 and cache.snapshot()["disk_bytes"] <= 2500
+    assert cache.stats["disk_evictions"] == 1
+    assert not (tmp_path / cache._disk_path("/static/output/a/playlist_000.ts").split("/")[-1]).exists()
+
+    # The index is rebuilt from disk after a restart, and a smaller budget trims it
+    restarted = EdgeCache("http://origin", cache_dir=str(tmp_path), prefetch=0, disk_bytes=1500)
+    assert restarted.snapshot()["disk_entries"] == 1
+
+
+def test_prefetch_tasks_are_kept_until_done(tmp_path):
+    async def origin(request):
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, content=b"segment", headers={"content-type": "video/MP2T"})
+
+    async def scenario():
+        cache = EdgeCache("http://origin", cache_dir=str(tmp_path), prefetch=2)
+        cache._client = httpx.AsyncClient(base_url="http://origin", transport=httpx.MockTransport(origin))
+        cache.schedule_prefetch("/static/output/a/playlist_000.ts", "playlist_000.ts")
+        running = len(cache._prefetches)
+        while cache._prefetches:
+            await asyncio.sleep(0.01)
+        await cache.close()
+        return running, cache.stats["prefetched"]
+
+    assert asyncio.run(scenario()) == (2, 2)
+
+
+def test_cancelled_owner_does_not_strand_collapsed_waiters(tmp_path):
+    requests = []
+
+    async def origin(request):
+        requests.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=b"segment", headers={"content-type": "video/MP2T"})
+
+    async def scenario():
+        cache = EdgeCache("http://origin", cache_dir=str(tmp_path), prefetch=0)
+        cache._client = httpx.AsyncClient(base_url="http://origin", transport=httpx.MockTransport(origin))
+        key = "/static/output/a/playlist_000.ts"
+        owner = asyncio.create_task(cache.get(key, "playlist_000.ts"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cache.get(key, "playlist_000.ts"))
+        await asyncio.sleep(0.01)
+        # The client that triggered the fetch disconnects
+        owner.cancel()
+        status, body, _ = await asyncio.wait_for(waiter, timeout=1)
+        await cache.close()
+        return owner.cancelled(), status, body, cache.stats["collapsed"], not cache._inflight
+
+    assert asyncio.run(scenario()) == (True, 200, b"segment", 1, True)
+    assert len(requests) == 1
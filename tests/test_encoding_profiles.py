@@ -0,0 +1,30 @@
+# tests/test_encoding_profiles.py
+from services.encoding_profiles import EncodeStats, select_profile, video_args
+
+
+def test_idle_host_gets_best_compression():
+    stats = EncodeStats()
+    assert select_profile(60, deadline_seconds=600, active_jobs=0, stats=stats) == 'archive'
+
+
+def test_busy_host_falls_back_to_faster_presets():
+    stats = EncodeStats()
+    assert select_profile(600, deadline_seconds=600, active_jobs=3, stats=stats) == 'fast'
+    assert select_profile(3600, deadline_seconds=60, active_jobs=8, stats=stats) == 'ultrafast'
+
+
+def test_measured_speed_replaces_prior():
+    stats = EncodeStats()
+    stats.record('slow', media_seconds=60, wall_seconds=20)
+    assert stats.speeds['slow'] == 3.0
+    assert select_profile(600, deadline_seconds=250, active_jobs=0, stats=stats) == 'archive'
+
+
+def test_unknown_duration_uses_default_profile():
+    assert select_profile(None) == 'balanced'
+
+
+def test_video_args_follow_profile():
+    args = video_args('ladder_2000k', stream_index=0)
+    assert args[:4] == ['-c:v:0', 'libx264', '-preset:v:0', 'medium']
+    assert '-b:v:0' in args and '-crf:v:0' not in args
@@ -0,0 +1,81 @@
+# tests/test_job_control.py
+import asyncio
+
+import psutil
+
+from services import checkpoint
+from services.job_control import cancel_task, register_encode, unregister_encode
+
+PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:0
+#EXT-X-PLAYLIST-TYPE:VOD
+#EXTINF:6.000000,
+playlist_000.ts
+#EXTINF:6.000000,
+playlist_001.ts
+"""
+
+
+def test_hls_resume_point_and_merge(tmp_path):
+    playlist = tmp_path / "playlist.m3u8"
+    playlist.write_text(PLAYLIST)
+    assert checkpoint.hls_resume_point(str(playlist)) == (2, 12.0)
+
+    # The resumed run writes a side playlist numbered from the resume point
+    (tmp_path / "playlist.resume.m3u8").write_text(
+        "#EXTM3U\n#EXT-X-TARGETDURATION:6\n#EXTINF:4.500000,\nplaylist_002.ts\n#EXT-X-ENDLIST\n"
+    )
+    checkpoint.fold_resume_playlist(str(playlist), True)
+    _, segments, ended = checkpoint.parse_hls_playlist(str(playlist))
+    assert [uri for _, uri in segments] == ["playlist_000.ts", "playlist_001.ts", "playlist_002.ts"]
+    assert "#EXT-X-DISCONTINUITY" in segments[2][0]
+    assert ended
+    assert checkpoint.hls_resume_point(str(playlist)) is None
+
+
+def test_high_priority_preempts_low_and_cancel_kills():
+    async def scenario():
+        tasks = {1: {'status': 'processing'}, 2: {'status': 'processing'}}
+        low = await asyncio.create_subprocess_exec('sleep', '30')
+        high = await asyncio.create_subprocess_exec('sleep', '30')
+        register_encode(1, low, 'low', tasks)
+        register_encode(2, high, 'high', tasks)
+        assert tasks[1]['status'] == 'preempted'
+        for _ in range(50):  # signal delivery is asynchronous
+            if psutil.Process(low.pid).status() == psutil.STATUS_STOPPED:
+                break
+            await asyncio.sleep(0.02)
+        assert psutil.Process(low.pid).status() == psutil.STATUS_STOPPED
+
+        unregister_encode(2, tasks)
+        high.kill()
+        await high.wait()
+        assert tasks[1]['status'] == 'processing'
+
+        assert cancel_task(1, tasks)
+        await asyncio.wait_for(low.wait(), 5)
+        unregister_encode(1, tasks)
+        return tasks[1]['status']
+
+    assert asyncio.run(scenario()) == 'cancelled'
+
+
+def test_interrupted_event_playlist_resumes_and_finishes_as_vod(tmp_path):
+    from services.video_converter import _build_hls_command
+    playlist = tmp_path / "playlist.m3u8"
+    cmd = _build_hls_command("in.mp4", str(playlist))
+    assert cmd[cmd.index('-hls_playlist_type') + 1] == 'event'
+
+    # What ffmpeg leaves behind when killed after two segments of an EVENT playlist
+    playlist.write_text("#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:6\n#EXT-X-MEDIA-SEQUENCE:0\n"
+                        "#EXT-X-PLAYLIST-TYPE:EVENT\n#EXTINF:6.000000,\nplaylist_000.ts\n"
+                        "#EXTINF:6.000000,\nplaylist_001.ts\n")
+    assert checkpoint.hls_resume_point(str(playlist)) == (2, 12.0)
+    (tmp_path / "playlist.resume.m3u8").write_text(
+        "#EXTM3U\n#EXT-X-PLAYLIST-TYPE:EVENT\n#EXTINF:3.000000,\nplaylist_002.ts\n#EXT-X-ENDLIST\n")
+    checkpoint.fold_resume_playlist(str(playlist), True)
+    text = playlist.read_text()
+    assert "#EXT-X-PLAYLIST-TYPE:VOD" in text and "EVENT" not in text
+    assert text.rstrip().endswith("#EXT-X-ENDLIST")
@@ -0,0 +1,112 @@
+# tests/test_live_store.py
+import asyncio
+
+import pytest
+
+from services import live_store
+from services.live_store import LiveChannel, live_channels, publish_base
+
+
+@pytest.fixture
+def local_testclient(monkeypatch):
+    # The TestClient's peer address is "testclient"; let it publish like a local ffmpeg
+    from routes import live
+    monkeypatch.setattr(live, "LOCAL_CLIENTS", live.LOCAL_CLIENTS + ("testclient",))
+
+
+def _channel(window=3):
+    return LiveChannel("abc12345", "hls", "rtmp", 1935, segment_duration=2, window=window, crf=23)
+
+
+def test_ring_buffer_keeps_window_and_init_segments():
+    channel = _channel(window=2)
+    channel.put("init-stream0.m4s", b"init")
+    for i in range(10):
+        channel.put(f"segment_{i:05d}.ts", b"x" * 10)
+    assert list(channel.segments) == [f"segment_{i:05d}.ts" for i in range(6, 10)]
+    assert channel.segment_bytes == 40
+    assert channel.get("init-stream0.m4s") == b"init"
+    assert channel.get("segment_00000.ts") is None
+
+
+def test_publish_and_play_from_memory(test_app, local_testclient):
+    channel = _channel()
+    live_channels[channel.channel_id] = channel
+    try:
+        base = f"/api/v1/live/{channel.channel_id}"
+        ingest = f"{base}/ingest/{channel.ingest_token}"
+        assert test_app.put(f"{base}/ingest/wrong-token/segment_00000.ts", content=b"x").status_code == 403
+        assert test_app.put(f"{ingest}/segment_00000.ts", content=b"ts-bytes").status_code == 204
+        assert test_app.put(f"{ingest}/index.m3u8", content=b"#EXTM3U").status_code == 204
+
+        response = test_app.get(f"{base}/segment_00000.ts")
+        assert response.content == b"ts-bytes"
+        assert response.headers["content-type"] == "video/MP2T"
+        assert test_app.get(f"{base}/index.m3u8").content == b"#EXTM3U"
+        assert channel.status == "live"
+    finally:
+        live_channels.pop(channel.channel_id, None)
+
+
+def test_ingest_is_refused_from_other_hosts(test_app):
+    channel = _channel()
+    live_channels[channel.channel_id] = channel
+    try:
+        url = f"/api/v1/live/{channel.channel_id}/ingest/{channel.ingest_token}/index.m3u8"
+        assert test_app.put(url, content=b"#EXTM3U").status_code == 403
+    finally:
+        live_channels.pop(channel.channel_id, None)
+
+
+def test_publish_url_follows_the_server_address(monkeypatch):
+    monkeypatch.setattr(live_store, "LIVE_PUBLISH_BASE", None)
+    assert publish_base(("0.0.0.0", 9001)) == "http://127.0.0.1:9001/api/v1/live"
+    channel = LiveChannel("abc12345", "hls", "rtmp", 1935, 2, 3, 23, publish_base(("10.0.0.5", 8080)))
+    assert f"http://10.0.0.5:8080/api/v1/live/abc12345/ingest/{channel.ingest_token}/index.m3u8" in channel.build_command()
+
+
+def test_ended_channels_are_dropped_after_ttl(monkeypatch):
+    monkeypatch.setattr(live_store, "LIVE_ENDED_TTL", 0)
+    monkeypatch.setattr(live_store.cpu_allocator, "release", lambda key: None)
+
+    class Process:
+        returncode = 0
+
+        async def communicate(self):
+            return b"", b""
+
+    channel = _channel()
+    channel.process = Process()
+    channel.put("segment_00000.ts", b"x" * 10)
+    live_channels[channel.channel_id] = channel
+    asyncio.run(live_store._watch_channel(channel))
+    assert channel.status == "ended"
+    assert channel.channel_id not in live_channels and channel.segment_bytes == 0
+
+
+def test_channel_watcher_is_kept_until_it_finishes(monkeypatch):
+    monkeypatch.setattr(live_store, "LIVE_ENDED_TTL", 0.01)
+
+    class Process:
+        pid = 999999
+        returncode = None
+
+        async def communicate(self):
+            await asyncio.sleep(0.01)
+            self.returncode = 0
+            return b"", b""
+
+    async def fake_exec(*cmd, **kwargs):
+        return Process()
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", fake_exec)
+
+    async def scenario():
+        channel = await live_store.start_channel(port=19350)
+        assert len(live_store._watchers) == 1
+        while live_store._watchers:
+            await asyncio.sleep(0.01)
+        return channel
+
+    channel = asyncio.run(scenario())
+    assert channel.status == "ended" and channel.channel_id not in live_channels
@@ -0,0 +1,46 @@
+# tests/test_load_generator.py
+from load_generator import parse_dash_mpd, parse_hls_master, parse_hls_media
+
+MPD = """<?xml version="1.0" encoding="utf-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static">
+  <Period id="0" start="PT0.0S">
+    <AdaptationSet id="0" contentType="video">
+      <Representation id="0" mimeType="video/mp4" bandwidth="800000">
+        <SegmentTemplate timescale="12800" initialization="init-stream$RepresentationID$.m4s"
+                         media="chunk-stream$RepresentationID$-$Number%05d$.m4s" startNumber="1">
+          <SegmentTimeline>
+            <S t="0" d="76800" r="1" />
+            <S d="25600" />
+          </SegmentTimeline>
+        </SegmentTemplate>
+      </Representation>
+    </AdaptationSet>
+    <AdaptationSet id="1" contentType="audio">
+      <Representation id="1" mimeType="audio/mp4" bandwidth="128000" />
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+
+def test_parse_dash_template_timeline():
+    renditions = parse_dash_mpd(MPD, "http://host/static/output/a/dash/playlist.mpd")
+    assert len(renditions) == 1
+    rendition = renditions[0]
+    assert rendition['init_url'] == "http://host/static/output/a/dash/init-stream0.m4s"
+    assert [s['url'].rsplit('/', 1)[-1] for s in rendition['segments']] == [
+        "chunk-stream0-00001.m4s", "chunk-stream0-00002.m4s", "chunk-stream0-00003.m4s"
+    ]
+    assert [s['duration'] for s in rendition['segments']] == [6.0, 6.0, 2.0]
+
+
+def test_parse_hls_master_and_media():
+    master = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=2000000\nhigh.m3u8\n#EXT-X-STREAM-INF:BANDWIDTH=500000\nlow.m3u8\n"
+    variants = parse_hls_master(master, "http://host/a/playlist.m3u8")
+    assert [v['url'] for v in variants] == ["http://host/a/low.m3u8", "http://host/a/high.m3u8"]
+
+    media = "#EXTM3U\n#EXTINF:6.000000,\nplaylist_000.ts\n#EXTINF:2.5,\nplaylist_001.ts\n#EXT-X-ENDLIST\n"
+    segments = parse_hls_media(media, "http://host/a/playlist.m3u8")
+    assert [(s['duration'], s['url']) for s in segments] == [
+        (6.0, "http://host/a/playlist_000.ts"), (2.5, "http://host/a/playlist_001.ts")
+    ]
@@ -0,0 +1,28 @@
+# tests/test_loop_monitor.py
+import asyncio
+import time
+
+from services.loop_monitor import LoopLagMonitor
+
+
+def test_loop_monitor_records_stall_and_call_site():
+    """A blocking call on the loop shows up as lag with its call site."""
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.2)  # block the loop
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["max_lag_ms"] >= 100
+    assert stats["stall_count"] >= 1
+    assert "scenario" in stats["last_stall"]["stack"]
+
+
+def test_monitoring_endpoint(test_app):
+    response = test_app.get("/api/v1/monitoring/loop")
+    assert response.status_code == 200
+    assert "p99_lag_ms" in response.json()
@@ -0,0 +1,106 @@
+# tests/test_preview.py
+import asyncio
+
+from services import video_converter
+
+
+def test_preview_published_then_replaced_by_full_encode(tmp_path, monkeypatch):
+    output_path = str(tmp_path / "playlist.m3u8")
+    source = tmp_path / "input.mp4"
+    source.write_bytes(b'video')
+    runs = []
+
+    async def fake_probe(path):
+        return 10.0
+
+    async def fake_run_ffmpeg(cmd, task_id, conversion_tasks, priority=None, stage='encode'):
+        # Record what the published manifest looked like when each phase started
+        published = (tmp_path / "playlist.m3u8").read_text() if (tmp_path / "playlist.m3u8").exists() else None
+        runs.append((stage, priority, cmd[-1], published))
+        with open(cmd[-1], 'w') as f:
+            f.write(f"#EXTM3U\n# {stage}\n")
+
+    monkeypatch.setattr(video_converter, "probe_duration", fake_probe)
+    monkeypatch.setattr(video_converter, "_run_ffmpeg", fake_run_ffmpeg)
+
+    tasks = {1: {
+        'input': str(source), 'output': output_path, 'media_format': 'hls', 'streaming_protocol': 'hls',
+        'segment_duration': 6, 'crf': 20, 'resolution': 'source', 'profile': 'balanced',
+        'priority': 'normal', 'preview': True, 'status': 'pending',
+    }}
+    asyncio.run(video_converter.convert_video(1, tasks, str(tmp_path)))
+
+    task = tasks[1]
+    assert task['status'] == 'completed'
+    assert [(stage, priority) for stage, priority, _, _ in runs] == [('preview_encode', 'high'), ('encode', 'low')]
+    assert runs[0][2].endswith("preview.m3u8") and runs[0][3] is None
+    # The full encode wrote a staging manifest while the preview was being served
+    assert runs[1][2].endswith("full.m3u8") and "preview_encode" in runs[1][3]
+    assert "# encode" in (tmp_path / "playlist.m3u8").read_text()
+    assert not (tmp_path / "full.m3u8").exists()
+    assert task['phases']['preview']['status'] == 'completed'
+    assert task['phases']['full']['status'] == 'completed'
+
+
+def test_failed_full_encode_stops_advertising_preview(tmp_path, monkeypatch, test_app):
+    from app import conversion_tasks
+
+    output_path = str(tmp_path / "playlist.m3u8")
+    source = tmp_path / "input.mp4"
+    source.write_bytes(b'video')
+
+    async def fake_probe(path):
+        return 10.0
+
+    async def fake_run_ffmpeg(cmd, task_id, conversion_tasks, priority=None, stage='encode'):
+        if stage != 'preview_encode':
+            raise RuntimeError("ffmpeg exited with code 1")
+        with open(cmd[-1], 'w') as f:
+            f.write("#EXTM3U\n")
+
+    monkeypatch.setattr(video_converter, "probe_duration", fake_probe)
+    monkeypatch.setattr(video_converter, "_run_ffmpeg", fake_run_ffmpeg)
+
+    task_id = conversion_tasks.next_id()
+    conversion_tasks[task_id] = {
+        'input': str(source), 'output': output_path, 'media_format': 'hls', 'streaming_protocol': 'hls',
+        'segment_duration': 6, 'crf': 20, 'resolution': 'source', 'profile': 'balanced',
+        'priority': 'normal', 'preview': True, 'status': 'pending',
+    }
+    asyncio.run(video_converter.convert_video(task_id, conversion_tasks, str(tmp_path)))
+
+    task = conversion_tasks[task_id]
+    assert task['status'] == 'failed'
+    assert task['phases']['preview']['status'] == 'completed'
+    assert task['phases']['full']['status'] == 'failed' and "code 1" in task['phases']['full']['error']
+
+    body = test_app.get(f"/api/v1/stream/{task_id}").json()
+    assert body["hls_url"] is None and body["chunks_available"] is False
+    assert body["phase"] == "full" and body["phases"]["full"]["status"] == "failed"
+    assert body["status"] == "failed" and body["error"]
+    del conversion_tasks[task_id]
+
+
+def test_preview_stopped_by_cancel_or_drain_is_not_reported_failed(tmp_path, monkeypatch):
+    from services.job_control import JobCancelled, JobInterrupted
+
+    source = tmp_path / "input.mp4"
+    source.write_bytes(b'video')
+
+    async def fake_probe(path):
+        return 10.0
+
+    monkeypatch.setattr(video_converter, "probe_duration", fake_probe)
+    for error, expected in ((JobCancelled(), 'cancelled'), (JobInterrupted(), 'interrupted')):
+        async def fake_run_ffmpeg(cmd, task_id, conversion_tasks, priority=None, stage='encode'):
+            raise error
+
+        monkeypatch.setattr(video_converter, "_run_ffmpeg", fake_run_ffmpeg)
+        tasks = {1: {
+            'input': str(source), 'output': str(tmp_path / f"{expected}.m3u8"), 'media_format': 'hls',
+            'streaming_protocol': 'hls', 'segment_duration': 6, 'crf': 20, 'resolution': 'source',
+            'profile': 'balanced', 'priority': 'normal', 'preview': True, 'status': 'pending',
+        }}
+        asyncio.run(video_converter.convert_video(1, tasks, str(tmp_path)))
+        assert tasks[1]['phases']['preview']['status'] == expected
+        assert tasks[1]['phases']['full']['status'] == 'pending'
@@ -0,0 +1,62 @@
+# tests/test_profiler.py
+import asyncio
+import pstats
+import time
+import tracemalloc
+
+from services.profiler import Profiler
+
+
+def busy_handler(seconds):
+    deadline = time.monotonic() + seconds
+    total = 0
+    while time.monotonic() < deadline:
+        total += sum(range(100))
+    return total
+
+
+def test_sampling_is_limited_to_targets():
+    profiler = Profiler()
+
+    async def scenario():
+        async def load():
+            await asyncio.sleep(0.02)
+            busy_handler(0.2)
+        capture, _ = await asyncio.gather(
+            profiler.capture('sample', 0.4, interval=0.002, targets=['busy_handler']), load())
+        return capture
+
+    capture = asyncio.run(scenario())
+    collapsed = capture.artifacts['collapsed'][0].decode()
+    lines = collapsed.splitlines()
+    assert lines and all(line.startswith("[busy_handler];busy_handler (") for line in lines)
+    assert capture.summary["kept_samples"] > 0
+    assert capture.summary["untagged_samples"] > 0
+    assert capture.summary["top"]["inclusive"][0]["function"].startswith("busy_handler")
+    assert list(profiler.captures) == [capture.id]
+
+
+def test_cprofile_and_memory_artifacts(tmp_path):
+    profiler = Profiler()
+
+    async def scenario():
+        async def load():
+            await asyncio.sleep(0.01)
+            busy_handler(0.05)
+            return [bytearray(1024) for _ in range(100)]
+        capture, _ = await asyncio.gather(profiler.capture('cprofile', 0.1, memory=True), load())
+        return capture
+
+    capture = asyncio.run(scenario())
+    assert set(capture.artifacts) == {'pstats', 'tracemalloc'}
+    assert not tracemalloc.is_tracing()
+
+    stats_path = tmp_path / "profile.pstats"
+    stats_path.write_bytes(capture.artifacts['pstats'][0])
+    stats = pstats.Stats(str(stats_path))
+    assert any(name == 'busy_handler' for _, _, name in stats.stats)
+
+    snapshot_path = tmp_path / "profile.tracemalloc"
+    snapshot_path.write_bytes(capture.artifacts['tracemalloc'][0])
+    assert tracemalloc.Snapshot.load(str(snapshot_path)).traces
+    assert capture.summary["memory"]["top_growth"]
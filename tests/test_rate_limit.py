@@ -0,0 +1,88 @@
+# tests/test_rate_limit.py
+import asyncio
+import time
+
+from services.rate_limit import RateLimitMiddleware, RateLimiter, TokenBucket, classify
+
+
+def test_token_bucket_burst_then_delay():
+    bucket = TokenBucket(rate=1000, burst=500)
+    assert bucket.reserve(500) == 0.0
+    assert 0.09 < bucket.reserve(100) <= 0.1
+
+
+def test_classify_delivery_and_upload_paths():
+    assert classify("/api/v1/chunks/3", "GET") == ('delivery', 'task:3')
+    assert classify("/static/output/movie_1234/playlist_001.ts", "GET") == ('delivery', 'output:movie_1234')
+    assert classify("/api/v1/upload/", "POST") == ('upload', None)
+    assert classify("/api/v1/live/abc/ingest/segment_1.ts", "PUT") == (None, None)
+    assert classify("/api/v1/tasks/", "GET") == (None, None)
+
+
+def test_concurrency_cap_rejects_parallel_segment_requests(monkeypatch):
+    monkeypatch.setattr("services.rate_limit.DELIVERY_MAX_CONCURRENT", 2)
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'segment'})
+
+    async def scenario():
+        limiter = RateLimiter()
+        middleware = RateLimitMiddleware(slow_app, limiter)
+        statuses = []
+
+        async def request():
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            scope = {'type': 'http', 'path': '/api/v1/chunks/1', 'method': 'GET', 'client': ('10.0.0.1', 1)}
+            await middleware(scope, receive, send)
+
+        pending = [asyncio.create_task(request()) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(*pending)
+        return statuses, limiter.counters
+
+    statuses, counters = asyncio.run(scenario())
+    assert sorted(statuses) == [200, 200, 429]
+    assert counters["rejected_concurrency"] == 1
+
+
+def test_large_body_is_paced(monkeypatch):
+    monkeypatch.setattr("services.rate_limit.DELIVERY_CLIENT_BPS", 1024 * 1024)
+    monkeypatch.setattr("services.rate_limit.DELIVERY_CLIENT_BURST", 64 * 1024)
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'x' * (256 * 1024)})
+
+    async def scenario():
+        limiter = RateLimiter()
+        sent = []
+
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                sent.append(len(message['body']))
+
+        scope = {'type': 'http', 'path': '/api/v1/chunks/1', 'method': 'GET', 'client': ('10.0.0.2', 1)}
+        started = time.monotonic()
+        await RateLimitMiddleware(app, limiter)(scope, None, send)
+        return time.monotonic() - started, sent, limiter.counters
+
+    elapsed, sent, counters = asyncio.run(scenario())
+    assert sum(sent) == 256 * 1024 and len(sent) == 4
+    assert elapsed >= 0.18  # 192 KiB over the burst at 1 MiB/s
+    assert counters["throttled_requests"] == 1
+
+
+def test_limiting_is_off_by_default(test_app):
+    statuses = {test_app.get(f"/static/output/missing/segment_{i:03d}.ts").status_code for i in range(60)}
+    assert 429 not in statuses
+    assert test_app.get("/api/v1/monitoring/rate-limits").json()["enabled"] is False
@@ -0,0 +1,101 @@
+# tests/test_segment_prefetch.py
+import os
+import asyncio
+
+from services.segment_prefetch import SegmentPrefetcher
+
+
+def _write_segments(directory, count, size=100):
+    for number in range(count):
+        (directory / f"segment_{number:03d}.ts").write_bytes(bytes([number]) * size)
+
+
+def test_reads_ahead_of_playback(tmp_path):
+    _write_segments(tmp_path, 4)
+    prefetcher = SegmentPrefetcher(depth=2, memory_bytes=10_000, concurrency=2)
+
+    async def scenario():
+        prefetcher.on_segment_request("client", str(tmp_path / "segment_000.ts"))
+        # The read-ahead tasks are referenced until they finish
+        assert len(prefetcher._tasks) == 2
+        first = await prefetcher.lookup(str(tmp_path / "segment_000.ts"))
+        while prefetcher._tasks:
+            await asyncio.sleep(0.01)
+        return first, await prefetcher.lookup(str(tmp_path / "segment_001.ts"))
+
+    first, second = asyncio.run(scenario())
+    assert first is None
+    assert second == bytes([1]) * 100
+
+    stats = prefetcher.snapshot()
+    assert stats["prefetched"] == 2 and stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["useful_ratio"] == 0.5
+    assert stats["sessions"] == 1
+
+
+def test_missing_segments_and_eviction(tmp_path):
+    _write_segments(tmp_path, 3)
+    prefetcher = SegmentPrefetcher(depth=3, memory_bytes=150, concurrency=1)
+
+    async def scenario():
+        # segment_003 is not written yet; segments 1 and 2 do not fit together
+        prefetcher.on_segment_request("client", str(tmp_path / "segment_000.ts"))
+        while prefetcher._inflight:
+            await asyncio.sleep(0.01)
+        # A re-request of the same segment is not a seek, skipping ahead is
+        prefetcher.on_segment_request("client", str(tmp_path / "segment_000.ts"))
+        prefetcher.on_segment_request("client", str(tmp_path / "segment_002.ts"))
+        while prefetcher._inflight:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    stats = prefetcher.snapshot()
+    assert stats["not_ready"] >= 1
+    assert stats["wasted"] >= 1
+    assert stats["cache_bytes"] <= 150
+    assert stats["seeks"] == 1
+
+
+def test_static_paths_outside_the_directory_are_not_prefetched(tmp_path):
+    from starlette.exceptions import HTTPException
+    from app import CustomStaticFiles
+    from services.segment_prefetch import resolve_under, segment_prefetcher
+
+    static, secret = tmp_path / "static", tmp_path / "secret"
+    static.mkdir()
+    secret.mkdir()
+    _write_segments(secret, 3)
+    assert resolve_under(str(static), "../secret/segment_000.ts") is None
+    assert resolve_under(str(static), "output/a.ts") == os.path.join(os.path.realpath(static), "output", "a.ts")
+
+    files = CustomStaticFiles(directory=str(static))
+    scope = {"type": "http", "method": "GET", "headers": []}
+
+    async def scenario():
+        try:
+            await files.get_response("../secret/segment_000.ts", scope)
+        except HTTPException as e:
+            assert e.status_code == 404
+        while segment_prefetcher._inflight:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert not any(str(secret) in path for path in segment_prefetcher._cache)
+
+
+def test_rewritten_and_empty_segments_are_not_served(tmp_path):
+    _write_segments(tmp_path, 2)
+    (tmp_path / "segment_002.ts").write_bytes(b"")
+    prefetcher = SegmentPrefetcher(depth=2, memory_bytes=10_000, concurrency=2)
+
+    async def scenario():
+        prefetcher.on_segment_request("client", str(tmp_path / "segment_000.ts"))
+        while prefetcher._inflight:
+            await asyncio.sleep(0.01)
+        assert str(tmp_path / "segment_002.ts") not in prefetcher._cache
+        # A re-encode replaces segment_001 after it was read ahead
+        (tmp_path / "segment_001.ts").write_bytes(b"new" * 50)
+        return await prefetcher.lookup(str(tmp_path / "segment_001.ts"))
+
+    assert asyncio.run(scenario()) is None
+    assert prefetcher.stats["stale"] == 1 and prefetcher.stats["not_ready"] == 1
@@ -0,0 +1,148 @@
+# tests/test_storage.py
+import asyncio
+import threading
+
+from services.storage import S3Storage, SegmentPublisher, storage_key
+
+
+class FakeS3Client:
+    """In-process stand-in for the subset of the boto3 S3 client the backend uses"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[(Bucket, Key)] = (bytes(Body), ContentType)
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {'parts': {}, 'content_type': ContentType}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            self.uploads[UploadId]['parts'][PartNumber] = bytes(Body)
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        body = b''.join(upload['parts'][part['PartNumber']] for part in MultipartUpload['Parts'])
+        self.objects[(Bucket, Key)] = (body, upload['content_type'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def get_object(self, Bucket, Key):
+        class Body:
+            def __init__(self, data):
+                self.data = data
+
+            def read(self):
+                return self.data
+        return {'Body': Body(self.objects[(Bucket, Key)][0])}
+
+
+def test_multipart_upload_in_parallel_parts(tmp_path):
+    data = bytes(range(256)) * 40
+    source = tmp_path / "movie.mp4"
+    source.write_bytes(data)
+    client = FakeS3Client()
+    backend = S3Storage(bucket="media", client=client, prefix="vod", part_size=1024, concurrency=4)
+
+    assert backend.publish_file(str(source), "movie/output.mp4") == len(data)
+    body, media_type = client.objects[("media", "vod/movie/output.mp4")]
+    assert body == data and media_type == "video/mp4"
+    assert backend.stats["multipart"] == 1 and not client.uploads
+    assert backend.read("movie/output.mp4") == data
+    assert storage_key("static/output/movie/playlist.m3u8") == "movie/playlist.m3u8"
+    backend.close()
+
+
+def test_publishes_segments_while_encoding(tmp_path):
+    output_dir = tmp_path / "movie_1a2b"
+    output_dir.mkdir()
+    client = FakeS3Client()
+    backend = S3Storage(bucket="media", client=client, prefix="", part_size=1 << 20, concurrency=2)
+    publisher = SegmentPublisher(backend, str(output_dir), key_prefix="movie_1a2b", concurrency=2)
+
+    def write_playlist(count, ended=False):
+        lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:6"]
+        for number in range(count):
+            lines += ["#EXTINF:6.0,", f"playlist_{number:03d}.ts"]
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+        (output_dir / "playlist.m3u8").write_text("\n".join(lines) + "\n")
+
+    async def scenario():
+        # Segment 1 is still being written; the playlist only lists segment 0
+        (output_dir / "playlist_000.ts").write_bytes(b"a" * 10)
+        (output_dir / "playlist_001.ts").write_bytes(b"b" * 5)
+        write_playlist(1)
+        await publisher.publish_ready()
+        during = set(key for _, key in client.objects)
+
+        (output_dir / "playlist_001.ts").write_bytes(b"b" * 10)
+        write_playlist(2, ended=True)
+        await publisher.publish_ready(final=True)
+        return during
+
+    during = asyncio.run(scenario())
+    assert during == {"movie_1a2b/playlist_000.ts", "movie_1a2b/playlist.m3u8"}
+    assert client.objects[("media", "movie_1a2b/playlist_001.ts")][0] == b"b" * 10
+    assert b"#EXT-X-ENDLIST" in client.objects[("media", "movie_1a2b/playlist.m3u8")][0]
+    assert client.objects[("media", "movie_1a2b/playlist.m3u8")][1] == "application/vnd.apple.mpegurl"
+    assert publisher.stats["files"] == 4
+    backend.close()
+
+
+def test_header_only_playlist_is_not_published(tmp_path):
+    output_dir = tmp_path / "movie_3c4d"
+    output_dir.mkdir()
+    (output_dir / "playlist.m3u8").write_text("#EXTM3U\n#EXT-X-TARGETDURATION:6\n")
+    client = FakeS3Client()
+    backend = S3Storage(bucket="media", client=client, prefix="", concurrency=2)
+    publisher = SegmentPublisher(backend, str(output_dir), key_prefix="movie_3c4d", concurrency=2)
+
+    asyncio.run(publisher.publish_ready())
+    assert not client.objects
+    backend.close()
+
+
+def test_background_loop_survives_publish_errors(tmp_path):
+    output_dir = tmp_path / "movie_5e6f"
+    output_dir.mkdir()
+    client = FakeS3Client()
+    backend = S3Storage(bucket="media", client=client, prefix="", concurrency=2)
+    publisher = SegmentPublisher(backend, str(output_dir), key_prefix="movie_5e6f", concurrency=2)
+    failures = []
+
+    def flaky_scan():
+        if not failures:
+            failures.append(1)
+            raise ValueError("unreadable entry")
+        return {}
+    publisher._scan = flaky_scan
+
+    async def scenario():
+        publisher.start(interval=0.01)
+        await asyncio.sleep(0.05)
+        return await publisher.stop()
+
+    result = asyncio.run(scenario())
+    assert result["errors"] == 1 and failures
+
+
+def test_part_pool_is_recreated_after_close(tmp_path):
+    source = tmp_path / "movie.mp4"
+    source.write_bytes(b"x" * 3000)
+    client = FakeS3Client()
+    backend = S3Storage(bucket="media", client=client, prefix="", part_size=1024, concurrency=2)
+
+    backend.publish_file(str(source), "a/output.mp4")
+    backend.close()
+    # A later app lifespan in the same process still uploads
+    backend.publish_file(str(source), "b/output.mp4")
+    assert client.objects[("media", "b/output.mp4")][0] == b"x" * 3000
+    backend.close()
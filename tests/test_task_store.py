@@ -0,0 +1,191 @@
+# tests/test_task_store.py
+import os
+import asyncio
+
+from services.task_store import TaskStore
+
+
+def _store():
+    store = TaskStore()
+    for task_id in range(1, 8):
+        store[task_id] = {
+            'status': 'pending',
+            'streaming_protocol': 'hls' if task_id % 2 else 'dash',
+            'created_at': f"2025-11-21T01:00:0{task_id}Z",
+        }
+    return store
+
+
+def test_pagination_walks_all_tasks_in_order():
+    store = _store()
+    seen, cursor = [], None
+    while True:
+        items, cursor = store.query(limit=3, cursor=cursor)
+        seen.extend(task_id for task_id, _ in items)
+        if cursor is None:
+            break
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+
+def test_status_index_follows_status_updates():
+    store = _store()
+    store[2]['status'] = 'completed'
+    store[5]['status'] = 'completed'
+    items, _ = store.query(statuses=['completed'], descending=False)
+    assert [task_id for task_id, _ in items] == [2, 5]
+    assert store.status_counts() == {'pending': 5, 'completed': 2}
+
+
+def test_protocol_and_date_filters():
+    store = _store()
+    items, _ = store.query(protocol='dash', created_after="2025-11-21T01:00:03Z", descending=False)
+    assert [task_id for task_id, _ in items] == [4, 6]
+    # Offsets are normalized to UTC before comparing
+    items, _ = store.query(protocol='hls', created_before="2025-11-21T02:00:05+01:00", descending=False)
+    assert [task_id for task_id, _ in items] == [1, 3, 5]
+    store[3]['streaming_protocol'] = 'dash'
+    items, _ = store.query(statuses=['pending'], protocol='dash', descending=False)
+    assert [task_id for task_id, _ in items] == [2, 3, 4, 6]
+
+
+def test_list_tasks_rejects_invalid_timestamps(test_app):
+    response = test_app.get("/api/v1/tasks/", params={"created_after": "yesterday"})
+    assert response.status_code == 400
+    response = test_app.get("/api/v1/tasks/", params={"created_before": "2025-11-21T01:00:00+00:00"})
+    assert response.status_code == 200
+
+
+def test_list_tasks_endpoint_returns_page(test_app):
+    response = test_app.get("/api/v1/tasks/", params={"limit": 5, "fields": "task_id,status"})
+    assert response.status_code == 200
+    assert set(response.json()) == {"items", "next_cursor"}
+
+
+def _spilling_store(tmp_path):
+    store = TaskStore(hot_limit=3, spill_path=str(tmp_path / "tasks.sqlite3"), spill_after=0)
+    for task_id in range(1, 7):
+        store[task_id] = {
+            'status': 'completed' if task_id <= 4 else 'processing',
+            'streaming_protocol': 'hls',
+            'created_at': f"2025-11-21T01:00:0{task_id}Z",
+            'phases': {'preview': {'status': 'completed'}},
+            'sources': [{1: (0.0, 6.0)}],
+        }
+    # Mark the rest finished too, then add one more task to trigger a spill
+    store[5]['status'] = 'completed'
+    store[7] = {'status': 'pending', 'streaming_protocol': 'dash', 'created_at': "2025-11-21T01:00:07Z"}
+    return store
+
+
+def test_finished_tasks_spill_and_rehydrate(tmp_path):
+    store = _spilling_store(tmp_path)
+    assert store.total() == 7 and store.next_id() == 8
+    assert len(store) == len(list(store)) == len(store.items()) == 3
+    assert store.memory_stats()['hot_tasks'] == 3
+    assert store.memory_stats()['spilled_tasks'] == 4
+    assert store.status_counts() == {'completed': 5, 'processing': 1, 'pending': 1}
+
+    # Lookups bring a spilled task back, nested fields included
+    assert 1 in store
+    task = store[1]
+    assert task['phases']['preview']['status'] == 'completed'
+    # Keys and value types survive the round trip through disk
+    assert task['sources'] == [{1: (0.0, 6.0)}]
+    task['status'] = 'failed'
+    assert store.status_counts()['failed'] == 1
+    assert store.stats['rehydrated'] == 1
+    assert store.get(99) is None
+
+
+def test_pagination_merges_hot_and_spilled_tasks(tmp_path):
+    store = _spilling_store(tmp_path)
+    seen, cursor = [], None
+    while True:
+        items, cursor = store.query(limit=2, cursor=cursor)
+        seen.extend(task_id for task_id, _ in items)
+        if cursor is None:
+            break
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+    items, _ = store.query(statuses=['completed'], descending=False)
+    assert [task_id for task_id, _ in items] == [1, 2, 3, 4, 5]
+
+
+def test_running_tasks_are_never_spilled(tmp_path):
+    store = TaskStore(hot_limit=1, spill_path=str(tmp_path / "tasks.sqlite3"), spill_after=0)
+    for task_id in range(1, 4):
+        store[task_id] = {'status': 'processing', 'created_at': f"2025-11-21T01:00:0{task_id}Z"}
+    assert store.memory_stats()['spilled_tasks'] == 0
+    assert not (tmp_path / "tasks.sqlite3").exists()
+
+
+def test_records_intern_enum_values_and_keep_extra_keys():
+    store = _store()
+    status = ''.join(['pen', 'ding'])
+    store[8] = {'status': status, 'created_at': "2025-11-21T01:00:08Z", 'resumed': True}
+    assert store[8]['status'] is store[1]['status']
+    assert store[8]['resumed'] is True
+    assert 'error' not in store[8]
+    assert dict(store[8]) == {'status': 'pending', 'created_at': "2025-11-21T01:00:08Z", 'resumed': True}
+    stats = store.memory_stats()
+    assert 0 < stats['bytes_per_hot_task'] < stats['plain_dict_bytes_per_task']
+
+
+def test_lookups_of_spilled_tasks_keep_the_hot_set_bounded(tmp_path):
+    store = TaskStore(hot_limit=1, spill_path=str(tmp_path / "tasks.sqlite3"), spill_after=0)
+    for task_id in range(1, 5):
+        store[task_id] = {'status': 'completed', 'created_at': f"2025-11-21T01:00:0{task_id}Z"}
+    for task_id in (1, 2, 3, 1, 2):
+        assert store[task_id]['status'] == 'completed'
+        assert store.memory_stats()['hot_tasks'] == 1
+    assert store.memory_stats()['spilled_tasks'] == 3
+
+
+def test_default_spill_files_are_private_to_each_store(tmp_path, monkeypatch):
+    from services import task_store
+    monkeypatch.setattr(task_store, "TASK_SPILL_DIR", str(tmp_path))
+    stores = [TaskStore(hot_limit=1, spill_after=0) for _ in range(2)]
+    for store in stores:
+        for task_id in (1, 2):
+            store[task_id] = {'status': 'completed', 'created_at': f"2025-11-21T01:00:0{task_id}Z"}
+    path, other = stores[0]._spill.path, stores[1]._spill.path
+    assert path != other and os.path.basename(path).startswith(f"task_store-{os.getpid()}-")
+    assert all(store[1]['status'] == 'completed' for store in stores)
+    stores[0]._spill.remove()
+    assert not os.path.exists(path) and os.path.exists(other)
+
+
+def test_background_spill_bounds_the_hot_set(tmp_path):
+    store = TaskStore(hot_limit=100, spill_path=str(tmp_path / "tasks.sqlite3"), spill_after=60, spill_batch=200)
+    for task_id in range(1, 5001):
+        store[task_id] = {'status': 'completed', 'created_at': "2025-11-21T01:00:00Z"}
+    # Nothing is old enough to spill while inserting
+    assert len(store) == 5000
+
+    async def scenario():
+        store.spill_after = 0
+        store.start_spilling(interval=0.01)
+        while len(store) > store.hot_limit:
+            await asyncio.sleep(0.01)
+        await store.stop_spilling()
+
+    asyncio.run(scenario())
+    assert store.memory_stats()['hot_tasks'] == 100
+    assert store.memory_stats()['spilled_tasks'] == 4900 and store.total() == 5000
+    assert store[1]['status'] == 'completed'
+
+
+def test_finishing_tasks_spill_past_the_hot_limit(tmp_path):
+    store = TaskStore(hot_limit=2, spill_path=str(tmp_path / "tasks.sqlite3"), spill_after=0)
+    for task_id in range(1, 6):
+        store[task_id] = {'status': 'processing', 'created_at': f"2025-11-21T01:00:0{task_id}Z"}
+
+    async def scenario():
+        for task_id in range(1, 6):
+            store[task_id]['status'] = 'completed'
+        # Spilled right after the status changes, not inside them
+        assert store.memory_stats()['hot_tasks'] == 5
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert store.memory_stats()['hot_tasks'] == 2
+    assert store.status_counts() == {'completed': 5}
@@ -0,0 +1,56 @@
+# tests/test_tracing.py
+import asyncio
+import json
+
+from services import tracing
+from services.tracing import StageStats, TaskTrace, watch_first_segment
+
+
+def test_trace_spans_and_otel_export(tmp_path, monkeypatch):
+    export = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_EXPORT_PATH", str(export))
+
+    trace = TaskTrace(7)
+    trace.record('upload_receive', 100.0, 101.5, bytes=2048)
+    with trace.span('probe'):
+        pass
+    trace.finish('completed')
+
+    timeline = trace.to_dict()
+    assert [span["name"] for span in timeline["spans"]] == ['upload_receive', 'probe']
+    assert timeline["spans"][0]["duration_ms"] == 1500.0
+
+    otel = trace.otel_spans()
+    assert otel[0]["name"] == "task" and otel[0]["parentSpanId"] == ""
+    assert all(span["traceId"] == trace.trace_id for span in otel)
+    assert otel[1]["parentSpanId"] == otel[0]["spanId"]
+    assert otel[1]["startTimeUnixNano"] == 100_000_000_000
+
+    exported = [json.loads(line) for line in export.read_text().splitlines()]
+    assert [span["name"] for span in exported] == ['upload_receive', 'probe']
+
+
+def test_stage_percentiles():
+    stats = StageStats()
+    for ms in range(1, 101):
+        stats.add('encode', ms / 1000)
+    stats.add('probe', 0.2)
+    summary = stats.summary()
+    assert list(summary) == ['probe', 'encode']
+    assert summary['encode'] == {"count": 100, "p50_ms": 51.0, "p95_ms": 95.0}
+
+
+def test_first_segment_ignores_existing_segments(tmp_path):
+    (tmp_path / "playlist_000.ts").write_bytes(b'old')
+
+    async def scenario():
+        trace = TaskTrace(1)
+        watcher = asyncio.create_task(watch_first_segment(trace, str(tmp_path), 0.0, interval=0.01))
+        await asyncio.sleep(0.05)
+        assert not trace.spans
+        (tmp_path / "playlist_001.ts").write_bytes(b'new')
+        await asyncio.wait_for(watcher, 2)
+        return trace.spans
+
+    spans = asyncio.run(scenario())
+    assert [span["name"] for span in spans] == ['first_segment']